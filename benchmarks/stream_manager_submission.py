@@ -0,0 +1,150 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+
+Measures how StreamManagerClient.append_message throughput scales with the number of threads sharing one client.
+
+A minimal stand-in for the StreamManager server runs in a separate process and answers every append immediately,
+so the numbers reflect the client's submission path rather than the server.
+
+    python benchmarks/stream_manager_submission.py --messages 20000 --payload-size 256
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import cbor2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from greengrasssdk.stream_manager import (  # noqa: E402
+    MessageStreamDefinition,
+    StrategyOnFull,
+    StreamManagerClient,
+)
+from greengrasssdk.stream_manager.data import Operation, ResponseStatusCode, VersionInfo  # noqa: E402
+
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+STREAM_NAME = "BenchmarkStream"
+
+
+async def _read_frame(reader):
+    length = int.from_bytes(await reader.readexactly(4), "big", signed=True)
+    operation = (await reader.readexactly(1))[0]
+    return operation, cbor2.loads(await reader.readexactly(length - 1))
+
+
+def _write_frame(writer, operation, response):
+    payload = cbor2.dumps(response)
+    writer.write((len(payload) + 1).to_bytes(4, "big", signed=True) + bytes([operation.value]) + payload)
+
+
+async def _handle_connection(reader, writer):
+    connect_version = await reader.readexactly(1)
+    _, request = await _read_frame(reader)
+    writer.write(connect_version)
+    _write_frame(
+        writer,
+        Operation.ConnectResponse,
+        {
+            "requestId": request["requestId"],
+            "status": ResponseStatusCode.Success.value,
+            "protocolVersion": VersionInfo.PROTOCOL_VERSION.value,
+            "serverVersion": VersionInfo.PROTOCOL_VERSION.value,
+            "clientIdentifier": "benchmark",
+        },
+    )
+    sequence_number = 0
+    try:
+        while True:
+            operation, request = await _read_frame(reader)
+            response = {"requestId": request["requestId"], "status": ResponseStatusCode.Success.value}
+            if operation == Operation.AppendMessage.value:
+                response["sequenceNumber"] = sequence_number
+                sequence_number += 1
+                _write_frame(writer, Operation.AppendMessageResponse, response)
+            elif operation == Operation.CreateMessageStream.value:
+                _write_frame(writer, Operation.CreateMessageStreamResponse, response)
+            elif operation == Operation.DeleteMessageStream.value:
+                _write_frame(writer, Operation.DeleteMessageStreamResponse, response)
+            else:
+                _write_frame(writer, Operation.UnknownOperationError, response)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+
+def _run_server(socket_path, ready):
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(asyncio.start_unix_server(_handle_connection, socket_path))
+    ready.set()
+    loop.run_forever()
+
+
+def _run(client, thread_count, messages, payload):
+    per_thread = max(1, messages // thread_count)
+    latencies = [[] for _ in range(thread_count)]
+    start_barrier = threading.Barrier(thread_count + 1)
+
+    def produce(index):
+        thread_latencies = latencies[index]
+        start_barrier.wait()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            client.append_message(STREAM_NAME, payload)
+            thread_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    all_latencies = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    return (
+        per_thread * thread_count / elapsed,
+        statistics.median(all_latencies) * 1e6,
+        all_latencies[int(len(all_latencies) * 0.99) - 1] * 1e6,
+        cpu / elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="Messages appended per thread count")
+    parser.add_argument("--payload-size", type=int, default=256, help="Size in bytes of every message")
+    parser.add_argument("--threads", type=int, nargs="*", default=THREAD_COUNTS, help="Thread counts to run")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "stream_manager.sock")
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=_run_server, args=(socket_path, ready), daemon=True)
+    server.start()
+    ready.wait()
+
+    payload = os.urandom(args.payload_size)
+    with StreamManagerClient(socket_path=socket_path) as client:
+        client.create_message_stream(
+            MessageStreamDefinition(name=STREAM_NAME, strategy_on_full=StrategyOnFull.OverwriteOldestData)
+        )
+        print("{:>8} {:>14} {:>12} {:>12} {:>10}".format("threads", "appends/s", "p50 (us)", "p99 (us)", "cpu"))
+        for thread_count in args.threads:
+            throughput, p50, p99, cpu = _run(client, thread_count, args.messages, payload)
+            print("{:>8} {:>14.0f} {:>12.0f} {:>12.0f} {:>10.2f}".format(thread_count, throughput, p50, p99, cpu))
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
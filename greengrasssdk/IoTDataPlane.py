@@ -3,11 +3,19 @@
 #
 
 import base64
+import copy
 import json
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
 
 from greengrasssdk import Lambda
-from greengrass_common.env_vars import SHADOW_FUNCTION_ARN, ROUTER_FUNCTION_ARN, MY_FUNCTION_ARN
+from greengrasssdk.utils.logutils import LoggedPayload
+from greengrasssdk.utils.tracing import item_count, payload_size, traced
+from greengrasssdk.utils.workers import Future, completed_future, failed_future
+from greengrasssdk.utils.core import SHADOW_FUNCTION_ARN, ROUTER_FUNCTION_ARN, MY_FUNCTION_ARN
 
 # Log messages in the SDK are part of customer's log because they're helpful for debugging
 # customer's lambdas. Since we configured the root logger to log to customer's log and set the
@@ -16,15 +24,64 @@ from greengrass_common.env_vars import SHADOW_FUNCTION_ARN, ROUTER_FUNCTION_ARN,
 customer_logger = logging.getLogger(__name__)
 customer_logger.propagate = True
 
+# Number of topics whose publish client context is kept encoded
+CLIENT_CONTEXT_CACHE_SIZE = 256
+
+DEFAULT_PUBLISH_QUEUE_SIZE = 1000
+
+shadow_topic_regex = re.compile(r'^\$aws/things/([^/]+)/shadow/(.+)$')
+
 
 class ShadowError(Exception):
     pass
 
 
-class Client:
-    def __init__(self):
-        self.lambda_client = Lambda.Client()
+class PublishQueueFullError(Exception):
+    pass
 
+
+class Client:
+    def __init__(self, async_publish=False, max_publish_queue_size=DEFAULT_PUBLISH_QUEUE_SIZE, shadow_cache_ttl=None,
+                 shadow_update_window=None, lambda_client=None):
+        """
+        :param async_publish: Whether publish and publish_many return right away and leave the messages to a background
+            thread. Use flush to wait for the messages to be sent, e.g. before a handler returns.
+        :type async_publish: bool
+
+        :param max_publish_queue_size: Maximum number of messages waiting to be sent when async_publish is True.
+            Publishing to a full queue waits for room, unless queueFullPolicy is ``BestEffort``, which drops the
+            message, or ``AllOrException``, which raises :exc:`PublishQueueFullError`.
+        :type max_publish_queue_size: int
+
+        :param shadow_cache_ttl: Seconds for which get_thing_shadow returns the shadow document it last got from the
+            shadow service, kept up to date with the responses of update_thing_shadow and the shadow events given to
+            handle_shadow_event. None, the default, disables the cache.
+        :type shadow_cache_ttl: float
+
+        :param shadow_update_window: Seconds for which update_thing_shadow holds an update back, to merge the updates of
+            the same thing made in the meantime into a single one. update_thing_shadow then returns a future. None, the
+            default, sends every update right away.
+        :type shadow_update_window: float
+
+        :param lambda_client: The Lambda client to call Greengrass Core with, a new one by default.
+        :type lambda_client: Lambda.Client
+        """
+        self.lambda_client = lambda_client if lambda_client is not None else Lambda.Client()
+        # Encoded publish client contexts by topic and queue full policy, least recently used first
+        self._client_contexts = OrderedDict()
+        self._client_context_lock = threading.Lock()
+        self._publish_queue = _PublishQueue(self.lambda_client, max_publish_queue_size) if async_publish else None
+        self._shadow_cache = _ShadowCache(shadow_cache_ttl) if shadow_cache_ttl is not None else None
+        self._shadow_updates = None
+        # Reported state of every thing given to report_state, as of the reports which succeeded
+        self._reported_states = {}
+        # Number of reports in flight and last state sent of every thing given to report_state
+        self._reports_in_flight = {}
+        self._reported_state_lock = threading.Lock()
+        if shadow_update_window is not None:
+            self._shadow_updates = _ShadowUpdateCoalescer(self._shadow_op, shadow_update_window)
+
+    @traced('iot-data.get_thing_shadow', lambda **kwargs: {'target': kwargs.get('thingName')})
     def get_thing_shadow(self, **kwargs):
         r"""
         Call shadow lambda to obtain current shadow state.
@@ -42,8 +99,16 @@ class Client:
         thing_name = self._get_required_parameter('thingName', **kwargs)
         payload = b''
 
+        if self._shadow_cache is not None:
+            cached_payload = self._shadow_cache.get(thing_name)
+            if cached_payload is not None:
+                return {'payload': cached_payload}
+
         return self._shadow_op('get', thing_name, payload)
 
+    @traced('iot-data.update_thing_shadow', lambda **kwargs: {
+        'target': kwargs.get('thingName'), 'payload_size': payload_size(kwargs.get('payload'))
+    })
     def update_thing_shadow(self, **kwargs):
         r"""
         Updates the thing shadow for the specified thing.
@@ -60,12 +125,102 @@ class Client:
         The output from the UpdateThingShadow operation
             * *payload* (``bytes``) --
               The state information, in JSON format.
+
+        With shadow_update_window, the update is merged with the other updates of the thing made within the window,
+        and a ``Future`` of the output of the merged update is returned instead. Updates which specify a ``version``
+        are not merged: the held back updates of the thing are sent first, then the update itself.
         """
         thing_name = self._get_required_parameter('thingName', **kwargs)
         payload = self._get_required_parameter('payload', **kwargs)
 
+        if self._shadow_updates is not None:
+            if hasattr(payload, 'read'):
+                payload = payload.read()
+            if isinstance(payload, bytes):
+                payload = payload.decode('utf-8')
+            return self._shadow_updates.update(thing_name, json.loads(payload))
+
         return self._shadow_op('update', thing_name, payload)
 
+    def flush_shadow_updates(self, thingName=None):
+        r"""
+        Sends the updates held back by shadow_update_window right away.
+
+        :param thingName: The name of the thing, or None to send the updates of all things.
+        :type thingName: string
+
+        :returns: None
+        """
+        if self._shadow_updates is not None:
+            self._shadow_updates.flush(thingName)
+
+    @traced('iot-data.report_state', lambda thingName, state: {'target': thingName})
+    def report_state(self, thingName, state):
+        r"""
+        Reports the state of a thing, sending only what changed since the last state successfully reported by this
+        method.
+
+        Keys which were reported last time but are not in state are removed with explicit nulls. The first report
+        of a thing sends the whole state, unless the shadow cache holds the document of the thing, which is then
+        the base of the changes. Changes of a report which failed are sent again by the next report.
+
+        :param thingName: The name of the thing.
+        :type thingName: string
+
+        :param state: The reported state of the thing.
+        :type state: dict
+
+        :returns: None if nothing changed, or else the output of update_thing_shadow.
+        """
+        state = copy.deepcopy(state)
+        with self._reported_state_lock:
+            confirmed = self._get_confirmed_state(thingName)
+            changes = state if confirmed is None else _state_changes(confirmed, state)
+            in_flight = self._reports_in_flight.get(thingName)
+            if in_flight is not None:
+                # The reports in flight may still change the shadow, so also undo what the last one changes
+                changes = _union_changes(changes, _state_changes(in_flight[1], state))
+            if not changes:
+                return None
+            if in_flight is None:
+                in_flight = self._reports_in_flight[thingName] = [0, None]
+            in_flight[0] += 1
+            in_flight[1] = state
+
+        payload = json.dumps({'state': {'reported': changes}}).encode()
+        try:
+            response = self.update_thing_shadow(thingName=thingName, payload=payload)
+        except Exception:
+            self._end_report(thingName, None)
+            raise
+        if isinstance(response, Future):
+            response.add_done_callback(
+                lambda future: self._end_report(thingName, changes if future.exception() is None else None)
+            )
+        else:
+            self._end_report(thingName, changes)
+        return response
+
+    def _get_confirmed_state(self, thing_name):
+        confirmed = self._reported_states.get(thing_name)
+        if confirmed is None and self._shadow_cache is not None:
+            confirmed = self._shadow_cache.get_reported_state(thing_name)
+        return confirmed
+
+    def _end_report(self, thing_name, changes):
+        # changes is None if the report failed, the shadow then still holds the confirmed state
+        with self._reported_state_lock:
+            if changes is not None:
+                confirmed = self._get_confirmed_state(thing_name)
+                self._reported_states[thing_name] = _merge_patch(
+                    copy.deepcopy(confirmed) if confirmed is not None else {}, copy.deepcopy(changes)
+                )
+            in_flight = self._reports_in_flight[thing_name]
+            in_flight[0] -= 1
+            if in_flight[0] == 0:
+                del self._reports_in_flight[thing_name]
+
+    @traced('iot-data.delete_thing_shadow', lambda **kwargs: {'target': kwargs.get('thingName')})
     def delete_thing_shadow(self, **kwargs):
         r"""
         Deletes the thing shadow for the specified thing.
@@ -85,6 +240,52 @@ class Client:
 
         return self._shadow_op('delete', thing_name, payload)
 
+    def handle_shadow_event(self, topic, event):
+        r"""
+        Updates the shadow cache with a shadow event received by the function. Only needed with shadow_cache_ttl.
+
+        :param topic: The topic of the event, i.e. ``context.client_context.custom['subject']`` in the handler.
+        :type topic: string
+
+        :param event: The event, as given to the handler or in JSON format.
+        :type event: dict or bytes
+
+        :returns: None
+        """
+        if self._shadow_cache is None:
+            return
+        match = shadow_topic_regex.match(topic)
+        if match is None:
+            return
+        thing_name, operation = match.groups()
+        if not isinstance(event, dict):
+            event = json.loads(event.decode('utf-8') if isinstance(event, bytes) else event)
+
+        if operation == 'update/accepted':
+            self._shadow_cache.apply_update(thing_name, event)
+        elif operation == 'update/documents':
+            self._shadow_cache.store(thing_name, event.get('current', {}))
+        elif operation == 'update/delta':
+            # A delta only holds the desired values which differ from the reported ones, the rest of the update is lost
+            self._shadow_cache.invalidate_older(thing_name, event.get('version'))
+        elif operation == 'delete/accepted':
+            self._shadow_cache.invalidate(thing_name)
+
+    def invalidate_thing_shadow(self, thingName=None):
+        r"""
+        Drops the cached shadow document of a thing, so that the next get_thing_shadow calls the shadow service.
+
+        :param thingName: The name of the thing, or None to drop the documents of all things.
+        :type thingName: string
+
+        :returns: None
+        """
+        if self._shadow_cache is not None:
+            self._shadow_cache.invalidate(thingName)
+
+    @traced('iot-data.publish', lambda **kwargs: {
+        'target': kwargs.get('topic'), 'payload_size': payload_size(kwargs.get('payload', b''))
+    })
     def publish(self, **kwargs):
         r"""
         Publishes state information.
@@ -96,7 +297,8 @@ class Client:
             * *payload* (``bytes or seekable file-like object``) --
               The state information, in JSON format.
             * *queueFullPolicy* (``string``) --
-              The policy for GGC to take when its internal queue is full
+              The policy for GGC to take when its internal queue is full. With async_publish it also applies to
+              the queue of the client.
         :returns: None
         """
 
@@ -106,7 +308,80 @@ class Client:
         payload = kwargs.get('payload', b'')
         queue_full_policy = kwargs.get('queueFullPolicy', '')
 
-        function_arn = ROUTER_FUNCTION_ARN
+        client_context = self._get_publish_client_context(topic, queue_full_policy)
+
+        if customer_logger.isEnabledFor(logging.DEBUG):
+            customer_logger.debug('Publishing message on topic "%s" with Payload "%s"', topic, LoggedPayload(payload))
+        if self._publish_queue is not None:
+            self._publish_queue.put([(client_context, payload)], queue_full_policy)
+            return
+        self.lambda_client._invoke_internal(ROUTER_FUNCTION_ARN, payload, client_context, 'Event')
+
+    @traced('iot-data.publish_many', lambda messages, queueFullPolicy='': {'message_count': item_count(messages)})
+    def publish_many(self, messages, queueFullPolicy=''):
+        r"""
+        Publishes several messages, in order.
+
+        :param messages: The messages to publish.
+        :type messages: list of (``string``, ``bytes or seekable file-like object``) tuples of the topic and the payload
+
+        :param queueFullPolicy: The policy for GGC to take when its internal queue is full, for all the messages.
+        :type queueFullPolicy: string
+
+        :returns: None
+        """
+        # Resolve every client context first, so that an invalid argument does not leave a partial batch published
+        messages = [(self._get_publish_client_context(topic, queueFullPolicy), payload) for topic, payload in messages]
+
+        customer_logger.debug('Publishing %d messages', len(messages))
+        if self._publish_queue is not None:
+            self._publish_queue.put(messages, queueFullPolicy)
+            return
+        invoke = self.lambda_client._invoke_internal
+        for client_context, payload in messages:
+            invoke(ROUTER_FUNCTION_ARN, payload, client_context, 'Event')
+
+    def flush(self, timeout=None):
+        r"""
+        Waits for the messages published with async_publish to be sent.
+
+        :param timeout: Seconds to wait for, or None to wait forever.
+        :type timeout: float
+
+        :returns: (``bool``) -- Whether all the messages were sent.
+        """
+        if self._publish_queue is None:
+            return True
+        return self._publish_queue.flush(timeout)
+
+    def get_publish_statistics(self):
+        r"""
+        Returns the counters of the messages published with async_publish.
+
+        :returns: (``dict``) --
+            * *Queued* (``int``) -- Messages waiting to be sent.
+            * *Published* (``int``) -- Messages sent.
+            * *Dropped* (``int``) -- Messages dropped because the queue was full.
+            * *Failed* (``int``) -- Messages which could not be sent.
+            * *AverageLatency* (``float``) -- Average seconds from publishing a message to sending it.
+            * *MaxLatency* (``float``) -- Maximum seconds from publishing a message to sending it.
+        """
+        if self._publish_queue is None:
+            raise ValueError('Publish statistics are only kept when async_publish is enabled.')
+        return self._publish_queue.get_statistics()
+
+    def _get_publish_client_context(self, topic, queue_full_policy):
+        """
+        Return the encoded client context of publishing to topic with queue_full_policy. Client contexts of
+        recently used topics are cached, as publishers tend to publish to a small set of topics repeatedly.
+        """
+        key = (topic, queue_full_policy)
+        with self._client_context_lock:
+            client_context = self._client_contexts.get(key)
+            if client_context is not None:
+                self._client_contexts[key] = self._client_contexts.pop(key)
+                return client_context
+
         client_context = {
             'custom': {
                 'source': MY_FUNCTION_ARN,
@@ -123,13 +398,12 @@ class Client:
                 queueFullPolicy=queue_full_policy
             ))
 
-        customer_logger.debug('Publishing message on topic "{}" with Payload "{}"'.format(topic, payload))
-        self.lambda_client._invoke_internal(
-            function_arn,
-            payload,
-            base64.b64encode(json.dumps(client_context).encode()),
-            'Event'
-        )
+        client_context = base64.b64encode(json.dumps(client_context).encode())
+        with self._client_context_lock:
+            self._client_contexts[key] = client_context
+            if len(self._client_contexts) > CLIENT_CONTEXT_CACHE_SIZE:
+                self._client_contexts.popitem(last=False)
+        return client_context
 
     def _get_required_parameter(self, parameter_name, **kwargs):
         if parameter_name not in kwargs:
@@ -147,7 +421,9 @@ class Client:
             }
         }
 
-        customer_logger.debug('Calling shadow service on topic "{}" with payload "{}"'.format(topic, payload))
+        if customer_logger.isEnabledFor(logging.DEBUG):
+            customer_logger.debug('Calling shadow service on topic "%s" with payload "%s"',
+                                  topic, LoggedPayload(payload))
         response = self.lambda_client._invoke_internal(
             function_arn,
             payload,
@@ -167,4 +443,387 @@ class Client:
                     response_payload_map['code'], response_payload_map['message']
                 ))
 
+            if self._shadow_cache is not None:
+                if op == 'get':
+                    self._shadow_cache.store(thing_name, response_payload_map, payload)
+                elif op == 'update':
+                    self._shadow_cache.apply_update(thing_name, response_payload_map)
+                else:
+                    self._shadow_cache.invalidate(thing_name)
+
         return {'payload': payload}
+
+
+class _PublishQueue(object):
+    """
+    Bounded queue of messages which are sent by a background thread, in the order they were published.
+    """
+
+    def __init__(self, lambda_client, max_size):
+        if max_size < 1:
+            raise ValueError('max_publish_queue_size must be at least 1')
+        self._lambda_client = lambda_client
+        self._max_size = max_size
+        self._messages = deque()
+        self._condition = threading.Condition()
+        self._sending = 0
+        self._sender = None
+        self._published = 0
+        self._dropped = 0
+        self._failed = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def put(self, messages, queue_full_policy):
+        now = time.time()
+        with self._condition:
+            if self._sender is None or not self._sender.is_alive():
+                # Not started yet, or left behind in the parent process by a fork
+                self._sender = threading.Thread(target=self._run, name='greengrasssdk-publish')
+                self._sender.daemon = True
+                self._sender.start()
+
+            if queue_full_policy == 'AllOrException':
+                if len(self._messages) + len(messages) > self._max_size:
+                    raise PublishQueueFullError('Publish queue is full, {} of {} messages are waiting to be sent'
+                                                .format(len(self._messages), self._max_size))
+            elif queue_full_policy == 'BestEffort':
+                room = self._max_size - len(self._messages)
+                if room < len(messages):
+                    customer_logger.warning('Publish queue is full, dropping %d messages', len(messages) - room)
+                    self._dropped += len(messages) - room
+                    messages = messages[:max(room, 0)]
+            for client_context, payload in messages:
+                while len(self._messages) >= self._max_size:
+                    self._condition.wait()
+                self._messages.append((client_context, payload, now))
+            self._condition.notify_all()
+
+    def flush(self, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._messages or self._sending:
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+        return True
+
+    def get_statistics(self):
+        with self._condition:
+            return {
+                'Queued': len(self._messages) + self._sending,
+                'Published': self._published,
+                'Dropped': self._dropped,
+                'Failed': self._failed,
+                'AverageLatency': self._total_latency / self._published if self._published else 0.0,
+                'MaxLatency': self._max_latency,
+            }
+
+    def _run(self):
+        invoke = self._lambda_client._invoke_internal
+        while True:
+            with self._condition:
+                while not self._messages:
+                    self._condition.wait()
+                batch = list(self._messages)
+                self._messages.clear()
+                self._sending = len(batch)
+                # Wake up the publishers waiting for room
+                self._condition.notify_all()
+
+            published = failed = 0
+            total_latency = max_latency = 0.0
+            for client_context, payload, published_at in batch:
+                try:
+                    invoke(ROUTER_FUNCTION_ARN, payload, client_context, 'Event')
+                except Exception as e:
+                    customer_logger.exception(e)
+                    failed += 1
+                    continue
+                published += 1
+                latency = time.time() - published_at
+                total_latency += latency
+                max_latency = max(max_latency, latency)
+
+            with self._condition:
+                self._sending = 0
+                self._published += published
+                self._failed += failed
+                self._total_latency += total_latency
+                self._max_latency = max(self._max_latency, max_latency)
+                self._condition.notify_all()
+
+
+def _merge_patch(target, patch):
+    """
+    Apply a JSON merge patch (RFC 7396) to target, in place when target is a dict, and return the result.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = _merge_patch(target.get(key), value)
+    return target
+
+
+def _shadow_delta(desired, reported):
+    """
+    Return the desired values which differ from the reported ones, like the delta section of a shadow document.
+    """
+    delta = {}
+    for key, value in desired.items():
+        other = reported.get(key) if isinstance(reported, dict) else None
+        if isinstance(value, dict) and isinstance(other, dict):
+            nested = _shadow_delta(value, other)
+            if nested:
+                delta[key] = nested
+        elif value != other:
+            delta[key] = value
+    return delta
+
+
+_MISSING = object()
+
+
+def _state_changes(old, new):
+    """
+    Return the JSON merge patch which turns the state old into the state new.
+    """
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = _state_changes(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def _union_changes(first, second):
+    """
+    Return a JSON merge patch with the changes of both first and second, which lead to the same state.
+    """
+    changes = copy.deepcopy(first)
+    for key, value in second.items():
+        if isinstance(value, dict) and isinstance(changes.get(key), dict):
+            changes[key] = _union_changes(changes[key], value)
+        else:
+            changes[key] = copy.deepcopy(value)
+    return changes
+
+
+def _compose_merge_patches(first, second):
+    """
+    Return a single JSON merge patch which does what applying first then second does, or None if there is none.
+    That happens when second patches an object which first replaces or removes: a merge patch cannot
+    both remove the members of an object and add some.
+    """
+    result = dict(first)
+    for key, value in second.items():
+        previous = first.get(key, _MISSING)
+        if isinstance(value, dict) and previous is not _MISSING:
+            if not isinstance(previous, dict):
+                return None
+            value = _compose_merge_patches(previous, value)
+            if value is None:
+                return None
+        result[key] = value
+    return result
+
+
+class _PendingShadowUpdate(object):
+    __slots__ = ['patch', 'futures', 'timer']
+
+    def __init__(self, patch):
+        self.patch = patch
+        self.futures = []
+        self.timer = None
+
+
+class _ShadowUpdateCoalescer(object):
+    """
+    Holds the updates of a thing back for window seconds after the first one, and sends them as a single update.
+    """
+
+    def __init__(self, shadow_op, window):
+        self._shadow_op = shadow_op
+        self._window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Serializes the updates of every thing, so that they reach the shadow service in order
+        self._send_locks = {}
+
+    def update(self, thing_name, document):
+        if 'version' in document:
+            self.flush(thing_name)
+            try:
+                return completed_future(self._send_now(thing_name, document))
+            except Exception as e:
+                return failed_future(e)
+
+        future = Future()
+        while True:
+            with self._lock:
+                pending = self._pending.get(thing_name)
+                if pending is None:
+                    pending = self._pending[thing_name] = _PendingShadowUpdate(document)
+                    pending.futures.append(future)
+                    pending.timer = threading.Timer(self._window, self.flush, [thing_name])
+                    pending.timer.daemon = True
+                    pending.timer.start()
+                    return future
+                patch = _compose_merge_patches(pending.patch, document)
+                if patch is not None:
+                    pending.patch = patch
+                    pending.futures.append(future)
+                    return future
+            # The held back update cannot be merged with this one, send it first
+            self.flush(thing_name)
+
+    def flush(self, thing_name=None):
+        if thing_name is None:
+            with self._lock:
+                thing_names = list(self._pending)
+            for name in thing_names:
+                self.flush(name)
+            return
+
+        with self._send_lock(thing_name):
+            with self._lock:
+                pending = self._pending.pop(thing_name, None)
+            if pending is None:
+                return
+            pending.timer.cancel()
+            if len(pending.futures) > 1:
+                customer_logger.debug('Sending %d updates of the shadow of %s as one', len(pending.futures), thing_name)
+            try:
+                response = self._shadow_op('update', thing_name, json.dumps(pending.patch).encode())
+            except Exception as e:
+                for future in pending.futures:
+                    future.set_exception(e)
+            else:
+                for future in pending.futures:
+                    future.set_result(response)
+
+    def _send_now(self, thing_name, document):
+        with self._send_lock(thing_name):
+            return self._shadow_op('update', thing_name, json.dumps(document).encode())
+
+    def _send_lock(self, thing_name):
+        with self._lock:
+            lock = self._send_locks.get(thing_name)
+            if lock is None:
+                lock = self._send_locks[thing_name] = threading.Lock()
+            return lock
+
+
+class _CachedShadow(object):
+    __slots__ = ['document', 'payload', 'version', 'confirmed_at']
+
+    def __init__(self, document, payload, confirmed_at):
+        self.document = document
+        self.payload = payload
+        self.version = document.get('version')
+        self.confirmed_at = confirmed_at
+
+
+class _ShadowCache(object):
+    """
+    Shadow documents by thing, as last returned by the shadow service or updated since. A document is returned for
+    ttl seconds after the shadow service last confirmed it, and updates are only applied on top of the version they
+    follow, as an update which skips a version means another one was missed.
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._shadows = {}
+
+    def get(self, thing_name):
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is None:
+                return None
+            if time.time() - shadow.confirmed_at >= self._ttl:
+                del self._shadows[thing_name]
+                return None
+            if shadow.payload is None:
+                shadow.payload = json.dumps(shadow.document).encode()
+            return shadow.payload
+
+    def get_reported_state(self, thing_name):
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is None or time.time() - shadow.confirmed_at >= self._ttl:
+                return None
+            return copy.deepcopy(shadow.document.get('state', {}).get('reported', {}))
+
+    def store(self, thing_name, document, payload=None):
+        # The document may be the event given to a subscriber, which must not see the cache change it
+        document = copy.deepcopy(document)
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is not None and shadow.version is not None and document.get('version', 0) < shadow.version:
+                return
+            if payload is None:
+                # The documents of update events do not have a delta section
+                _set_delta(document.setdefault('state', {}))
+            self._shadows[thing_name] = _CachedShadow(document, payload, time.time())
+
+    def apply_update(self, thing_name, update):
+        version = update.get('version')
+        # Nor must the cached document share values with the update, which the caller may change later
+        update = copy.deepcopy(update)
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is None or version is None or shadow.version is None or version <= shadow.version:
+                return
+            if version != shadow.version + 1:
+                del self._shadows[thing_name]
+                return
+            document = shadow.document
+            state = _merge_patch(document.get('state'), update.get('state', {}))
+            _set_delta(state)
+            document['state'] = state
+            if 'metadata' in update:
+                document['metadata'] = _merge_patch(document.get('metadata'), update['metadata'])
+            document['version'] = version
+            if 'timestamp' in update:
+                document['timestamp'] = update['timestamp']
+            shadow.payload = None
+            shadow.version = version
+            shadow.confirmed_at = time.time()
+
+    def invalidate_older(self, thing_name, version):
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is not None and (version is None or shadow.version is None or shadow.version < version):
+                del self._shadows[thing_name]
+
+    def invalidate(self, thing_name=None):
+        with self._lock:
+            if thing_name is None:
+                self._shadows.clear()
+            else:
+                self._shadows.pop(thing_name, None)
+
+
+def _set_delta(state):
+    delta = _shadow_delta(state.get('desired') or {}, state.get('reported') or {})
+    if delta:
+        state['delta'] = delta
+    else:
+        state.pop('delta', None)
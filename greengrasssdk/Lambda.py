@@ -4,12 +4,13 @@
 
 import logging
 import re
+import threading
 
-from io import BytesIO
-
-from greengrass_common.function_arn_fields import FunctionArnFields
-from greengrass_ipc_python_sdk.ipc_client import IPCClient, IPCException
-from greengrasssdk.utils.testing import mock
+from greengrasssdk.utils.core import FunctionArnFields, IPCException, new_ipc_client
+from greengrasssdk.utils.testing import active_ipc_simulator, mock, mock_async
+from greengrasssdk.utils.logutils import LoggedPayload
+from greengrasssdk.utils.tracing import item_count, payload_size, record_request_id, traced
+from greengrasssdk.utils.workers import WorkerPool, completed_future, failed_future
 
 # Log messages in the SDK are part of customer's log because they're helpful for debugging
 # customer's lambdas. Since we configured the root logger to log to customer's log and set the
@@ -18,6 +19,9 @@ from greengrasssdk.utils.testing import mock
 customer_logger = logging.getLogger(__name__)
 customer_logger.propagate = True
 
+# Upper bound on the threads waiting for the results of asynchronous invocations of a client
+DEFAULT_MAX_WORKERS = 16
+
 valid_base64_regex = '^([A-Za-z0-9+/]{4})*([A-Za-z0-9+/]{4}|[A-Za-z0-9+/]{3}=|[A-Za-z0-9+/]{2}==)$'
 
 
@@ -26,16 +30,34 @@ class InvocationException(Exception):
 
 
 class Client:
-    def __init__(self, endpoint='localhost', port=None):
+    def __init__(self, endpoint='localhost', port=None, max_workers=DEFAULT_MAX_WORKERS):
         """
         :param endpoint: Endpoint used to connect to IPC.
         :type endpoint: str
 
         :param port: Deprecated. Will not be used.
         :type port: None
-        """
-        self.ipc = IPCClient(endpoint=endpoint)
 
+        :param max_workers: Maximum number of results of asynchronous invocations which are waited for at once.
+        :type max_workers: int
+        """
+        # Clients created while an IPCSimulator is installed use it instead of IPC
+        self._ipc = active_ipc_simulator()
+        self._endpoint = endpoint
+        self._max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def ipc(self):
+        # Created on first use, as the mocked invocations outside of a core never use it
+        if self._ipc is None:
+            with self._pool_lock:
+                if self._ipc is None:
+                    self._ipc = new_ipc_client(self._endpoint)
+        return self._ipc
+
+    @traced('lambda.invoke', lambda **kwargs: _invocation_attributes(kwargs))
     def invoke(self, **kwargs):
         r"""
         Invokes Lambda function of the given name.
@@ -70,6 +92,46 @@ class Client:
               In the event of a function error this field contains a message describing the error.
         """
 
+        # Post the work to IPC and return the result of that work
+        return self._invoke_internal(*self._get_invocation(**kwargs))
+
+    @traced('lambda.invoke_async', lambda **kwargs: _invocation_attributes(kwargs))
+    def invoke_async(self, **kwargs):
+        r"""
+        Invokes Lambda function of the given name without waiting for its result.
+
+        The invocation is posted before this returns, so that many invocations made in a row run at the same time.
+
+        :Keyword Arguments: Same as :meth:`invoke`.
+        :returns: (``Future``) --
+            Its ``result(timeout=None)`` method waits for and returns the output of :meth:`invoke`, or raises
+            :exc:`InvocationException` if the invocation failed.
+        """
+        return self._invoke_internal_async(*self._get_invocation(**kwargs))
+
+    @traced('lambda.invoke_many', lambda invocations, timeout=None: {'message_count': item_count(invocations)})
+    def invoke_many(self, invocations, timeout=None):
+        r"""
+        Invokes several Lambda functions at once and waits for all of their results.
+
+        :param invocations: The keyword arguments of :meth:`invoke` for every invocation.
+        :type invocations: list of dict
+
+        :param timeout: Seconds to wait for each result, or None to wait forever.
+        :type timeout: float
+
+        :returns: (``list``) --
+            The output of :meth:`invoke` of every invocation, in order. If any invocation failed, the
+            :exc:`InvocationException` of the first one which failed is raised once all of them completed.
+        """
+        # Validate everything before posting anything, so that a bad argument does not leave invocations behind
+        arguments = [self._get_invocation(**kwargs) for kwargs in invocations]
+        futures = [self._invoke_internal_async(*args) for args in arguments]
+        for future in futures:
+            future.exception(timeout)
+        return [future.result() for future in futures]
+
+    def _get_invocation(self, **kwargs):
         # FunctionName is a required parameter
         if 'FunctionName' not in kwargs:
             raise ValueError(
@@ -112,11 +174,11 @@ class Client:
         # Payload is an optional parameter
         payload = kwargs.get('Payload', b'')
         invocation_type = kwargs.get('InvocationType', 'RequestResponse')
-        customer_logger.debug('Invoking local lambda "{}" with payload "{}" and client context "{}"'.format(
-            function_arn, payload, client_context))
+        if customer_logger.isEnabledFor(logging.DEBUG):
+            customer_logger.debug('Invoking local lambda "%s" with payload "%s" and client context "%s"',
+                                  function_arn, LoggedPayload(payload), LoggedPayload(client_context))
 
-        # Post the work to IPC and return the result of that work
-        return self._invoke_internal(function_arn, payload, client_context, invocation_type)
+        return function_arn, payload, client_context, invocation_type
 
     @mock
     def _invoke_internal(self, function_arn, payload, client_context, invocation_type="RequestResponse"):
@@ -125,47 +187,175 @@ class Client:
         give this Lambda client a raw payload/client context to invoke with, rather than having it built for them.
         This lets you include custom ExtensionMap_ values like subject which are needed for our internal pinned Lambdas.
         """
-        customer_logger.debug('Invoking Lambda function "{}" with Greengrass Message "{}"'.format(function_arn, payload))
+        if customer_logger.isEnabledFor(logging.DEBUG):
+            customer_logger.debug('Invoking Lambda function "%s" with Greengrass Message "%s"',
+                                  function_arn, LoggedPayload(payload))
 
         try:
             invocation_id = self.ipc.post_work(function_arn, payload, client_context, invocation_type)
+            record_request_id(invocation_id)
 
             if invocation_type == "Event":
                 # TODO: Properly return errors based on BOTO response
                 # https://boto3.readthedocs.io/en/latest/reference/services/lambda.html#Lambda.Client.invoke
                 return {'Payload': b'', 'FunctionError': ''}
 
-            work_result_output = self.ipc.get_work_result(function_arn, invocation_id)
-            if not work_result_output.func_err:
-                output_payload = StreamingBody(work_result_output.payload)
-            else:
-                output_payload = work_result_output.payload
-            invoke_output = {
-                'Payload': output_payload,
-                'FunctionError': work_result_output.func_err,
-            }
-            return invoke_output
+            return self._get_work_result(function_arn, invocation_id)
         except IPCException as e:
             customer_logger.exception(e)
             raise InvocationException('Failed to invoke function due to ' + str(e))
 
+    @mock_async
+    def _invoke_internal_async(self, function_arn, payload, client_context, invocation_type="RequestResponse"):
+        """
+        Posts the work right away and waits for its result on the worker pool of this client.
+        """
+        if customer_logger.isEnabledFor(logging.DEBUG):
+            customer_logger.debug('Invoking Lambda function "%s" asynchronously with Greengrass Message "%s"',
+                                  function_arn, LoggedPayload(payload))
+
+        try:
+            invocation_id = self.ipc.post_work(function_arn, payload, client_context, invocation_type)
+        except IPCException as e:
+            customer_logger.exception(e)
+            return failed_future(InvocationException('Failed to invoke function due to ' + str(e)))
+        record_request_id(invocation_id)
+
+        if invocation_type == "Event":
+            return completed_future({'Payload': b'', 'FunctionError': ''})
+
+        return self._get_pool().submit(self._wait_for_work_result, function_arn, invocation_id)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = WorkerPool(self._max_workers, name='greengrasssdk-lambda')
+            return self._pool
+
+    def _wait_for_work_result(self, function_arn, invocation_id):
+        try:
+            return self._get_work_result(function_arn, invocation_id)
+        except IPCException as e:
+            customer_logger.exception(e)
+            raise InvocationException('Failed to invoke function due to ' + str(e))
+
+    def _get_work_result(self, function_arn, invocation_id):
+        work_result_output = self.ipc.get_work_result(function_arn, invocation_id)
+        if not work_result_output.func_err:
+            output_payload = StreamingBody(work_result_output.payload)
+        else:
+            output_payload = work_result_output.payload
+        invoke_output = {
+            'Payload': output_payload,
+            'FunctionError': work_result_output.func_err,
+        }
+        return invoke_output
+
+
+def _invocation_attributes(kwargs):
+    return {'target': kwargs.get('FunctionName'), 'payload_size': payload_size(kwargs.get('Payload', b''))}
+
 
 class StreamingBody(object):
     """Wrapper class for http response payload
 
-    This provides a consistent interface to AWS Lambda Python SDK
+    This provides a consistent interface to AWS Lambda Python SDK. The payload is not copied: reading all of it at
+    once returns the payload itself, and :meth:`readinto` and :meth:`iter_chunks` consume it piece by piece.
     """
+    _DEFAULT_CHUNK_SIZE = 1024
+
     def __init__(self, payload):
-        self._raw_stream = BytesIO(payload)
+        self._payload = payload
+        self._raw_stream = memoryview(payload)
         self._amount_read = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        """Return an iterator to yield 1k chunks from the raw stream.
+        """
+        return self.iter_chunks(self._DEFAULT_CHUNK_SIZE)
 
     def read(self, amt=None):
         """Read at most amt bytes from the stream.
         If the amt argument is omitted, read all data.
         """
-        chunk = self._raw_stream.read(amt)
-        self._amount_read += len(chunk)
-        return chunk
+        self._check_closed()
+        start = self._amount_read
+        end = len(self._raw_stream)
+        if amt is not None and amt >= 0:
+            end = min(end, start + amt)
+        self._amount_read = end
+        if start == 0 and end == len(self._raw_stream) and isinstance(self._payload, bytes):
+            return self._payload
+        return self._raw_stream[start:end].tobytes()
+
+    def readinto(self, b):
+        """Read bytes into the pre-allocated, writable buffer b.
+        Return the number of bytes read, 0 once all data has been read.
+        """
+        self._check_closed()
+        target = memoryview(b)
+        start = self._amount_read
+        end = min(len(self._raw_stream), start + len(target))
+        target[:end - start] = self._raw_stream[start:end]
+        self._amount_read = end
+        return end - start
+
+    def iter_chunks(self, chunk_size=_DEFAULT_CHUNK_SIZE):
+        """Return an iterator to yield chunks of chunk_size bytes from the raw stream.
+        """
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def iter_lines(self, chunk_size=_DEFAULT_CHUNK_SIZE, keepends=False):
+        """Return an iterator to yield lines from the raw stream.
+        Lines end at a newline, a carriage return or both, like with bytes.splitlines, and line endings are removed
+        unless keepends is True. A payload which cannot be searched directly is searched chunk_size bytes at a time.
+        """
+        self._check_closed()
+        end = len(self._raw_stream)
+        # Next line feed and carriage return, or end if there is none, each searched again once it was passed
+        newline = carriage_return = -1
+        while self._amount_read < end:
+            start = self._amount_read
+            if newline < start:
+                newline = self._find(b'\n', start, chunk_size)
+            if carriage_return < start:
+                carriage_return = self._find(b'\r', start, chunk_size)
+            line_end = min(newline, carriage_return)
+            if line_end == end:
+                self._amount_read = end
+            elif carriage_return + 1 == newline:
+                self._amount_read = newline + 1
+            else:
+                self._amount_read = line_end + 1
+            yield self._raw_stream[start:self._amount_read if keepends else line_end].tobytes()
+
+    def _find(self, sub, start, chunk_size):
+        end = len(self._raw_stream)
+        if hasattr(self._payload, 'find'):
+            found = self._payload.find(sub, start)
+            return found if found >= 0 else end
+        # A payload without find, such as a memoryview, is searched a chunk at a time
+        while start < end:
+            found = self._raw_stream[start:start + chunk_size].tobytes().find(sub)
+            if found >= 0:
+                return start + found
+            start += chunk_size
+        return end
 
     def close(self):
-        self._raw_stream.close()
+        self._closed = True
+
+    def _check_closed(self):
+        if self._closed:
+            raise ValueError('I/O operation on closed file.')
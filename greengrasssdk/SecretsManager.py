@@ -5,10 +5,14 @@
 from __future__ import division
 import json
 import logging
+import threading
+import time
 from datetime import datetime
 
 from greengrasssdk import Lambda
-from greengrass_common.env_vars import MY_FUNCTION_ARN, SECRETS_MANAGER_FUNCTION_ARN
+from greengrasssdk.utils.tracing import item_count, traced
+from greengrasssdk.utils.workers import Future
+from greengrasssdk.utils.core import MY_FUNCTION_ARN, SECRETS_MANAGER_FUNCTION_ARN
 
 # Log messages in the SDK are part of customer's log because they're helpful for debugging
 # customer's lambdas. Since we configured the root logger to log to customer's log and set the
@@ -24,6 +28,10 @@ KEY_NAME_SECRET_ID = 'SecretId'
 KEY_NAME_VERSION_ID = 'VersionId'
 KEY_NAME_VERSION_STAGE = 'VersionStage'
 KEY_NAME_CREATED_DATE = "CreatedDate"
+KEY_NAME_SECRET_STRING = 'SecretString'
+
+# Fraction of the cache TTL after which reading a cached secret refreshes it in the background
+DEFAULT_REFRESH_AHEAD = 0.8
 
 
 class SecretsManagerError(Exception):
@@ -31,9 +39,26 @@ class SecretsManagerError(Exception):
 
 
 class Client:
-    def __init__(self):
-        self.lambda_client = Lambda.Client()
+    def __init__(self, secret_cache_ttl=None, refresh_ahead=DEFAULT_REFRESH_AHEAD, lambda_client=None):
+        """
+        :param secret_cache_ttl: Seconds for which get_secret_value returns a secret value it already retrieved.
+            Concurrent requests for a secret which is not cached retrieve it once. None, the default, disables the
+            cache.
+        :type secret_cache_ttl: float
 
+        :param refresh_ahead: Fraction of secret_cache_ttl after which reading a cached secret retrieves it again in
+            the background, so that secrets which are in use do not expire.
+        :type refresh_ahead: float
+
+        :param lambda_client: The Lambda client to call Greengrass Core with, a new one by default.
+        :type lambda_client: Lambda.Client
+        """
+        self.lambda_client = lambda_client if lambda_client is not None else Lambda.Client()
+        self._secret_cache = None
+        if secret_cache_ttl is not None:
+            self._secret_cache = _SecretCache(self._fetch_secret_value, secret_cache_ttl, refresh_ahead)
+
+    @traced('secretsmanager.get_secret_value', lambda **kwargs: {'target': kwargs.get(KEY_NAME_SECRET_ID)})
     def get_secret_value(self, **kwargs):
         r"""
         Call secrets manager lambda to obtain the requested secret value.
@@ -95,6 +120,112 @@ class Client:
               The date and time that this version of the secret was created.
         """
 
+        secret_id, version_stage = self._get_secret_key(**kwargs)
+
+        if self._secret_cache is not None:
+            # Copied so that callers can not change the cached value
+            return dict(self._secret_cache.get(secret_id, version_stage).value)
+        return self._fetch_secret_value(secret_id, version_stage)
+
+    @traced('secretsmanager.get_secret_json', lambda **kwargs: {'target': kwargs.get(KEY_NAME_SECRET_ID)})
+    def get_secret_json(self, **kwargs):
+        r"""
+        Call secrets manager lambda to obtain the requested secret value, and parse its ``SecretString``.
+        With secret_cache_ttl, the parsed value is cached along with the secret value.
+
+        :Keyword Arguments: Same as :meth:`get_secret_value`.
+
+        :returns: The ``SecretString`` of the secret, parsed from JSON. It must not be modified when it is cached.
+        """
+        secret_id, version_stage = self._get_secret_key(**kwargs)
+
+        if self._secret_cache is None:
+            return self._parse_secret_string(self._fetch_secret_value(secret_id, version_stage))
+
+        secret = self._secret_cache.get(secret_id, version_stage)
+        if secret.parsed is None:
+            secret.parsed = self._parse_secret_string(secret.value)
+        return secret.parsed
+
+    @traced('secretsmanager.get_secret_values', lambda SecretIdList, VersionStage='': {
+        'message_count': item_count(SecretIdList)
+    })
+    def get_secret_values(self, SecretIdList, VersionStage=''):
+        r"""
+        Call secrets manager lambda to obtain the values of several secrets at once. The requests for all the secrets
+        are made before waiting for any of them.
+
+        :param SecretIdList: The ARNs or friendly names of the secrets.
+        :type SecretIdList: list of string
+
+        :param VersionStage: The staging label of the versions to retrieve, see :meth:`get_secret_value`.
+        :type VersionStage: string
+
+        :returns: (``dict``) --
+            * *SecretValues* (``list``) --
+              The output of :meth:`get_secret_value` for every secret which was retrieved, in the order of SecretIdList.
+            * *Errors* (``list``) --
+              The secrets which could not be retrieved.
+              * (``dict``) --
+                * *SecretId* (``string``) -- The secret.
+                * *ErrorCode* (``string``) -- The type of the error.
+                * *Message* (``string``) -- The description of the error.
+        """
+        secret_ids = []
+        for secret_id in SecretIdList:
+            if secret_id not in secret_ids:
+                secret_ids.append(secret_id)
+
+        values = {}
+        futures = []
+        for secret_id in secret_ids:
+            if self._secret_cache is not None:
+                secret = self._secret_cache.peek(secret_id, VersionStage)
+                if secret is not None:
+                    values[secret_id] = dict(secret.value)
+                    continue
+            request_payload_bytes = self._generate_request_payload_bytes(secret_id=secret_id,
+                                                                         version_id='',
+                                                                         version_stage=VersionStage)
+            futures.append((secret_id, time.time(), self.lambda_client._invoke_internal_async(
+                SECRETS_MANAGER_FUNCTION_ARN,
+                request_payload_bytes,
+                b'',
+            )))
+        customer_logger.debug('Retrieving %d secret values, %d of them from the cache',
+                              len(secret_ids), len(secret_ids) - len(futures))
+
+        errors = []
+        for secret_id, requested_at, future in futures:
+            try:
+                value = self._parse_secret_response(future.result())
+            except Exception as e:
+                customer_logger.debug('Failed to retrieve secret value with id "%s": %s', secret_id, e)
+                errors.append({'SecretId': secret_id, 'ErrorCode': type(e).__name__, 'Message': str(e)})
+                continue
+            if self._secret_cache is not None:
+                self._secret_cache.put(secret_id, VersionStage, value, requested_at)
+                value = dict(value)
+            values[secret_id] = value
+
+        return {
+            'SecretValues': [values[secret_id] for secret_id in secret_ids if secret_id in values],
+            'Errors': errors,
+        }
+
+    def invalidate_secret_cache(self, SecretId=None):
+        r"""
+        Drops cached secret values, e.g. after a secret was rotated.
+
+        :param SecretId: The secret whose values are dropped, or None to drop all the cached values.
+        :type SecretId: string
+
+        :returns: None
+        """
+        if self._secret_cache is not None:
+            self._secret_cache.invalidate(SecretId)
+
+    def _get_secret_key(self, **kwargs):
         secret_id = self._get_required_parameter(KEY_NAME_SECRET_ID, **kwargs)
         version_id = kwargs.get(KEY_NAME_VERSION_ID, '')
         version_stage = kwargs.get(KEY_NAME_VERSION_STAGE, '')
@@ -104,18 +235,34 @@ class Client:
         if version_id and version_stage:
             raise ValueError('VersionId and VersionStage cannot both be specified at the same time')
 
+        return secret_id, version_stage
+
+    @staticmethod
+    def _parse_secret_string(secret_value):
+        if KEY_NAME_SECRET_STRING not in secret_value:
+            raise SecretsManagerError('Secret {} has no {}'.format(
+                secret_value.get(KEY_NAME_SECRET_ID, ''), KEY_NAME_SECRET_STRING
+            ))
+        return json.loads(secret_value[KEY_NAME_SECRET_STRING])
+
+    def _fetch_secret_value(self, secret_id, version_stage):
+        version_id = ''
         request_payload_bytes = self._generate_request_payload_bytes(secret_id=secret_id,
                                                                      version_id=version_id,
                                                                      version_stage=version_stage)
 
-        customer_logger.debug('Retrieving secret value with id "{}", version id "{}"  version stage "{}"'
-                              .format(secret_id, version_id, version_stage))
+        customer_logger.debug('Retrieving secret value with id "%s", version id "%s"  version stage "%s"',
+                              secret_id, version_id, version_stage)
         response = self.lambda_client._invoke_internal(
             SECRETS_MANAGER_FUNCTION_ARN,
             request_payload_bytes,
             b'',  # We do not need client context for Secrets Manager back-end lambda
         )  # Use Request/Response here as we are mimicking boto3 Http APIs for SecretsManagerService
 
+        return self._parse_secret_response(response)
+
+    @staticmethod
+    def _parse_secret_response(response):
         payload = response[KEY_NAME_PAYLOAD].read()
         payload_dict = json.loads(payload.decode('utf-8'))
 
@@ -158,3 +305,93 @@ class Client:
                 parameter_name=parameter_name
             ))
         return kwargs[parameter_name]
+
+
+class _CachedSecret(object):
+    __slots__ = ['value', 'fetched_at', 'parsed', 'refreshing']
+
+    def __init__(self, value, fetched_at):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.parsed = None
+        self.refreshing = False
+
+
+class _SecretCache(object):
+    """
+    Secret values by secret id and version stage. A secret which is read after refresh_ahead of its ttl is retrieved
+    again in the background, and a secret which is not cached is retrieved once for all the threads asking for it.
+    """
+
+    def __init__(self, fetch, ttl, refresh_ahead):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._refresh_after = ttl * refresh_ahead
+        self._lock = threading.Lock()
+        self._secrets = {}
+        self._fetching = {}
+
+    def get(self, secret_id, version_stage):
+        key = (secret_id, version_stage)
+        now = time.time()
+        with self._lock:
+            secret = self._secrets.get(key)
+            if secret is not None and now - secret.fetched_at < self._ttl:
+                if not secret.refreshing and now - secret.fetched_at >= self._refresh_after:
+                    secret.refreshing = True
+                    refresh = threading.Thread(target=self._refresh, args=(key, secret), name='greengrasssdk-secrets')
+                    refresh.daemon = True
+                    refresh.start()
+                return secret
+            future = self._fetching.get(key)
+            fetch = future is None
+            if fetch:
+                future = self._fetching[key] = Future()
+
+        if not fetch:
+            return future.result()
+        try:
+            secret = _CachedSecret(self._fetch(secret_id, version_stage), now)
+        except Exception as e:
+            with self._lock:
+                del self._fetching[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._fetching[key]
+            self._secrets[key] = secret
+        future.set_result(secret)
+        return secret
+
+    def peek(self, secret_id, version_stage):
+        """
+        Return the cached secret if it has not expired, without retrieving it otherwise.
+        """
+        with self._lock:
+            secret = self._secrets.get((secret_id, version_stage))
+            if secret is None or time.time() - secret.fetched_at >= self._ttl:
+                return None
+        return self.get(secret_id, version_stage)
+
+    def put(self, secret_id, version_stage, value, fetched_at):
+        with self._lock:
+            self._secrets[(secret_id, version_stage)] = _CachedSecret(value, fetched_at)
+
+    def invalidate(self, secret_id=None):
+        with self._lock:
+            for key in list(self._secrets):
+                if secret_id is None or key[0] == secret_id:
+                    del self._secrets[key]
+
+    def _refresh(self, key, secret):
+        now = time.time()
+        try:
+            value = self._fetch(*key)
+        except Exception as e:
+            # The cached value is still used until it expires, the next read tries again
+            customer_logger.warning('Failed to refresh secret value with id "%s": %s', key[0], e)
+            secret.refreshing = False
+            return
+        with self._lock:
+            if self._secrets.get(key) is secret:
+                self._secrets[key] = _CachedSecret(value, now)
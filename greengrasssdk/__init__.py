@@ -2,13 +2,9 @@
 # Copyright 2010-2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 #
 
-from .client import client
-# .Lambda imports greengrass_common, which only applies within Greengrass Core.
-# Try-except as below to make sure the SDK is able to be imported outside of Greengrass Core
-try:
-    from .Lambda import StreamingBody
-except:
-    pass
+from .client import client, close_shared_clients, release_client
+# .Lambda falls back on stand-ins of the Greengrass Core packages, so the SDK can be imported outside of a core
+from .Lambda import StreamingBody
 
 __version__ = '1.6.1'
 INTERFACE_VERSION = '1.5'
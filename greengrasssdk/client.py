@@ -2,8 +2,84 @@
 # Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 #
 
+import os
+import threading
+
+# Clients created with shared=True, by process id, client type and arguments
+_shared_clients = {}
+_shared_clients_lock = threading.RLock()
+# Locks of the shared clients being created, by key, so that only the callers which want the same client wait for it
+_creation_locks = {}
+
 
 def client(client_type, *args, **kwargs):
+    """
+    Create a client of the given type with the given arguments.
+
+    With ``shared=True``, the client is created once per process for the type and arguments, and later calls return
+    the same thread-safe client. Shared ``iot-data`` and ``secretsmanager`` clients also share the IPC client of the
+    shared ``lambda`` client. The arguments of shared clients must be hashable. Use :func:`release_client` or
+    :func:`close_shared_clients` to close them.
+    """
+    shared = kwargs.pop('shared', False)
+    if not shared:
+        return _create_client(client_type, *args, **kwargs)
+
+    key = (os.getpid(), client_type, args, tuple(sorted(kwargs.items())))
+    with _shared_clients_lock:
+        instance = _get_shared_client(key)
+        if instance is not None:
+            return instance
+        creation_lock = _creation_locks.setdefault(key, threading.Lock())
+
+    # Creating a client may take long, e.g. to connect to StreamManager, so it is not done under the global lock
+    with creation_lock:
+        with _shared_clients_lock:
+            instance = _get_shared_client(key)
+            if instance is not None:
+                return instance
+        if client_type in ('iot-data', 'secretsmanager') and 'lambda_client' not in kwargs:
+            kwargs['lambda_client'] = client('lambda', shared=True)
+        instance = _create_client(client_type, *args, **kwargs)
+        with _shared_clients_lock:
+            _shared_clients[key] = instance
+            # The callers waiting for the lock find the client once they get it
+            _creation_locks.pop(key, None)
+        return instance
+
+
+def _get_shared_client(key):
+    instance = _shared_clients.get(key)
+    if instance is None or getattr(instance, 'closed', False):
+        return None
+    return instance
+
+
+def release_client(instance):
+    """
+    Remove a client created with ``shared=True`` from the shared clients and close it if it can be closed.
+    """
+    with _shared_clients_lock:
+        for key, shared_instance in list(_shared_clients.items()):
+            if shared_instance is instance:
+                del _shared_clients[key]
+    if hasattr(instance, 'close'):
+        instance.close()
+
+
+def close_shared_clients():
+    """
+    Close all the clients created with ``shared=True`` by this process, and forget them.
+    """
+    with _shared_clients_lock:
+        instances = [instance for key, instance in _shared_clients.items() if key[0] == os.getpid()]
+        _shared_clients.clear()
+    for instance in instances:
+        if hasattr(instance, 'close'):
+            instance.close()
+
+
+def _create_client(client_type, *args, **kwargs):
     if client_type == 'lambda':
         from .Lambda import Client
     elif client_type == 'iot-data':
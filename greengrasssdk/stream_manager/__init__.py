@@ -9,6 +9,11 @@ SPDX-License-Identifier: Apache-2.0
 from .streammanagerclient import StreamManagerClient, SDK_VERSION
 from .exceptions import *
 from .util import Util
+from .messagebatch import MessageBatch, DecodedBatch
+from .codecs import Codec, CborCodec, JsonCodec, StructCodec
+from .timeseries import TimeSeriesBlock, TimeSeriesCodec, TimeSeriesWriter, decode_blocks, concatenate_blocks
+from .checkpoint import CheckpointStore, StreamConsumer
+from .dispatcher import StreamDispatcher
 from .data import (
     ReadMessagesOptions,
     MessageStreamDefinition,
@@ -0,0 +1,355 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import mmap
+import os
+import struct
+import time
+import zlib
+from threading import Lock, Timer
+from typing import Dict, Iterator, Optional, Tuple
+
+from .data import Message, ReadMessagesOptions
+from .exceptions import ClientException, NotEnoughMessagesException, ValidationException
+from .messagebatch import MessageBatch
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+"""
+Checkpoint file layout: a header followed by fixed size slots, one per (consumer, stream) pair.
+
+Every slot holds its key and two entries of (generation, sequence number, checksum). An update overwrites the
+entry with the older generation, so the other entry is intact if the update is torn by a crash, and the entry
+with the newest valid generation is the checkpoint.
+"""
+
+_CHECKPOINT_MAGIC = b"GGCK"
+_CHECKPOINT_VERSION = 1
+_HEADER = struct.Struct(">4sB3xI4x")
+_KEY_LENGTH = struct.Struct(">H")
+_ENTRY = struct.Struct(">QqI4x")
+
+_SLOT_SIZE = 512
+_MAX_KEY_SIZE = _SLOT_SIZE - _KEY_LENGTH.size - 2 * _ENTRY.size - 16
+_ENTRIES_OFFSET = _KEY_LENGTH.size + _MAX_KEY_SIZE
+_INITIAL_SLOTS = 16
+
+# Seconds to wait before reading again after an empty read which did not wait for messages itself
+EMPTY_READ_BACKOFF = 1.0
+
+
+class CheckpointStore:
+    """
+    Stores the sequence number of the last message which every consumer processed in every stream, in a small
+    memory-mapped file, so that consumers resume where they were after a restart instead of reading their streams
+    again from the start.
+
+    Updates are written to the mapped file as they are made, which is cheap, and committed to disk with an fsync
+    once commit_count updates were made or commit_interval seconds after the first uncommitted update, whichever
+    comes first. After a crash consumers resume from the last commit, so they may process up to a batch of
+    messages again.
+
+    :param path: Path of the checkpoint file, which is created if it does not exist.
+    :param commit_count: Number of updates after which they are committed. Default is 100.
+    :param commit_interval: Seconds after which updates are committed. Default is 1 second.
+
+    :raises: :exc:`~.exceptions.ClientException` if the file is not a checkpoint file or is used by another process.
+
+    A store can be used by many threads at once, but a checkpoint file by one process only.
+    """
+
+    def __init__(self, path: str, commit_count: int = 100, commit_interval: float = 1.0):
+        if commit_count < 1:
+            raise ValidationException("commit_count must be at least 1")
+        if commit_interval <= 0:
+            raise ValidationException("commit_interval must be greater than 0")
+        self.path = path
+        self.commit_count = commit_count
+        self.commit_interval = commit_interval
+        self.__lock = Lock()
+        # Slot index, generation and checksum of the key of every (consumer, stream) pair
+        self.__slots = {}  # type: Dict[Tuple[str, str], list]
+        self.__used_slots = 0
+        self.__checkpoints = {}  # type: Dict[Tuple[str, str], int]
+        self.__pending = 0
+        self.__timer = None
+        self.__closed = False
+        self.__map = None
+
+        self.__fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self.__fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise ClientException("Checkpoint file {} is used by another process".format(path))
+            if os.fstat(self.__fd).st_size == 0:
+                self.__resize(_INITIAL_SLOTS)
+                self.__map.flush()
+                os.fsync(self.__fd)
+            else:
+                self.__map = mmap.mmap(self.__fd, os.fstat(self.__fd).st_size)
+                self.__load()
+        except BaseException:
+            os.close(self.__fd)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @property
+    def __slot_count(self) -> int:
+        return (len(self.__map) - _HEADER.size) // _SLOT_SIZE
+
+    def __resize(self, slot_count: int):
+        if self.__map is not None:
+            self.__map.close()
+        os.ftruncate(self.__fd, _HEADER.size + slot_count * _SLOT_SIZE)
+        self.__map = mmap.mmap(self.__fd, _HEADER.size + slot_count * _SLOT_SIZE)
+        _HEADER.pack_into(self.__map, 0, _CHECKPOINT_MAGIC, _CHECKPOINT_VERSION, slot_count)
+
+    def __load(self):
+        if len(self.__map) < _HEADER.size:
+            raise ClientException("{} is not a checkpoint file".format(self.path))
+        magic, version, slot_count = _HEADER.unpack_from(self.__map, 0)
+        if magic != _CHECKPOINT_MAGIC or version != _CHECKPOINT_VERSION:
+            raise ClientException("{} is not a checkpoint file".format(self.path))
+        # The file may have been extended without its header being updated before a crash
+        for index in range(min(slot_count, self.__slot_count)):
+            offset = _HEADER.size + index * _SLOT_SIZE
+            (key_length,) = _KEY_LENGTH.unpack_from(self.__map, offset)
+            if key_length == 0 or key_length > _MAX_KEY_SIZE:
+                continue
+            self.__used_slots = index + 1
+            key_bytes = bytes(self.__map[offset + _KEY_LENGTH.size : offset + _KEY_LENGTH.size + key_length])
+            key_checksum = zlib.crc32(key_bytes)
+            newest = None
+            for entry in range(2):
+                generation, sequence_number, checksum = _ENTRY.unpack_from(
+                    self.__map, offset + _ENTRIES_OFFSET + entry * _ENTRY.size
+                )
+                if checksum != self.__entry_checksum(key_checksum, generation, sequence_number):
+                    continue
+                if newest is None or generation > newest[0]:
+                    newest = (generation, sequence_number)
+            if newest is None:
+                continue
+            consumer, _, stream_name = key_bytes.decode("utf-8").partition("\0")
+            key = (consumer, stream_name)
+            self.__slots[key] = [index, newest[0], key_checksum]
+            self.__checkpoints[key] = newest[1]
+
+    @staticmethod
+    def __entry_checksum(key_checksum: int, generation: int, sequence_number: int) -> int:
+        return zlib.crc32(struct.pack(">Qq", generation, sequence_number), key_checksum)
+
+    def __new_slot(self, key: Tuple[str, str]) -> list:
+        if "\0" in key[0]:
+            raise ValidationException("Consumer name must not contain NUL characters")
+        key_bytes = "\0".join(key).encode("utf-8")
+        if len(key_bytes) > _MAX_KEY_SIZE:
+            raise ValidationException(
+                "Consumer and stream names must be at most {} bytes long together".format(_MAX_KEY_SIZE)
+            )
+        index = self.__used_slots
+        if index >= self.__slot_count:
+            self.__resize(self.__slot_count * 2)
+        offset = _HEADER.size + index * _SLOT_SIZE
+        self.__map[offset : offset + _SLOT_SIZE] = bytes(_SLOT_SIZE)
+        _KEY_LENGTH.pack_into(self.__map, offset, len(key_bytes))
+        self.__map[offset + _KEY_LENGTH.size : offset + _KEY_LENGTH.size + len(key_bytes)] = key_bytes
+        self.__used_slots += 1
+        slot = self.__slots[key] = [index, 0, zlib.crc32(key_bytes)]
+        return slot
+
+    def __check_closed(self):
+        if self.__closed:
+            raise ClientException("Checkpoint store is closed")
+
+    def get(self, consumer: str, stream_name: str) -> Optional[int]:
+        """
+        :return: The sequence number of the last message which the consumer processed in the stream, or None if
+            there is no checkpoint.
+        """
+        return self.__checkpoints.get((consumer, stream_name))
+
+    def update(self, consumer: str, stream_name: str, sequence_number: int) -> None:
+        """
+        Record that the consumer processed the messages of the stream up to sequence_number. The update is
+        committed with the next batch.
+        """
+        key = (consumer, stream_name)
+        with self.__lock:
+            self.__check_closed()
+            slot = self.__slots.get(key)
+            if slot is None:
+                slot = self.__new_slot(key)
+            index, generation, key_checksum = slot
+            generation += 1
+            _ENTRY.pack_into(
+                self.__map,
+                _HEADER.size + index * _SLOT_SIZE + _ENTRIES_OFFSET + (generation % 2) * _ENTRY.size,
+                generation,
+                sequence_number,
+                self.__entry_checksum(key_checksum, generation, sequence_number),
+            )
+            slot[1] = generation
+            self.__checkpoints[key] = sequence_number
+
+            self.__pending += 1
+            if self.__pending >= self.commit_count:
+                self.__commit()
+            elif self.__timer is None:
+                self.__timer = Timer(self.commit_interval, self.commit)
+                self.__timer.name = "CheckpointStoreCommit"
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def commit(self) -> None:
+        """
+        Commit the pending updates to disk now.
+        """
+        with self.__lock:
+            if not self.__closed:
+                self.__commit()
+
+    def __commit(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        if self.__pending == 0:
+            return
+        self.__map.flush()
+        os.fsync(self.__fd)
+        self.__pending = 0
+
+    def close(self) -> None:
+        """
+        Commit the pending updates and close the checkpoint file.
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__commit()
+            self.__closed = True
+            self.__map.close()
+            os.close(self.__fd)
+
+
+class StreamConsumer:
+    """
+    Reads a stream for a named consumer and keeps its place in a :class:`CheckpointStore`, so that it resumes after
+    the last message it processed when it is created again, e.g. after a restart.
+
+    :param client: The :class:`~.streammanagerclient.StreamManagerClient` to read with.
+    :param stream_name: The name of the stream to read.
+    :param consumer_name: Name of the consumer, which identifies its checkpoint in the store.
+    :param checkpoints: The :class:`CheckpointStore` of the consumer, or None to only keep its place in memory.
+    :param start_sequence_number: Sequence number to start reading at when the consumer has no checkpoint.
+        Default is 0, the start of the stream.
+    :param max_message_count: Maximum number of messages returned by one read. Default is 100.
+    :param read_timeout_millis: Time in milliseconds a read waits for messages when there are none. Default is 1000.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream_name: str,
+        consumer_name: str,
+        checkpoints: Optional[CheckpointStore],
+        start_sequence_number: int = 0,
+        max_message_count: int = 100,
+        read_timeout_millis: int = 1000,
+    ):
+        self.client = client
+        self.stream_name = stream_name
+        self.consumer_name = consumer_name
+        self.checkpoints = checkpoints
+        self.max_message_count = max_message_count
+        self.read_timeout_millis = read_timeout_millis
+        checkpoint = checkpoints.get(consumer_name, stream_name) if checkpoints is not None else None
+        self.__committed_sequence_number = checkpoint
+        self.__next_sequence_number = checkpoint + 1 if checkpoint is not None else start_sequence_number
+
+    @property
+    def committed_sequence_number(self) -> Optional[int]:
+        """
+        The sequence number of the last message which was marked as processed, or None if there is none.
+        """
+        return self.__committed_sequence_number
+
+    @property
+    def next_sequence_number(self) -> int:
+        """
+        The sequence number which the next read starts at.
+        """
+        return self.__next_sequence_number
+
+    def seek(self, sequence_number: int) -> None:
+        """
+        Make the next read start at sequence_number.
+        """
+        self.__next_sequence_number = sequence_number
+
+    def read(self) -> MessageBatch:
+        """
+        Read the next messages of the stream, waiting up to read_timeout_millis for them. The messages are not marked
+        as processed, call :meth:`commit` once they are.
+
+        :return: :class:`~.messagebatch.MessageBatch` of the messages, which is empty if there were none.
+        :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
+        :raises: :exc:`asyncio.TimeoutError` if the request times out.
+        :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
+        """
+        try:
+            batch = self.client.read_messages(
+                self.stream_name,
+                ReadMessagesOptions(
+                    desired_start_sequence_number=self.__next_sequence_number,
+                    min_message_count=1,
+                    max_message_count=self.max_message_count,
+                    read_timeout_millis=self.read_timeout_millis,
+                ),
+            )
+        except NotEnoughMessagesException:
+            return MessageBatch(self.stream_name)
+        if len(batch):
+            self.__next_sequence_number = batch.sequence_numbers[-1] + 1
+        return batch
+
+    def commit(self, sequence_number: int) -> None:
+        """
+        Mark the messages of the stream up to sequence_number as processed.
+        """
+        self.__committed_sequence_number = sequence_number
+        if self.checkpoints is not None:
+            self.checkpoints.update(self.consumer_name, self.stream_name, sequence_number)
+
+    def messages(self, follow: bool = True) -> Iterator[Message]:
+        """
+        Iterate over the messages of the stream. A message is marked as processed when the next one is requested,
+        that is once the body of the loop which received it completes.
+
+        :param follow: Whether to wait for new messages at the end of the stream, rather than stop. If the consumer
+            does not wait for messages, i.e. its read_timeout_millis is 0, reads at the end of the stream are spaced by
+            :data:`EMPTY_READ_BACKOFF` seconds.
+        """
+        while True:
+            batch = self.read()
+            if not len(batch):
+                if not follow:
+                    return
+                if not self.read_timeout_millis:
+                    # Do not poll the server in a busy loop
+                    time.sleep(EMPTY_READ_BACKOFF)
+            for message in batch:
+                yield message
+                self.commit(message.sequence_number)
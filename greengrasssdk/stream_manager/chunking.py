@@ -0,0 +1,257 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import logging
+import struct
+import uuid
+import zlib
+from array import array
+from typing import Dict, Iterator, Optional
+
+from .exceptions import NotEnoughMessagesException
+from .messagebatch import _NO_INGEST_TIME, MessageBatch
+
+"""
+(Internal Only) Splitting of large payloads across messages and their reassembly.
+
+Every chunk starts with a fixed size header: a magic marker, the header version, the object id,
+the index of the chunk, the total number of chunks of the object and a checksum of the header, so that
+ordinary payloads are not mistaken for chunks. Payloads which do look like a chunk are appended as an object
+of a single chunk by clients which split payloads.
+
+Chunks are reassembled by object id, so the chunks of an object may be interleaved with other messages,
+e.g. when several processes append to the same stream.
+"""
+
+_CHUNK_MAGIC = b"GGLO"
+_CHUNK_VERSION = 1
+_CHUNK_FIELDS = struct.Struct(">4sB16sII")
+_CHUNK_HEADER = struct.Struct(">4sB16sIII")
+
+CHUNK_HEADER_SIZE = _CHUNK_HEADER.size
+
+# Upper bound on the chunk bytes requested by a single read, to stay well under the server's response size limit
+MAX_CHUNK_READ_BYTES = 16 * 1024 * 1024
+
+# Number of other messages which may be interleaved with the chunks of an object, after which its missing
+# chunks are not expected anymore
+MAX_CHUNK_SPREAD = 10000
+
+
+class ChunkHeader:
+    __slots__ = ["object_id", "index", "count"]
+
+    def __init__(self, object_id: bytes, index: int, count: int):
+        self.object_id = object_id
+        self.index = index
+        self.count = count
+
+    def encode(self) -> bytes:
+        fields = _CHUNK_FIELDS.pack(_CHUNK_MAGIC, _CHUNK_VERSION, self.object_id, self.index, self.count)
+        return fields + struct.pack(">I", zlib.crc32(fields))
+
+    @staticmethod
+    def decode(payload) -> Optional["ChunkHeader"]:
+        """
+        :return: The header of a chunk, or None if the payload is not a chunk.
+        """
+        if len(payload) < CHUNK_HEADER_SIZE or payload[:4] != _CHUNK_MAGIC:
+            return None
+        _, version, object_id, index, count, checksum = _CHUNK_HEADER.unpack_from(payload)
+        if version != _CHUNK_VERSION or count < 1 or index >= count:
+            return None
+        if checksum != zlib.crc32(payload[: _CHUNK_FIELDS.size]):
+            return None
+        return ChunkHeader(object_id, index, count)
+
+    def __repr__(self):
+        return "<Class ChunkHeader. object_id: {}, index: {}, count: {}>".format(
+            uuid.UUID(bytes=self.object_id), self.index, self.count
+        )
+
+
+def split_payload(data, max_message_size: int) -> Iterator[bytes]:
+    """
+    Split a payload into chunk messages of at most max_message_size bytes, header included.
+    """
+    view = memoryview(data)
+    chunk_size = max_message_size - CHUNK_HEADER_SIZE
+    count = (len(view) + chunk_size - 1) // chunk_size
+    object_id = uuid.uuid4().bytes
+    for index in range(count):
+        header = ChunkHeader(object_id, index, count).encode()
+        yield b"".join((header, view[index * chunk_size : (index + 1) * chunk_size]))
+
+
+class ChunkAssembler:
+    """
+    Reassembles the chunks of an object, which are expected in order. The data is written to the given sink
+    as the chunks arrive, or kept in memory when no sink is given.
+    """
+
+    __slots__ = [
+        "header",
+        "first_sequence_number",
+        "ingest_time",
+        "next_index",
+        "last_sequence_number",
+        "__sink",
+        "__parts",
+    ]
+
+    def __init__(self, header: ChunkHeader, sequence_number: int, ingest_time: int, sink=None):
+        self.header = header
+        self.first_sequence_number = sequence_number
+        self.ingest_time = ingest_time
+        self.next_index = 0
+        self.last_sequence_number = sequence_number
+        self.__sink = sink
+        self.__parts = []
+
+    def accepts(self, header: ChunkHeader) -> bool:
+        return header.object_id == self.header.object_id and header.index == self.next_index
+
+    def add(self, sequence_number: int, payload: memoryview):
+        data = payload[CHUNK_HEADER_SIZE:]
+        if self.__sink is not None:
+            self.__sink.write(data)
+        else:
+            self.__parts.append(data)
+        self.next_index += 1
+        self.last_sequence_number = sequence_number
+
+    @property
+    def complete(self) -> bool:
+        return self.next_index == self.header.count
+
+    def expired(self, sequence_number: int) -> bool:
+        """
+        Whether the missing chunks are not expected anymore once the stream was read up to sequence_number.
+        """
+        return sequence_number - self.first_sequence_number >= self.header.count + MAX_CHUNK_SPREAD
+
+    @property
+    def remaining(self) -> int:
+        return self.header.count - self.next_index
+
+    def payload(self) -> bytes:
+        return b"".join(self.__parts)
+
+
+class ChunkedReader:
+    """
+    Turns the batches read from a stream into logical records, replacing the chunks of every complete
+    object by a single message. The reassembled message carries the sequence number of the last chunk, so
+    that reading can continue right after it, and the ingest time of the first chunk.
+    Chunks whose object is not complete are held back in :attr:`pending` until more batches are added.
+    """
+
+    def __init__(self, stream_name: str, logger: logging.Logger):
+        self.stream_name = stream_name
+        # Objects which are not complete yet by object id, in the order of their first chunk
+        self.pending = {}  # type: Dict[bytes, ChunkAssembler]
+        self.last_sequence_number = None
+        self.__logger = logger
+        self.__sequence_numbers = array("q")
+        # Sequence number of the first chunk of every record, or of the record itself if it was not split
+        self.__first_sequence_numbers = array("q")
+        self.__ingest_times = array("q")
+        self.__payloads = []
+
+    @property
+    def remaining(self) -> int:
+        """
+        Number of chunks which the pending objects are still missing.
+        """
+        return sum(assembler.remaining for assembler in self.pending.values())
+
+    def __drop(self, assembler: ChunkAssembler, reason: str):
+        self.__logger.warning(
+            "Dropping incomplete large message starting at sequence number %d of stream %s: %s",
+            assembler.first_sequence_number,
+            self.stream_name,
+            reason,
+        )
+        del self.pending[assembler.header.object_id]
+
+    def add_batch(self, batch: MessageBatch):
+        for sequence_number, ingest_time, payload in zip(batch.sequence_numbers, batch.ingest_times, batch.payloads()):
+            self.last_sequence_number = sequence_number
+            header = ChunkHeader.decode(payload)
+            if header is None:
+                self.__append(sequence_number, sequence_number, ingest_time, payload)
+                continue
+            assembler = self.pending.get(header.object_id)
+            if assembler is None:
+                if header.index != 0:
+                    # The read started in the middle of the object
+                    self.__logger.debug("Skipping chunk %s at sequence number %d", header, sequence_number)
+                    continue
+                assembler = self.pending[header.object_id] = ChunkAssembler(header, sequence_number, ingest_time)
+            elif not assembler.accepts(header):
+                self.__drop(
+                    assembler, "found chunk {} where chunk {} was expected".format(header.index, assembler.next_index)
+                )
+                continue
+            assembler.add(sequence_number, payload)
+            if assembler.complete:
+                del self.pending[header.object_id]
+                self.__append(
+                    sequence_number, assembler.first_sequence_number, assembler.ingest_time, assembler.payload()
+                )
+
+        for assembler in list(self.pending.values()):
+            if assembler.expired(self.last_sequence_number):
+                self.__drop(assembler, "its missing chunks were not found")
+
+    def __append(self, sequence_number, first_sequence_number, ingest_time, payload):
+        self.__sequence_numbers.append(sequence_number)
+        self.__first_sequence_numbers.append(first_sequence_number)
+        self.__ingest_times.append(ingest_time if ingest_time is not None else _NO_INGEST_TIME)
+        self.__payloads.append(memoryview(payload))
+
+    def __len__(self):
+        return len(self.__sequence_numbers)
+
+    def result(self, max_message_count: Optional[int] = None) -> MessageBatch:
+        """
+        Get at most max_message_count records. Reading continues after the last record returned, so records are
+        only returned up to where no record which is left out, and no pending object, started before, as those would
+        be skipped by the next read. When the chunks of large messages are interleaved with other messages, this may
+        take more than max_message_count records.
+
+        :raises: :exc:`~.exceptions.NotEnoughMessagesException` if no record can be returned.
+        """
+        if self.pending:
+            # The rest of the chunks may simply not be appended yet, so this is not worth a warning
+            self.__logger.debug(
+                "Large messages starting at sequence numbers %s of stream %s are not complete yet",
+                [assembler.first_sequence_number for assembler in self.pending.values()],
+                self.stream_name,
+            )
+        # left_out_starts[count] is the first sequence number of the records left out when count records are
+        # returned and of the pending objects, which the next read must not start after
+        left_out_starts = [0] * (len(self) + 1)
+        left_out_starts[-1] = min(
+            (assembler.first_sequence_number for assembler in self.pending.values()), default=float("inf")
+        )
+        for index in range(len(self) - 1, -1, -1):
+            left_out_starts[index] = min(left_out_starts[index + 1], self.__first_sequence_numbers[index])
+
+        def fits(count):
+            return self.__sequence_numbers[count - 1] < left_out_starts[count]
+
+        limit = len(self) if max_message_count is None else min(len(self), max_message_count)
+        count = next((count for count in range(limit, 0, -1) if fits(count)), None)
+        if count is None:
+            count = next((count for count in range(limit + 1, len(self) + 1) if fits(count)), None)
+        if count is None:
+            raise NotEnoughMessagesException("No complete message is available in stream {}".format(self.stream_name))
+        return MessageBatch(
+            self.stream_name,
+            self.__sequence_numbers[:count],
+            self.__ingest_times[:count],
+            self.__payloads[:count],
+        )
@@ -0,0 +1,93 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import json
+import struct
+from typing import Any, Optional, Sequence
+
+import cbor2
+
+from .exceptions import ValidationException
+
+
+class Codec:
+    """
+    Converts the objects of a stream to and from message payloads. Register a codec for a stream with
+    :meth:`~.streammanagerclient.StreamManagerClient.register_codec`.
+
+    Subclasses implement :meth:`encode` and :meth:`decode`.
+    """
+
+    def encode(self, obj: Any) -> bytes:
+        """
+        :return: The payload of a message holding obj.
+        """
+        raise NotImplementedError
+
+    def decode(self, payload: memoryview) -> Any:
+        """
+        :param payload: The payload of a message, a read-only memoryview of the response it was read in.
+        :return: The object held by the payload.
+        """
+        raise NotImplementedError
+
+
+class CborCodec(Codec):
+    """
+    Encodes objects as CBOR, which is more compact and faster to encode and decode than JSON.
+    """
+
+    def encode(self, obj: Any) -> bytes:
+        return cbor2.dumps(obj)
+
+    def decode(self, payload: memoryview) -> Any:
+        return cbor2.loads(payload)
+
+
+class JsonCodec(Codec):
+    """
+    Encodes objects as compact UTF-8 JSON, for streams which are also read by tools expecting JSON.
+    """
+
+    def __init__(self):
+        # json.dumps builds a new encoder on every call which is given options
+        self.__encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+        self.__decoder = json.JSONDecoder()
+
+    def encode(self, obj: Any) -> bytes:
+        return self.__encoder.encode(obj).encode("utf-8")
+
+    def decode(self, payload: memoryview) -> Any:
+        return self.__decoder.decode(str(payload, "utf-8"))
+
+
+class StructCodec(Codec):
+    """
+    Encodes records of fixed size fields with :mod:`struct`, the most compact and fastest encoding for numeric
+    records such as sensor readings.
+
+    :param format: The :mod:`struct` format of the records, e.g. ``"<qdd"``.
+    :param fields: (Optional) Names of the fields of the records. When given, records are encoded from and decoded to
+        dictionaries of these fields, otherwise from and to tuples.
+    """
+
+    def __init__(self, format: str, fields: Optional[Sequence[str]] = None):
+        self.struct = struct.Struct(format)
+        if fields is not None:
+            fields = tuple(fields)
+            if len(fields) != len(self.struct.unpack(bytes(self.struct.size))):
+                raise ValidationException("fields must name every field of format {}".format(format))
+        self.fields = fields
+
+    def encode(self, obj: Any) -> bytes:
+        if self.fields is not None:
+            return self.struct.pack(*[obj[field] for field in self.fields])
+        return self.struct.pack(*obj)
+
+    def decode(self, payload: memoryview) -> Any:
+        values = self.struct.unpack_from(payload)
+        if self.fields is not None:
+            return dict(zip(self.fields, values))
+        return values
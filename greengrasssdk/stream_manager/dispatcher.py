@@ -0,0 +1,179 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+from collections import deque
+from concurrent.futures import CancelledError, Executor, ThreadPoolExecutor
+from threading import Condition
+from typing import Any, Callable, Optional
+
+from .checkpoint import EMPTY_READ_BACKOFF, StreamConsumer
+from .data import Message
+from .exceptions import ValidationException
+
+
+class StreamDispatcher:
+    """
+    Processes the messages of a stream on a pool of threads or processes. Messages with the same key are processed
+    one at a time in the order of the stream, messages with different keys in parallel and in any order.
+
+    The consumer only commits a sequence number once the message with that sequence number and all the messages
+    before it were processed, so a consumer which is restarted never skips a message, but may process again messages
+    which were processed after the oldest unprocessed one.
+
+    :param consumer: The :class:`~.checkpoint.StreamConsumer` which reads the stream and records the processed
+        messages.
+    :param handler: Function called with every :class:`~.data.Message`. With a
+        :class:`concurrent.futures.ProcessPoolExecutor` it must be a module level function.
+    :param key: Function called with every :class:`~.data.Message` in the thread running :meth:`run`, which returns
+        the hashable key which the message is ordered by, e.g. a device id.
+    :param executor: (Optional) The :class:`concurrent.futures.Executor` which runs the handler. Default is a
+        :class:`concurrent.futures.ThreadPoolExecutor` of max_workers threads which is shut down when :meth:`run`
+        returns.
+    :param max_workers: (Optional) Number of threads of the default executor. Default is the
+        :class:`concurrent.futures.ThreadPoolExecutor` default.
+    :param max_in_flight: Number of messages which may be read but not processed yet, after which reading waits.
+        Default is 1000.
+    """
+
+    def __init__(
+        self,
+        consumer: StreamConsumer,
+        handler: Callable[[Message], Any],
+        key: Callable[[Message], Any],
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        max_in_flight: int = 1000,
+    ):
+        if max_in_flight < 1:
+            raise ValidationException("max_in_flight must be at least 1")
+        self.consumer = consumer
+        self.handler = handler
+        self.key = key
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.__condition = Condition()
+        self.__stopping = False
+        self.__reset()
+
+    def __reset(self):
+        # Messages waiting for the message in flight with the same key, a key is present while one is in flight
+        self.__keys = {}
+        # [sequence number, processed] of every message which was read and not committed, in stream order
+        self.__pending = deque()
+        self.__running = 0
+        self.__error = None
+
+    def run(self, follow: bool = True) -> None:
+        """
+        Read and process messages until :meth:`stop` is called or a handler raises an exception, and return once the
+        messages given to the handler were processed. The messages which were read but not given to the handler yet
+        are read again by the next call.
+
+        :param follow: Whether to wait for new messages at the end of the stream, rather than return once all the
+            messages were processed. If the consumer does not wait for messages, i.e. its read_timeout_millis is 0,
+            reads at the end of the stream are spaced by :data:`~.checkpoint.EMPTY_READ_BACKOFF` seconds.
+        :raises: The exception raised by the handler. The committed sequence number stays before the message which
+            failed.
+        """
+        executor = self.executor if self.executor is not None else ThreadPoolExecutor(self.max_workers)
+        self.__stopping = False
+        # First sequence number of the batch being dispatched, until all of its messages are pending
+        undispatched = None
+        try:
+            while True:
+                with self.__condition:
+                    while len(self.__pending) >= self.max_in_flight and self.__error is None and not self.__stopping:
+                        self.__condition.wait()
+                    if self.__error is not None or self.__stopping:
+                        break
+
+                batch = self.consumer.read()
+                if not len(batch):
+                    if not follow:
+                        break
+                    if not self.consumer.read_timeout_millis:
+                        # Do not poll the server in a busy loop
+                        with self.__condition:
+                            if not self.__stopping:
+                                self.__condition.wait(EMPTY_READ_BACKOFF)
+                    continue
+                undispatched = batch.sequence_numbers[0]
+                messages = list(batch)
+                keys = [self.key(message) for message in messages]
+                with self.__condition:
+                    for message, key in zip(messages, keys):
+                        entry = [message.sequence_number, False]
+                        self.__pending.append(entry)
+                        waiting = self.__keys.get(key)
+                        if waiting is None:
+                            self.__keys[key] = deque()
+                            self.__submit(executor, key, message, entry)
+                        else:
+                            waiting.append((message, entry))
+                undispatched = None
+        finally:
+            with self.__condition:
+                while self.__running:
+                    self.__condition.wait()
+                if self.__pending:
+                    self.consumer.seek(self.__pending[0][0])
+                elif undispatched is not None:
+                    self.consumer.seek(undispatched)
+                error = self.__error
+                self.__reset()
+            if self.executor is None:
+                executor.shutdown()
+        if error is not None:
+            raise error
+
+    def stop(self) -> None:
+        """
+        Make :meth:`run` return once the messages given to the handler were processed. Can be called from any thread,
+        including from the handler.
+        """
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+
+    def __submit(self, executor: Executor, key, message: Message, entry: list):
+        self.__running += 1
+        try:
+            future = executor.submit(self.handler, message)
+        except BaseException:
+            self.__running -= 1
+            raise
+        future.add_done_callback(lambda future: self.__complete(executor, key, entry, future))
+
+    def __complete(self, executor: Executor, key, entry: list, future):
+        with self.__condition:
+            self.__running -= 1
+            self.__condition.notify_all()
+            try:
+                error = future.exception()
+            except CancelledError as e:
+                error = e
+            if error is not None:
+                if self.__error is None:
+                    self.__error = error
+                return
+
+            entry[1] = True
+            sequence_number = None
+            while self.__pending and self.__pending[0][1]:
+                sequence_number = self.__pending.popleft()[0]
+            waiting = self.__keys[key]
+            try:
+                if sequence_number is not None:
+                    self.consumer.commit(sequence_number)
+                if waiting and self.__error is None and not self.__stopping:
+                    message, entry = waiting.popleft()
+                    self.__submit(executor, key, message, entry)
+                    return
+            except BaseException as e:
+                # Stop, since nothing would ever be processed again after the messages of this key
+                if self.__error is None:
+                    self.__error = e
+            del self.__keys[key]
@@ -0,0 +1,241 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+from array import array
+from collections.abc import Sequence
+from reprlib import repr as limitedRepr
+from typing import Iterator, List, Optional
+
+from .data import Message
+
+# Sentinel stored in the ingest time column when the server did not send an ingest time.
+_NO_INGEST_TIME = -1
+
+
+class MessageBatch(Sequence):
+    """
+    Messages returned by a single :meth:`~.StreamManagerClient.read_messages` call.
+
+    The batch keeps a reference to the response buffer and exposes the sequence numbers and ingest times
+    as compact ``array('q')`` columns. Payloads are returned as memoryviews and :class:`~.data.Message`
+    objects are only built when an item is accessed, so consumers which only need the sequence numbers,
+    or which filter out most records, do not pay for copying every payload.
+
+    A batch is a read-only sequence of :class:`~.data.Message` and can be used anywhere the list returned
+    by earlier versions of the SDK was used.
+    """
+
+    __slots__ = [
+        "__stream_name",
+        "__sequence_numbers",
+        "__ingest_times",
+        "__payloads",
+        "__buffer",
+    ]
+
+    def __init__(
+        self,
+        stream_name: str = None,
+        sequence_numbers: array = None,
+        ingest_times: array = None,
+        payloads: List[memoryview] = None,
+        buffer=None,
+    ):
+        """
+        :param stream_name: The name of the stream which the messages were read from.
+        :param sequence_numbers: ``array('q')`` of the sequence number of each message.
+        :param ingest_times: ``array('q')`` of the ingest time of each message, -1 where it is unknown.
+        :param payloads: List of memoryviews over the payload of each message.
+        :param buffer: The response buffer which the payloads reference.
+        """
+        self.__stream_name = stream_name
+        self.__sequence_numbers = sequence_numbers if sequence_numbers is not None else array("q")
+        self.__ingest_times = ingest_times if ingest_times is not None else array("q")
+        self.__payloads = payloads if payloads is not None else []
+        self.__buffer = buffer
+
+    @property
+    def stream_name(self) -> Optional[str]:
+        """
+        The name of the stream which the messages were read from.
+        """
+        return self.__stream_name
+
+    @property
+    def sequence_numbers(self) -> array:
+        """
+        ``array('q')`` of the sequence number of each message in the batch.
+        """
+        return self.__sequence_numbers
+
+    @property
+    def ingest_times(self) -> array:
+        """
+        ``array('q')`` of the ingest time of each message in the batch. Data is Unix epoch time in milliseconds,
+        -1 if the server did not provide an ingest time.
+        """
+        return self.__ingest_times
+
+    @property
+    def buffer(self):
+        """
+        The response buffer which the payloads reference, or None if the payloads own their memory.
+        """
+        return self.__buffer
+
+    def payload(self, index: int) -> memoryview:
+        """
+        Get the payload of a message without copying it.
+
+        :param index: Index of the message within the batch.
+        :return: Read-only memoryview of the payload.
+        """
+        return self.__payloads[index]
+
+    def payloads(self) -> Iterator[memoryview]:
+        """
+        Iterate over the payloads of the batch without copying them.
+
+        :return: Iterator of read-only memoryviews.
+        """
+        return iter(self.__payloads)
+
+    def decode(self, codec) -> "DecodedBatch":
+        """
+        Get the objects held by the payloads of the batch, which are decoded as they are accessed.
+
+        :param codec: The :class:`~.codecs.Codec` of the stream.
+        :return: :class:`DecodedBatch` of the objects.
+        """
+        return DecodedBatch(self, codec)
+
+    def __len__(self):
+        return len(self.__sequence_numbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MessageBatch(
+                stream_name=self.__stream_name,
+                sequence_numbers=self.__sequence_numbers[index],
+                ingest_times=self.__ingest_times[index],
+                payloads=self.__payloads[index],
+                buffer=self.__buffer,
+            )
+        ingest_time = self.__ingest_times[index]
+        return Message(
+            stream_name=self.__stream_name,
+            sequence_number=self.__sequence_numbers[index],
+            ingest_time=ingest_time if ingest_time != _NO_INGEST_TIME else None,
+            payload=bytes(self.__payloads[index]),
+        )
+
+    @staticmethod
+    def from_dict(messages):
+        """
+        Build a batch from the list of message dictionaries of a decoded ReadMessagesResponse.
+        The payload bytes of the decoded messages are referenced, not copied. A missing or null sequence number
+        is 0, and the columns are lists rather than arrays if a value does not fit in a signed 64 bit integer.
+        """
+        sequence_numbers = []
+        ingest_times = []
+        payloads = []
+        stream_name = None
+        for m in messages:
+            if stream_name is None:
+                stream_name = m.get("streamName")
+            sequence_number = m.get("sequenceNumber")
+            sequence_numbers.append(sequence_number if sequence_number is not None else 0)
+            ingest_time = m.get("ingestTime")
+            ingest_times.append(ingest_time if ingest_time is not None else _NO_INGEST_TIME)
+            payloads.append(memoryview(m.get("payload", b"")))
+        try:
+            sequence_numbers, ingest_times = array("q", sequence_numbers), array("q", ingest_times)
+        except OverflowError:
+            pass
+        return MessageBatch(stream_name, sequence_numbers, ingest_times, payloads)
+
+    @staticmethod
+    def from_messages(messages: List[Message]):
+        """
+        Build a batch from a list of :class:`~.data.Message` objects.
+        """
+        sequence_numbers = array("q")
+        ingest_times = array("q")
+        payloads = []
+        stream_name = None
+        for m in messages:
+            if stream_name is None:
+                stream_name = m.stream_name
+            sequence_numbers.append(m.sequence_number if m.sequence_number is not None else 0)
+            ingest_times.append(m.ingest_time if m.ingest_time is not None else _NO_INGEST_TIME)
+            payloads.append(memoryview(m.payload))
+        return MessageBatch(stream_name, sequence_numbers, ingest_times, payloads)
+
+    def __repr__(self):
+        return "<Class MessageBatch. stream_name: {}, size: {}, sequence_numbers: {}>".format(
+            limitedRepr(self.__stream_name), len(self), limitedRepr(self.__sequence_numbers)
+        )
+
+
+# Marks the objects of a DecodedBatch which were not decoded yet
+_NOT_DECODED = object()
+
+
+class DecodedBatch(Sequence):
+    """
+    Objects held by the messages of a :class:`MessageBatch`, as returned by
+    :meth:`~.StreamManagerClient.read_objects`.
+
+    A payload is only decoded when its object is first accessed, so consumers which skip most messages, e.g. after
+    looking at :attr:`sequence_numbers`, only pay for decoding the messages they use.
+    """
+
+    __slots__ = ["__batch", "__codec", "__objects"]
+
+    def __init__(self, batch: MessageBatch, codec):
+        """
+        :param batch: The batch of messages.
+        :param codec: The :class:`~.codecs.Codec` which decodes their payloads.
+        """
+        self.__batch = batch
+        self.__codec = codec
+        self.__objects = [_NOT_DECODED] * len(batch)
+
+    @property
+    def batch(self) -> MessageBatch:
+        """
+        The batch of messages holding the objects.
+        """
+        return self.__batch
+
+    @property
+    def sequence_numbers(self) -> array:
+        """
+        ``array('q')`` of the sequence number of the message holding each object.
+        """
+        return self.__batch.sequence_numbers
+
+    @property
+    def ingest_times(self) -> array:
+        """
+        ``array('q')`` of the ingest time of the message holding each object, -1 where it is unknown.
+        """
+        return self.__batch.ingest_times
+
+    def __len__(self):
+        return len(self.__objects)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        obj = self.__objects[index]
+        if obj is _NOT_DECODED:
+            obj = self.__objects[index] = self.__codec.decode(self.__batch.payload(index))
+        return obj
+
+    def __repr__(self):
+        return "<Class DecodedBatch. stream_name: {}, size: {}, sequence_numbers: {}>".format(
+            limitedRepr(self.__batch.stream_name), len(self), limitedRepr(self.__batch.sequence_numbers)
+        )
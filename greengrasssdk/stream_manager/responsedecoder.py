@@ -0,0 +1,384 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import struct
+from array import array
+
+import cbor2
+
+from .data import (
+    AppendMessageResponse,
+    CreateMessageStreamResponse,
+    DeleteMessageStreamResponse,
+    DescribeMessageStreamResponse,
+    ListStreamsResponse,
+    Operation,
+    ReadMessagesResponse,
+    ResponseStatusCode,
+    UnknownOperationError,
+    UpdateMessageStreamResponse,
+)
+from .messagebatch import _NO_INGEST_TIME, MessageBatch
+
+"""
+(Internal Only) Decoder which turns response frames into response objects.
+
+The common responses are decoded straight from the frame bytes, without building the intermediate
+dict/list tree that ``cbor2.loads`` produces and then walking it again in ``from_dict``. Fields which
+the client does not know about are skipped without allocating anything, and message payloads are
+returned as memoryviews into the frame instead of being copied.
+Anything the decoder does not expect, such as indefinite length strings or tagged values, makes it fall
+back to ``cbor2.loads`` and the generated ``from_dict``.
+"""
+
+_UINT16 = struct.Struct(">H")
+_UINT32 = struct.Struct(">I")
+_UINT64 = struct.Struct(">Q")
+
+_MAJOR_UNSIGNED = 0
+_MAJOR_NEGATIVE = 1
+_MAJOR_BYTES = 2
+_MAJOR_TEXT = 3
+_MAJOR_ARRAY = 4
+_MAJOR_MAP = 5
+_MAJOR_TAG = 6
+_MAJOR_SIMPLE = 7
+
+_SIMPLE_NULL = 22
+_SIMPLE_UNDEFINED = 23
+_BREAK = 0xFF
+
+
+class _UnsupportedEncoding(Exception):
+    pass
+
+
+def _head(buf, pos):
+    """
+    Read the head of a data item.
+    :return: (major type, argument, position after the head). The argument is None for indefinite lengths.
+    """
+    initial = buf[pos]
+    pos += 1
+    major = initial >> 5
+    info = initial & 0x1F
+    if info < 24:
+        return major, info, pos
+    if info == 24:
+        return major, buf[pos], pos + 1
+    if info == 25:
+        return major, _UINT16.unpack_from(buf, pos)[0], pos + 2
+    if info == 26:
+        return major, _UINT32.unpack_from(buf, pos)[0], pos + 4
+    if info == 27:
+        return major, _UINT64.unpack_from(buf, pos)[0], pos + 8
+    if info == 31 and major in (_MAJOR_BYTES, _MAJOR_TEXT, _MAJOR_ARRAY, _MAJOR_MAP):
+        return major, None, pos
+    raise _UnsupportedEncoding()
+
+
+def _skip(buf, pos):
+    """
+    Skip over a complete data item without decoding it.
+    :return: Position after the item.
+    """
+    major, arg, pos = _head(buf, pos)
+    if major == _MAJOR_BYTES or major == _MAJOR_TEXT:
+        if arg is None:
+            while buf[pos] != _BREAK:
+                pos = _skip(buf, pos)
+            return pos + 1
+        return pos + arg
+    if major == _MAJOR_ARRAY or major == _MAJOR_MAP:
+        items_per_entry = 2 if major == _MAJOR_MAP else 1
+        if arg is None:
+            while buf[pos] != _BREAK:
+                pos = _skip(buf, pos)
+            return pos + 1
+        for _ in range(arg * items_per_entry):
+            pos = _skip(buf, pos)
+        return pos
+    if major == _MAJOR_TAG:
+        return _skip(buf, pos)
+    # Integers and simple values are fully contained in the head
+    return pos
+
+
+def _container(buf, pos, expected_major):
+    """
+    Read the head of an array or map.
+    :return: (number of entries or -1 if the length is indefinite, position after the head)
+    """
+    major, arg, pos = _head(buf, pos)
+    if major != expected_major:
+        raise _UnsupportedEncoding()
+    return (-1 if arg is None else arg), pos
+
+
+def _has_next(buf, pos, remaining):
+    if remaining < 0:
+        return buf[pos] != _BREAK
+    return remaining > 0
+
+
+def _end(buf, pos, remaining):
+    # Consume the break byte which ends an indefinite length container
+    return pos + 1 if remaining < 0 else pos
+
+
+def _read_key(buf, pos):
+    major, length, pos = _head(buf, pos)
+    if major != _MAJOR_TEXT or length is None:
+        raise _UnsupportedEncoding()
+    return length, pos
+
+
+def _match(buf, key_pos, key_length, keys):
+    # Compare keys in place so that unknown keys are never decoded
+    for i, key in enumerate(keys):
+        if len(key) == key_length and buf.startswith(key, key_pos):
+            return i
+    return -1
+
+
+def _read_int(buf, view, pos):
+    major, arg, pos = _head(buf, pos)
+    if major == _MAJOR_UNSIGNED:
+        return arg, pos
+    if major == _MAJOR_NEGATIVE:
+        return -1 - arg, pos
+    if major == _MAJOR_SIMPLE and arg in (_SIMPLE_NULL, _SIMPLE_UNDEFINED):
+        return None, pos
+    raise _UnsupportedEncoding()
+
+
+def _read_text(buf, view, pos):
+    major, arg, pos = _head(buf, pos)
+    if major == _MAJOR_TEXT and arg is not None:
+        return str(view[pos : pos + arg], "utf-8"), pos + arg
+    if major == _MAJOR_SIMPLE and arg in (_SIMPLE_NULL, _SIMPLE_UNDEFINED):
+        return None, pos
+    raise _UnsupportedEncoding()
+
+
+def _read_status(buf, view, pos):
+    value, pos = _read_int(buf, view, pos)
+    return (ResponseStatusCode.from_dict(value) if value is not None else None), pos
+
+
+def _read_text_list(buf, view, pos):
+    if buf[pos] >> 5 == _MAJOR_SIMPLE:
+        return _read_int(buf, view, pos)
+    remaining, pos = _container(buf, pos, _MAJOR_ARRAY)
+    values = []
+    while _has_next(buf, pos, remaining):
+        value, pos = _read_text(buf, view, pos)
+        values.append(value)
+        remaining -= 1
+    return values, _end(buf, pos, remaining)
+
+
+# Encoded (head and text) message keys, so that a key can be recognised with a single comparison.
+# The first byte of an encoded key is its head, which holds the key length.
+_STREAM_NAME_KEY = cbor2.dumps("streamName")
+_SEQUENCE_NUMBER_KEY = cbor2.dumps("sequenceNumber")
+_INGEST_TIME_KEY = cbor2.dumps("ingestTime")
+_PAYLOAD_KEY = cbor2.dumps("payload")
+_SEQUENCE_NUMBER_HEAD = _SEQUENCE_NUMBER_KEY[0]
+_PAYLOAD_HEAD = _PAYLOAD_KEY[0]
+_INGEST_TIME_HEAD = _INGEST_TIME_KEY[0]
+_STREAM_NAME_HEAD = _STREAM_NAME_KEY[0]
+
+
+def _read_message_batch(buf, view, pos):
+    # This is the hot path when reading large batches, so the common encodings are decoded inline
+    # and only the unusual ones go through the generic helpers.
+    if buf[pos] >> 5 == _MAJOR_SIMPLE:
+        return _read_int(buf, view, pos)
+    remaining, pos = _container(buf, pos, _MAJOR_ARRAY)
+    stream_name = None
+    sequence_numbers = array("q")
+    ingest_times = array("q")
+    payloads = []
+    empty = view[0:0]
+    startswith = buf.startswith
+    unpack_uint16 = _UINT16.unpack_from
+    unpack_uint32 = _UINT32.unpack_from
+    unpack_uint64 = _UINT64.unpack_from
+    while _has_next(buf, pos, remaining):
+        sequence_number = 0
+        ingest_time = _NO_INGEST_TIME
+        payload = empty
+        head = buf[pos]
+        if 0xA0 <= head < 0xB8:
+            remaining_fields = head - 0xA0
+            pos += 1
+        else:
+            remaining_fields, pos = _container(buf, pos, _MAJOR_MAP)
+        while True:
+            if remaining_fields >= 0:
+                if remaining_fields == 0:
+                    break
+            elif buf[pos] == _BREAK:
+                pos += 1
+                break
+            remaining_fields -= 1
+
+            head = buf[pos]
+            if head == _SEQUENCE_NUMBER_HEAD and startswith(_SEQUENCE_NUMBER_KEY, pos):
+                pos += len(_SEQUENCE_NUMBER_KEY)
+                head = buf[pos]
+                if head < 24:
+                    sequence_number = head
+                    pos += 1
+                elif head == 0x1A:
+                    sequence_number = unpack_uint32(buf, pos + 1)[0]
+                    pos += 5
+                else:
+                    sequence_number, pos = _read_int(buf, view, pos)
+                    if sequence_number is None:
+                        sequence_number = 0
+            elif head == _PAYLOAD_HEAD and startswith(_PAYLOAD_KEY, pos):
+                pos += len(_PAYLOAD_KEY)
+                head = buf[pos]
+                if 0x40 <= head < 0x58:
+                    length = head - 0x40
+                    pos += 1
+                elif head == 0x59:
+                    length = unpack_uint16(buf, pos + 1)[0]
+                    pos += 3
+                elif head == 0x5A:
+                    length = unpack_uint32(buf, pos + 1)[0]
+                    pos += 5
+                else:
+                    major, length, pos = _head(buf, pos)
+                    if major != _MAJOR_BYTES or length is None:
+                        raise _UnsupportedEncoding()
+                payload = view[pos : pos + length]
+                pos += length
+            elif head == _INGEST_TIME_HEAD and startswith(_INGEST_TIME_KEY, pos):
+                pos += len(_INGEST_TIME_KEY)
+                if buf[pos] == 0x1B:
+                    ingest_time = unpack_uint64(buf, pos + 1)[0]
+                    pos += 9
+                else:
+                    value, pos = _read_int(buf, view, pos)
+                    if value is not None:
+                        ingest_time = value
+            elif head == _STREAM_NAME_HEAD and startswith(_STREAM_NAME_KEY, pos):
+                pos += len(_STREAM_NAME_KEY)
+                # All messages of a read come from the same stream, only decode the name once
+                if stream_name is None:
+                    stream_name, pos = _read_text(buf, view, pos)
+                else:
+                    pos = _skip(buf, pos)
+            else:
+                key_length, pos = _read_key(buf, pos)
+                pos = _skip(buf, pos + key_length)
+        try:
+            sequence_numbers.append(sequence_number)
+            ingest_times.append(ingest_time)
+        except OverflowError:
+            # Does not fit in the columns, MessageBatch.from_dict keeps such values in lists
+            raise _UnsupportedEncoding()
+        payloads.append(payload)
+        remaining -= 1
+    batch = MessageBatch(stream_name, sequence_numbers, ingest_times, payloads, buffer=buf)
+    return batch, _end(buf, pos, remaining)
+
+
+def _decode_map(buf, response_type, fields):
+    """
+    Decode the top level map of a response into the constructor arguments of response_type.
+
+    :param fields: Tuple of (key bytes, constructor argument name, reader function).
+    """
+    view = memoryview(buf)
+    keys = tuple(f[0] for f in fields)
+    kwargs = {}
+    remaining, pos = _container(buf, 0, _MAJOR_MAP)
+    while _has_next(buf, pos, remaining):
+        key_length, pos = _read_key(buf, pos)
+        key = _match(buf, pos, key_length, keys)
+        pos += key_length
+        if key < 0:
+            pos = _skip(buf, pos)
+        else:
+            _, name, reader = fields[key]
+            kwargs[name], pos = reader(buf, view, pos)
+        remaining -= 1
+    return response_type(**kwargs)
+
+
+_COMMON_FIELDS = (
+    (b"requestId", "request_id", _read_text),
+    (b"status", "status", _read_status),
+    (b"errorMessage", "error_message", _read_text),
+)
+
+_RESPONSE_FIELDS = {
+    Operation.AppendMessageResponse: (
+        AppendMessageResponse,
+        _COMMON_FIELDS + ((b"sequenceNumber", "sequence_number", _read_int),),
+    ),
+    Operation.ReadMessagesResponse: (
+        ReadMessagesResponse,
+        _COMMON_FIELDS + ((b"messages", "messages", _read_message_batch),),
+    ),
+    Operation.ListStreamsResponse: (
+        ListStreamsResponse,
+        _COMMON_FIELDS + ((b"streams", "streams", _read_text_list),),
+    ),
+    Operation.CreateMessageStreamResponse: (CreateMessageStreamResponse, _COMMON_FIELDS),
+    Operation.DeleteMessageStreamResponse: (DeleteMessageStreamResponse, _COMMON_FIELDS),
+    Operation.UpdateMessageStreamResponse: (UpdateMessageStreamResponse, _COMMON_FIELDS),
+    Operation.UnknownOperationError: (UnknownOperationError, _COMMON_FIELDS),
+}
+
+
+def _read_messages_response_from_dict(d):
+    messages = d.get("messages")
+    return ReadMessagesResponse(
+        request_id=d.get("requestId"),
+        messages=MessageBatch.from_dict(messages) if messages is not None else None,
+        status=ResponseStatusCode.from_dict(d["status"]) if "status" in d else None,
+        error_message=d.get("errorMessage"),
+    )
+
+
+_FROM_DICT = {
+    Operation.AppendMessageResponse: AppendMessageResponse.from_dict,
+    Operation.ReadMessagesResponse: _read_messages_response_from_dict,
+    Operation.ListStreamsResponse: ListStreamsResponse.from_dict,
+    Operation.CreateMessageStreamResponse: CreateMessageStreamResponse.from_dict,
+    Operation.DeleteMessageStreamResponse: DeleteMessageStreamResponse.from_dict,
+    Operation.UpdateMessageStreamResponse: UpdateMessageStreamResponse.from_dict,
+    Operation.DescribeMessageStreamResponse: DescribeMessageStreamResponse.from_dict,
+    Operation.UnknownOperationError: UnknownOperationError.from_dict,
+}
+
+
+class ResponseDecoder:
+    @staticmethod
+    def can_decode(operation: Operation) -> bool:
+        return operation in _FROM_DICT
+
+    @staticmethod
+    def decode(operation: Operation, payload: bytes):
+        """
+        Decode the payload of a response frame into its response object.
+
+        :param operation: The operation of the frame. Must be one for which :meth:`can_decode` is True.
+        :param payload: The CBOR encoded frame payload.
+        :return: The response object.
+        """
+        response_fields = _RESPONSE_FIELDS.get(operation)
+        if response_fields is not None:
+            try:
+                return _decode_map(payload, *response_fields)
+            except (_UnsupportedEncoding, IndexError, struct.error, TypeError, OverflowError, ValueError):
+                # Not an encoding or a value we decode directly, let cbor2 deal with it
+                pass
+        return _FROM_DICT[operation](cbor2.loads(payload))
@@ -4,9 +4,10 @@ SPDX-License-Identifier: Apache-2.0
 """
 
 import asyncio
+import contextvars
 import logging
 import os
-from threading import Thread
+from threading import Lock, Thread
 from typing import List, Optional
 
 import cbor2
@@ -24,7 +25,6 @@ from .data import (
     DescribeMessageStreamResponse,
     ListStreamsRequest,
     ListStreamsResponse,
-    Message,
     MessageFrame,
     MessageStreamDefinition,
     MessageStreamInfo,
@@ -33,13 +33,31 @@ from .data import (
     ReadMessagesRequest,
     ReadMessagesResponse,
     ResponseStatusCode,
-    UnknownOperationError,
     UpdateMessageStreamRequest,
     UpdateMessageStreamResponse,
     VersionInfo,
 )
-from .exceptions import ClientException, ConnectFailedException, StreamManagerException, ValidationException
-from .utilinternal import UtilInternal
+from .chunking import (
+    CHUNK_HEADER_SIZE,
+    MAX_CHUNK_READ_BYTES,
+    ChunkAssembler,
+    ChunkedReader,
+    ChunkHeader,
+    split_payload,
+)
+from .exceptions import (
+    ClientException,
+    ConnectFailedException,
+    NotEnoughMessagesException,
+    StreamManagerException,
+    ValidationException,
+)
+from .codecs import Codec
+from .messagebatch import _NO_INGEST_TIME, DecodedBatch, MessageBatch
+from .responsedecoder import ResponseDecoder
+from .timeindex import StreamTimeIndex
+from .utilinternal import LoopSubmitter, UtilInternal
+from ..utils.tracing import current_span, payload_size, traced
 
 # Version of the Python SDK.
 # NOTE: This version is independent of the StreamManager PROTOCOL_VERSION, which versions the data format
@@ -49,19 +67,36 @@ from .utilinternal import UtilInternal
 SDK_VERSION = "1.1.1"
 
 
+# Span of the public method which made the request running in the current task, when it is traced
+_request_span = contextvars.ContextVar("request_span", default=None)
+
+
 class StreamManagerClient:
     """
     Creates a client for the Greengrass StreamManager. All parameters are optional.
 
     :param host: The host which StreamManager server is running on. Default is localhost.
     :param port: The port which StreamManager server is running on. Default is found in environment variables.
+    :param socket_path: (Optional) Path of a Unix domain socket which StreamManager server is listening on. When given,
+        the client connects over this socket instead of TCP and host and port are not used. Default is None.
     :param connect_timeout: The timeout in seconds for connecting to the server. Default is 3 seconds.
     :param request_timeout: The timeout in seconds for all operations. Default is 60 seconds.
     :param logger: A logger to use for client logging. Default is Python's builtin logger.
+    :param large_message_threshold: (Optional) Size in bytes above which :meth:`append_message` splits a payload
+        across messages of at most this size, and :meth:`read_messages` reassembles them into a single message, also
+        when other clients append to the stream in between. Default is None, meaning payloads are never split. All
+        clients reading a stream which contains split messages should set it.
+    :param write_buffer_high_water: (Optional) Size in bytes of buffered outgoing data at which requests wait for the
+        connection to drain. Default is the asyncio default.
+    :param write_buffer_low_water: (Optional) Size in bytes of buffered outgoing data at which waiting requests
+        resume. Default is the asyncio default.
 
     :raises: :exc:`~.exceptions.StreamManagerException` and subtypes if authenticating to the server fails.
     :raises: :exc:`asyncio.TimeoutError` if the request times out.
     :raises: :exc:`ConnectionError` if the client is unable to connect to the server.
+
+    A client can be used by many threads at once. A client which is inherited by a forked process starts its own event
+    loop and connection in that process when it is first used there; see also :meth:`for_process`.
     """
 
     # List of supported protocol protocol.
@@ -70,6 +105,10 @@ class StreamManagerClient:
 
     __CONNECT_VERSION = 1
 
+    # Clients returned by for_process, keyed by process id and arguments
+    __process_clients = {}
+    __process_clients_lock = Lock()
+
     def __init__(
         self,
         host="127.0.0.1",
@@ -77,26 +116,52 @@ class StreamManagerClient:
         connect_timeout=3,
         request_timeout=60,
         logger=logging.getLogger("StreamManagerClient"),
+        large_message_threshold=None,
+        write_buffer_high_water=None,
+        write_buffer_low_water=None,
+        socket_path=None,
     ):
         self.host = host
         if port is None:
             port = int(os.getenv("STREAM_MANAGER_SERVER_PORT", 8088))
         self.port = port
+        self.socket_path = socket_path
         self.__requests = {}
         self.connect_timeout = connect_timeout
         self.request_timeout = request_timeout
         self.logger = logger
         self.auth_token = os.getenv("AWS_CONTAINER_AUTHORIZATION_TOKEN")
+        if large_message_threshold is not None and large_message_threshold <= CHUNK_HEADER_SIZE:
+            raise ValidationException("large_message_threshold must be greater than {}".format(CHUNK_HEADER_SIZE))
+        self.large_message_threshold = large_message_threshold
+        self.__large_message_locks = {}
+        # Ingest times found by seek_by_time, only used on the event loop thread
+        self.__time_indexes = {}
+        self.__codecs = {}
+        self.write_buffer_high_water = write_buffer_high_water
+        self.write_buffer_low_water = write_buffer_low_water
 
         # Python Logging doesn't have a TRACE level
         # so we will add our own at level 5. (Debug is level 10)
         if logger.level <= 5:
             logging.addLevelName(5, "TRACE")
 
-        self.__loop = asyncio.new_event_loop()
         self.__closed = False
+        self.__fork_lock = Lock()
+        self.__start_event_loop()
+
+        self.__submitter.sync(self.__connect())
+
+    def __start_event_loop(self):
+        self.__pid = os.getpid()
+        self.__loop = asyncio.new_event_loop()
         self.__reader = None
         self.__writer = None
+        self.connected = False
+        # Frames waiting to be sent by the write loop, with the futures of the requests which queued them
+        self.__pending_writes = []
+        self.__pending_write_waiters = []
+        self.__write_wakeup = None
 
         # Defines a function to be run in a separate thread to run the event loop
         # this enables our synchronous interface without locks
@@ -110,8 +175,57 @@ class StreamManagerClient:
         self.__event_loop_thread = Thread(target=run_event_loop, args=(self.__loop,), daemon=True)
         self.__event_loop_thread.start()
 
-        self.connected = False
-        UtilInternal.sync(self.__connect(), loop=self.__loop)
+        # Submits the work of all the calling threads to the event loop
+        self.__submitter = LoopSubmitter(self.__loop)
+
+    def __check_fork(self):
+        # A forked child inherits the client, but not the thread running its event loop, and shares the socket
+        # with its parent. Give the child its own event loop, the connection is opened by the next request.
+        if self.__pid == os.getpid():
+            return
+        with self.__fork_lock:
+            if self.__pid == os.getpid():
+                return
+            self.logger.debug("Process was forked, starting a new event loop in process %d", os.getpid())
+            if self.__writer is not None:
+                self.__release_inherited_socket(self.__writer)
+            self.__requests = {}
+            self.__large_message_locks = {}
+            self.__time_indexes = {}
+            self.__start_event_loop()
+
+    @staticmethod
+    def __release_inherited_socket(writer: asyncio.StreamWriter):
+        # Point this process' descriptor of the parent's socket at /dev/null. The parent's connection is left alone,
+        # and the descriptor stays valid until the abandoned transport gets around to closing it.
+        sock = writer.get_extra_info("socket")
+        if sock is None:
+            return
+        try:
+            devnull = os.open(os.devnull, os.O_RDWR)
+            try:
+                os.dup2(devnull, sock.fileno())
+            finally:
+                os.close(devnull)
+        except OSError:
+            pass
+
+    @classmethod
+    def for_process(cls, **kwargs) -> "StreamManagerClient":
+        """
+        Get a client which is shared by everything running in the current process, creating it on first use.
+        Meant for :class:`concurrent.futures.ProcessPoolExecutor` and :mod:`multiprocessing` workers, which should
+        call it from their tasks or initializer rather than use a client created by the parent process.
+
+        :param kwargs: Arguments of :class:`StreamManagerClient`. Calls with different arguments get different clients.
+        :return: The client of the current process for these arguments.
+        """
+        key = (os.getpid(), tuple(sorted(kwargs.items())))
+        with cls.__process_clients_lock:
+            client = cls.__process_clients.get(key)
+            if client is None or client.__closed:
+                client = cls.__process_clients[key] = cls(**kwargs)
+            return client
 
     def __enter__(self):
         return self
@@ -120,12 +234,19 @@ class StreamManagerClient:
         self.close()
 
     async def _close(self):
+        self.__closed = True
         if self.__writer is not None:
-            self.__closed = True
             self.connected = False
             self.__reader = None
-            # Drain any existing data waiting to be sent
-            await self.__writer.drain()
+            # Send and drain any existing data waiting to be sent
+            waiters = self.__write_pending(self.__writer)
+            try:
+                await self.__writer.drain()
+            finally:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(self.__closed_exception())
+                self.__fail_requests()
             self.__writer.close()
             try:
                 # Only added in Python 3.7, so try to call it, but otherwise just skip it
@@ -133,6 +254,37 @@ class StreamManagerClient:
             except AttributeError:
                 pass
             self.__writer = None
+            # Let the write loop exit
+            self.__write_wakeup.set()
+            # Including the requests which queued their frame while the connection was closing
+            self.__fail_requests()
+            # Let the failed requests return to their callers before close stops the event loop
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if tasks:
+                await asyncio.wait(tasks, timeout=self.request_timeout)
+
+    def __fail_requests(self):
+        # No response can be read anymore, so fail the requests which are queued or sent rather than leave them
+        # waiting on an event loop which is about to stop
+        waiters = self.__pending_write_waiters
+        self.__pending_writes, self.__pending_write_waiters = [], []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(self.__closed_exception())
+        for responses in self.__requests.values():
+            if responses.empty():
+                responses.put_nowait(self.__closed_exception())
+
+    @staticmethod
+    def __closed_exception():
+        return StreamManagerException("Client was closed before the response to the request was read")
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether :meth:`close` was called.
+        """
+        return self.__closed
 
     def __check_closed(self):
         if self.__closed:
@@ -143,41 +295,92 @@ class StreamManagerClient:
         if self.connected:
             return
         try:
-            self.logger.debug("Opening connection to %s:%d", self.host, self.port)
-            future = asyncio.open_connection(self.host, self.port)
+            if self.socket_path is not None:
+                self.logger.debug("Opening connection to %s", self.socket_path)
+                future = asyncio.open_unix_connection(self.socket_path)
+            else:
+                self.logger.debug("Opening connection to %s:%d", self.host, self.port)
+                future = asyncio.open_connection(self.host, self.port)
             self.__reader, self.__writer = await asyncio.wait_for(
                 future, timeout=self.connect_timeout
             )
+            if self.write_buffer_high_water is not None or self.write_buffer_low_water is not None:
+                self.__writer.transport.set_write_buffer_limits(
+                    high=self.write_buffer_high_water, low=self.write_buffer_low_water
+                )
 
             await asyncio.wait_for(self.__connect_request_response(), timeout=self.request_timeout)
 
-            self.logger.debug("Socket connected successfully. Starting read loop.")
+            self.logger.debug("Socket connected successfully. Starting read and write loops.")
             self.connected = True
+            if self.__write_wakeup is not None:
+                # Wake up the write loop of the previous connection so that it exits
+                self.__write_wakeup.set()
+            self.__write_wakeup = asyncio.Event()
             self.__loop.create_task(self.__read_loop())
+            self.__loop.create_task(self.__write_loop(self.__writer, self.__write_wakeup))
+            if self.__pending_writes:
+                # Frames which were queued while reconnecting are sent without waiting for another request
+                self.__write_wakeup.set()
         except ConnectionError as e:
             self.logger.error("Connection error while connecting to server: %s", e)
             raise
 
+    def __write_pending(self, writer):
+        buffers, waiters = self.__pending_writes, self.__pending_write_waiters
+        if not buffers:
+            return []
+        self.__pending_writes, self.__pending_write_waiters = [], []
+        try:
+            writer.writelines(buffers)
+        except Exception as e:
+            self.__settle_writes(waiters, e)
+            return []
+        return waiters
+
+    @staticmethod
+    def __settle_writes(waiters, error: Optional[BaseException] = None):
+        for waiter in waiters:
+            if not waiter.done():
+                if error is not None:
+                    waiter.set_exception(error)
+                else:
+                    waiter.set_result(None)
+
+    async def __write_loop(self, writer, wakeup: asyncio.Event):
+        # Sends every frame which was queued since the last send with a single write and a single drain,
+        # rather than one write and drain per request
+        while not self.__closed:
+            await wakeup.wait()
+            wakeup.clear()
+            if writer is not self.__writer:
+                return
+            waiters = self.__write_pending(writer)
+            try:
+                await writer.drain()
+            except Exception as e:
+                self.__settle_writes(waiters, e)
+            else:
+                self.__settle_writes(waiters)
+
+    async def __write_frame(self, frame: MessageFrame):
+        self.__pending_writes.extend(UtilInternal.encode_frame(frame))
+        waiter = self.__loop.create_future()
+        self.__pending_write_waiters.append(waiter)
+        self.__write_wakeup.set()
+        await waiter
+
     def __log_trace(self, *args, **kwargs):
         self.logger.log(5, *args, **kwargs)
 
     async def __read_message_frame(self):
-        length_bytes = await self.__reader.read(n=4)
-        if len(length_bytes) == 0:
-            raise asyncio.IncompleteReadError(length_bytes, 4)
-
-        length = UtilInternal.int_from_bytes(length_bytes)
-        operation = UtilInternal.int_from_bytes(await self.__reader.read(n=1))
-
-        # Read from the socket until we have read the full packet
-        payload = bytearray()
-        read_bytes = 1
-        while read_bytes < length:
-            next_payload = await self.__reader.read(n=length - read_bytes)
-            if len(next_payload) == 0:
-                raise asyncio.IncompleteReadError(next_payload, length - read_bytes)
-            payload.extend(next_payload)
-            read_bytes += len(next_payload)
+        # close drops the reader while a frame may be half read, the frame is then cut short by the closed connection
+        reader = self.__reader
+        length = UtilInternal.int_from_bytes(await reader.readexactly(4))
+        operation = UtilInternal.int_from_bytes(await reader.readexactly(1))
+
+        # Read the full packet in one go so that the payload is only copied once out of the stream buffer
+        payload = await reader.readexactly(length - 1)
 
         try:
             op = Operation.from_dict(operation)
@@ -185,7 +388,7 @@ class StreamManagerClient:
             self.logger.error("Found unknown operation %d", operation)
             op = Operation.Unknown
 
-        return MessageFrame(operation=op, payload=bytes(payload))
+        return MessageFrame(operation=op, payload=payload)
 
     async def __read_loop(self):
         # Continually try to read packets from the socket
@@ -210,48 +413,25 @@ class StreamManagerClient:
                         pass
                     return
 
-                payload = cbor2.loads(response.payload)
-                await self.__handle_read_response(payload, response)
+                await self.__handle_read_response(response)
             except Exception:
                 self.logger.exception("Unhandled exception occurred")
                 return
 
-    async def __handle_read_response(self, payload, response):
-        if response.operation == Operation.ReadMessagesResponse:
-            response = ReadMessagesResponse.from_dict(payload)
-            self.logger.debug("Received ReadMessagesResponse from server")
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.CreateMessageStreamResponse:
-            response = CreateMessageStreamResponse.from_dict(payload)
-            self.logger.debug("Received CreateMessageStreamResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.DeleteMessageStreamResponse:
-            response = DeleteMessageStreamResponse.from_dict(payload)
-            self.logger.debug("Received DeleteMessageStreamResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.UpdateMessageStreamResponse:
-            response = UpdateMessageStreamResponse.from_dict(payload)
-            self.logger.debug("Received UpdateMessageStreamResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.AppendMessageResponse:
-            response = AppendMessageResponse.from_dict(payload)
-            self.logger.debug("Received AppendMessageResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.ListStreamsResponse:
-            response = ListStreamsResponse.from_dict(payload)
-            self.logger.debug("Received ListStreamsResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.DescribeMessageStreamResponse:
-            response = DescribeMessageStreamResponse.from_dict(payload)
-            self.logger.debug("Received DescribeMessageStreamResponse from server: %s", response)
-            await self.__requests[response.request_id].put(response)
-        elif response.operation == Operation.UnknownOperationError:
+    async def __handle_read_response(self, response):
+        if response.operation == Operation.UnknownOperationError:
             self.logger.error(
                 "Received response with unsupported operation from server: %s. "
                 "You should update your server version",
                 response.operation,
             )
-            response = UnknownOperationError.from_dict(payload)
+            response = ResponseDecoder.decode(response.operation, response.payload)
+            await self.__requests[response.request_id].put(response)
+        elif ResponseDecoder.can_decode(response.operation):
+            # Decode straight from the frame bytes into the response object
+            response = ResponseDecoder.decode(response.operation, response.payload)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Received %s from server: %s", type(response).__name__, response)
             await self.__requests[response.request_id].put(response)
         elif response.operation == Operation.Unknown:
             self.logger.error("Received response with unknown operation from server: %s", response)
@@ -323,6 +503,9 @@ class StreamManagerClient:
         async def inner(operation, data):
             if data.request_id is None:
                 data.request_id = UtilInternal.get_request_id()
+            span = _request_span.get()
+            if span is not None:
+                span.add_request_id(data.request_id)
 
             validation = UtilInternal.is_invalid(data)
             if validation:
@@ -334,16 +517,15 @@ class StreamManagerClient:
 
             self.__requests[data.request_id] = asyncio.Queue(1)
 
-            # Write request to socket
-            frame = MessageFrame(operation=operation, payload=cbor2.dumps(data.as_dict()))
-            for b in UtilInternal.encode_frame(frame):
-                self.__writer.write(b)
-            await self.__writer.drain()
+            # Queue the request for the write loop
+            await self.__write_frame(MessageFrame(operation=operation, payload=cbor2.dumps(data.as_dict())))
 
             # Wait for reader to come back with the response
             result = await self.__requests[data.request_id].get()
             # Drop async queue from request map
             del self.__requests[data.request_id]
+            if isinstance(result, StreamManagerException):
+                raise result
             if isinstance(result, MessageFrame) and result.operation == Operation.Unknown:
                 raise ClientException("Received response with unknown operation from server")
             return result
@@ -374,7 +556,7 @@ class StreamManagerClient:
                     "read_timeout_millis must be less than or equal to the client's request_timeout"
                 )
 
-    async def _append_message(self, stream_name: str, data: bytes) -> int:
+    async def __append_one(self, stream_name: str, data: bytes) -> int:
         append_message_request = AppendMessageRequest(name=stream_name, payload=data)
         append_message_response = await self.__send_and_receive(
             Operation.AppendMessage, data=append_message_request
@@ -383,9 +565,44 @@ class StreamManagerClient:
         UtilInternal.raise_on_error_response(append_message_response)
         return append_message_response.sequence_number
 
+    async def _append_message(self, stream_name: str, data: bytes) -> int:
+        if self.large_message_threshold is not None and (
+            len(data) > self.large_message_threshold or ChunkHeader.decode(data) is not None
+        ):
+            # A payload which looks like a chunk is wrapped in a chunk of its own, so that it is read back as it is
+            return await self.__append_large_message(stream_name, data)
+
+        entry = self.__large_message_locks.get(stream_name)
+        if entry is not None:
+            # Keep the chunks of a large message which is being appended to the same stream together
+            async with entry[0]:
+                return await self.__append_one(stream_name, data)
+        return await self.__append_one(stream_name, data)
+
+    async def __append_large_message(self, stream_name: str, data: bytes) -> int:
+        # [lock, number of large appends holding or waiting for it], removed once no large append uses it
+        entry = self.__large_message_locks.get(stream_name)
+        if entry is None:
+            entry = self.__large_message_locks[stream_name] = [asyncio.Lock(), 0]
+
+        # Readers reassemble chunks by object id, but chunks which are not interleaved with other messages are
+        # read back with fewer requests, so large messages to the same stream are appended one at a time
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                sequence_number = None
+                for chunk in split_payload(data, self.large_message_threshold):
+                    sequence_number = await self.__append_one(stream_name, chunk)
+                return sequence_number
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self.__large_message_locks.get(stream_name) is entry:
+                del self.__large_message_locks[stream_name]
+
     async def _create_message_stream(self, definition: MessageStreamDefinition) -> None:
         if not isinstance(definition, MessageStreamDefinition):
             raise ValidationException("definition argument to create_stream must be a MessageStreamDefinition object")
+        self.__time_indexes.pop(definition.name, None)
         create_stream_request = CreateMessageStreamRequest(definition=definition)
         create_stream_response = await self.__send_and_receive(
             Operation.CreateMessageStream, data=create_stream_request
@@ -394,6 +611,7 @@ class StreamManagerClient:
         UtilInternal.raise_on_error_response(create_stream_response)
 
     async def _delete_message_stream(self, stream_name: str) -> None:
+        self.__time_indexes.pop(stream_name, None)
         delete_stream_request = DeleteMessageStreamRequest(name=stream_name)
         delete_stream_response = await self.__send_and_receive(
             Operation.DeleteMessageStream, data=delete_stream_request
@@ -413,8 +631,7 @@ class StreamManagerClient:
 
         UtilInternal.raise_on_error_response(update_stream_response)
 
-    async def _read_messages(self, stream_name: str, options: ReadMessagesOptions = None) -> List[Message]:
-        self.__validate_read_message_options(options)
+    async def __read_batch(self, stream_name: str, options: Optional[ReadMessagesOptions]) -> MessageBatch:
         read_messages_request = ReadMessagesRequest(stream_name=stream_name, read_messages_options=options)
         read_messages_response = await self.__send_and_receive(
             Operation.ReadMessages, data=read_messages_request
@@ -423,6 +640,95 @@ class StreamManagerClient:
         UtilInternal.raise_on_error_response(read_messages_response)
         return read_messages_response.messages
 
+    def __chunk_read_options(self, start_sequence_number: int, remaining_chunks: int, read_timeout_millis: int):
+        max_chunks = max(1, MAX_CHUNK_READ_BYTES // self.large_message_threshold)
+        return ReadMessagesOptions(
+            desired_start_sequence_number=start_sequence_number,
+            min_message_count=1,
+            max_message_count=min(remaining_chunks, max_chunks),
+            read_timeout_millis=read_timeout_millis,
+        )
+
+    async def _read_messages(self, stream_name: str, options: ReadMessagesOptions = None) -> MessageBatch:
+        self.__validate_read_message_options(options)
+        batch = await self.__read_batch(stream_name, options)
+        if self.large_message_threshold is None:
+            return batch
+
+        # Replace the chunks of large messages by the reassembled messages, reading on until the large messages
+        # of the batch are complete and there are enough messages once the chunks are reassembled.
+        options = options if options is not None else ReadMessagesOptions()
+        min_message_count = options.min_message_count if options.min_message_count is not None else 1
+        reader = ChunkedReader(stream_name, self.logger)
+        reader.add_batch(batch)
+        while reader.pending or len(reader) < min_message_count:
+            try:
+                reader.add_batch(
+                    await self.__read_batch(
+                        stream_name,
+                        self.__chunk_read_options(
+                            reader.last_sequence_number + 1,
+                            max(reader.remaining, min_message_count - len(reader)),
+                            options.read_timeout_millis or 0,
+                        ),
+                    )
+                )
+            except NotEnoughMessagesException:
+                break
+        # The server returns as many messages as min_message_count when no max_message_count is given
+        batch = reader.result(
+            options.max_message_count if options.max_message_count is not None else min_message_count
+        )
+        if len(batch) < min_message_count:
+            raise NotEnoughMessagesException(
+                "Only {} complete messages are available in stream {}, {} were requested".format(
+                    len(batch), stream_name, min_message_count
+                )
+            )
+        return batch
+
+    async def _read_large_message(self, stream_name: str, sequence_number: int, sink) -> int:
+        batch = await self.__read_batch(
+            stream_name,
+            ReadMessagesOptions(
+                desired_start_sequence_number=sequence_number, min_message_count=1, max_message_count=1
+            ),
+        )
+        header = ChunkHeader.decode(batch.payload(0))
+        if header is None:
+            sink.write(batch.payload(0))
+            return batch.sequence_numbers[0]
+        if header.index != 0:
+            raise ValidationException(
+                "Message at sequence number {} is not the start of a large message".format(batch.sequence_numbers[0])
+            )
+
+        assembler = ChunkAssembler(header, batch.sequence_numbers[0], batch.ingest_times[0], sink=sink)
+        assembler.add(batch.sequence_numbers[0], batch.payload(0))
+        while not assembler.complete:
+            batch = await self.__read_batch(
+                stream_name, self.__chunk_read_options(batch.sequence_numbers[-1] + 1, assembler.remaining, 0)
+            )
+            for chunk_sequence_number, payload in zip(batch.sequence_numbers, batch.payloads()):
+                header = ChunkHeader.decode(payload)
+                if header is None or header.object_id != assembler.header.object_id:
+                    # Appended by another client in between the chunks
+                    continue
+                if not assembler.accepts(header):
+                    raise ClientException(
+                        "Large message starting at sequence number {} is incomplete, found chunk {} at sequence "
+                        "number {}".format(assembler.first_sequence_number, header.index, chunk_sequence_number)
+                    )
+                assembler.add(chunk_sequence_number, payload)
+                if assembler.complete:
+                    break
+            if not assembler.complete and assembler.expired(batch.sequence_numbers[-1]):
+                raise ClientException(
+                    "Large message starting at sequence number {} is incomplete, its missing chunks were not "
+                    "found".format(assembler.first_sequence_number)
+                )
+        return assembler.last_sequence_number
+
     async def _list_streams(self) -> List[str]:
         list_streams_response = await self.__send_and_receive(
             Operation.ListStreams, data=ListStreamsRequest()
@@ -439,10 +745,88 @@ class StreamManagerClient:
 
         return describe_message_stream_response.message_stream_info
 
+    async def __probe(self, stream_name: str, sequence_number: int) -> MessageBatch:
+        # Read the message at sequence_number, or the oldest message if it was removed from the stream since
+        batch = await self.__read_batch(
+            stream_name,
+            ReadMessagesOptions(
+                desired_start_sequence_number=sequence_number, min_message_count=1, max_message_count=1
+            ),
+        )
+        if batch.ingest_times[0] == _NO_INGEST_TIME:
+            raise ClientException("Message at sequence number {} has no ingest time".format(batch.sequence_numbers[0]))
+        index = self.__time_indexes.get(stream_name)
+        if index is not None:
+            index.add(batch.sequence_numbers[0], batch.ingest_times[0])
+        return batch
+
+    async def _seek_by_time(self, stream_name: str, timestamp_ms: int) -> int:
+        if not isinstance(timestamp_ms, int) or isinstance(timestamp_ms, bool):
+            raise ValidationException("timestamp_ms argument to seek_by_time must be an int")
+        storage_status = (await self._describe_message_stream(stream_name)).storage_status
+        oldest = storage_status.oldest_sequence_number
+        end = storage_status.newest_sequence_number + 1 if storage_status.newest_sequence_number is not None else 0
+        if oldest is None or oldest >= end:
+            return end
+
+        index = self.__time_indexes.get(stream_name)
+        if index is None or not index.trim(oldest, end - 1):
+            index = self.__time_indexes[stream_name] = StreamTimeIndex()
+        low, high = index.bounds(timestamp_ms, oldest, end)
+        while low < high:
+            middle = (low + high) // 2
+            batch = await self.__probe(stream_name, middle)
+            sequence_number, ingest_time = batch.sequence_numbers[0], batch.ingest_times[0]
+            if ingest_time < timestamp_ms:
+                low = sequence_number + 1
+            elif sequence_number > middle:
+                # The messages before it were removed from the stream during the search
+                low = high = sequence_number
+            else:
+                high = middle
+
+        if self.large_message_threshold is not None and low < end:
+            # Start at the first chunk of a large message, read_messages skips a large message which starts earlier
+            batch = await self.__probe(stream_name, low)
+            header = ChunkHeader.decode(batch.payload(0))
+            if header is not None and header.index != 0 and batch.sequence_numbers[0] - header.index >= oldest:
+                # The first chunk is only index messages earlier if no other client appended in between
+                first = batch.sequence_numbers[0] - header.index
+                batch = await self.__probe(stream_name, first)
+                first_header = ChunkHeader.decode(batch.payload(0))
+                if (
+                    batch.sequence_numbers[0] == first
+                    and first_header is not None
+                    and first_header.index == 0
+                    and first_header.object_id == header.object_id
+                ):
+                    low = first
+        return low
+
+    def __get_codec(self, stream_name: str) -> Codec:
+        codec = self.__codecs.get(stream_name)
+        if codec is None:
+            raise ValidationException("No codec is registered for stream {}".format(stream_name))
+        return codec
+
+    def __in_span(self, coroutine):
+        # The request runs on the event loop thread, where the span of the calling thread is not current
+        span = current_span()
+        if span is None:
+            return coroutine
+        return self.__run_in_span(span, coroutine)
+
+    @staticmethod
+    async def __run_in_span(span, coroutine):
+        # Every task has its own context, so the span is only seen by the requests of this call
+        _request_span.set(span)
+        return await coroutine
+
     ####################
     #    PUBLIC API    #
     ####################
-    def read_messages(self, stream_name: str, options: Optional[ReadMessagesOptions] = None) -> List[Message]:
+    @traced("streammanager.read_messages", lambda stream_name, options=None: {"target": stream_name})
+    def read_messages(self, stream_name: str, options: Optional[ReadMessagesOptions] = None) -> MessageBatch:
         """
         Read message(s) from a chosen stream with options. If no options are specified it will try to read
         1 message from the stream.
@@ -459,19 +843,55 @@ class StreamManagerClient:
             If desired_start_sequence_number is specified in the options and is less
             than the current beginning of the stream, returned messages will start
             at the beginning of the stream and not necessarily the desired_start_sequence_number.
-        :return: List of at least 1 message.
+
+            If the client has a ``large_message_threshold``, the chunks of a large message are returned as a single
+            message with the sequence number of its last chunk and count as one message, for min_message_count and
+            max_message_count as well. Chunks of a large message which is not complete yet are not returned, nor are
+            the messages after its first chunk, and neither are chunks of a large message which started before
+            desired_start_sequence_number. When the chunks of large messages are interleaved with other messages,
+            more than max_message_count messages may be returned so that the next read does not skip any.
+        :return: :class:`~.messagebatch.MessageBatch` of at least 1 message. The batch is a sequence of
+            :class:`~.data.Message` which are built on access; sequence numbers, ingest times and payloads
+            can be read from it directly without building the messages.
         :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
         :raises: :exc:`asyncio.TimeoutError` if the request times out.
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._read_messages(stream_name, options), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._read_messages(stream_name, options)))
 
+    @traced("streammanager.read_large_message", lambda stream_name, sequence_number, sink: {"target": stream_name})
+    def read_large_message(self, stream_name: str, sequence_number: int, sink) -> int:
+        """
+        Read a message which was split by :meth:`append_message` and write its data to a sink as the chunks are
+        read, without holding the whole message in memory. A message which was not split is written as it is.
+
+        :param stream_name: The name of the stream to read from.
+        :param sequence_number: The sequence number of the first chunk of the message.
+        :param sink: Writable file-like object, such as an open file or :class:`io.BytesIO`, which receives the data.
+        :return: Sequence number of the last chunk of the message.
+        :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
+        :raises: :exc:`asyncio.TimeoutError` if the request times out.
+        :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
+        """
+        self.__check_closed()
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._read_large_message(stream_name, sequence_number, sink)))
+
+    @traced(
+        "streammanager.append_message",
+        lambda stream_name, data: {"target": stream_name, "payload_size": payload_size(data)},
+    )
     def append_message(self, stream_name: str, data: bytes) -> int:
         """
         Append a message into the specified message stream. Returns the sequence number of the message
         if it was successfully appended.
 
+        If the client has a ``large_message_threshold`` and the data is larger than it, the data is appended
+        as chunk messages and the sequence number of the last chunk is returned. Data which starts with a chunk
+        header is appended as a single chunk, so that it is read back unchanged.
+
         :param stream_name: The name of the stream to append to.
         :param data: Bytes type data.
         :return: Sequence number that the message was assigned if it was appended.
@@ -480,8 +900,10 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._append_message(stream_name, data), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._append_message(stream_name, data)))
 
+    @traced("streammanager.create_message_stream", lambda definition: {"target": getattr(definition, "name", None)})
     def create_message_stream(self, definition: MessageStreamDefinition) -> None:
         """
         Create a message stream with a given definition.
@@ -493,8 +915,10 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._create_message_stream(definition), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._create_message_stream(definition)))
 
+    @traced("streammanager.delete_message_stream", lambda stream_name: {"target": stream_name})
     def delete_message_stream(self, stream_name: str) -> None:
         """
         Deletes a message stream based on its name. Nothing is returned if the request succeeds,
@@ -507,8 +931,10 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._delete_message_stream(stream_name), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._delete_message_stream(stream_name)))
 
+    @traced("streammanager.update_message_stream", lambda definition: {"target": getattr(definition, "name", None)})
     def update_message_stream(self, definition: MessageStreamDefinition) -> None:
         """
         Updates a message stream based on a given definition.
@@ -521,8 +947,10 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._update_message_stream(definition), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._update_message_stream(definition)))
 
+    @traced("streammanager.list_streams")
     def list_streams(self) -> List[str]:
         """
         List the streams in StreamManager. Returns a list of their names.
@@ -533,8 +961,10 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._list_streams(), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._list_streams()))
 
+    @traced("streammanager.describe_message_stream", lambda stream_name: {"target": stream_name})
     def describe_message_stream(self, stream_name: str) -> MessageStreamInfo:
         """
         Describe a message stream to get metadata including the stream's definition,
@@ -547,7 +977,81 @@ class StreamManagerClient:
         :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
         """
         self.__check_closed()
-        return UtilInternal.sync(self._describe_message_stream(stream_name), loop=self.__loop)
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._describe_message_stream(stream_name)))
+
+    def register_codec(self, stream_name: str, codec: Optional[Codec]) -> None:
+        """
+        Set the codec which :meth:`append_object` and :meth:`read_objects` use for a stream.
+
+        :param stream_name: The name of the stream.
+        :param codec: :class:`~.codecs.Codec` of the stream, such as :class:`~.codecs.CborCodec`,
+            :class:`~.codecs.JsonCodec` or :class:`~.codecs.StructCodec`, or None to remove the codec of the stream.
+        """
+        if codec is None:
+            self.__codecs.pop(stream_name, None)
+        elif not isinstance(codec, Codec):
+            raise ValidationException("codec argument to register_codec must be a Codec object")
+        else:
+            self.__codecs[stream_name] = codec
+
+    def append_object(self, stream_name: str, obj) -> int:
+        """
+        Encode an object with the codec registered for the stream and append it as a message.
+
+        :param stream_name: The name of the stream to append to.
+        :param obj: The object to append.
+        :return: Sequence number that the message was assigned if it was appended.
+        :raises: :exc:`~.exceptions.ValidationException` if no codec is registered for the stream.
+        :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
+        :raises: :exc:`asyncio.TimeoutError` if the request times out.
+        :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
+        """
+        return self.append_message(stream_name, self.__get_codec(stream_name).encode(obj))
+
+    def read_objects(self, stream_name: str, options: Optional[ReadMessagesOptions] = None) -> DecodedBatch:
+        """
+        Read messages like :meth:`read_messages` and get the objects they hold with the codec registered for the
+        stream. Every message is decoded when its object is first accessed.
+
+        :param stream_name: The name of the stream to read from.
+        :param options: (Optional) Options used when reading from the stream, see :meth:`read_messages`.
+        :return: :class:`~.messagebatch.DecodedBatch` of at least 1 object.
+        :raises: :exc:`~.exceptions.ValidationException` if no codec is registered for the stream.
+        :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
+        :raises: :exc:`asyncio.TimeoutError` if the request times out.
+        :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
+        """
+        codec = self.__get_codec(stream_name)
+        return self.read_messages(stream_name, options).decode(codec)
+
+    @traced("streammanager.seek_by_time", lambda stream_name, timestamp_ms: {"target": stream_name})
+    def seek_by_time(self, stream_name: str, timestamp_ms: int) -> int:
+        """
+        Find where to start reading a stream to get the messages appended since a point in time, for instance to
+        replay the last 10 minutes of a stream with :meth:`read_messages`.
+
+        The sequence number is found with a binary search over single message reads between the oldest and newest
+        messages of the stream, so it takes a number of requests which grows with the logarithm of the stream length.
+        The ingest times which are read are kept in a sparse index of the stream, which narrows the next searches.
+        Ingest times are expected to not decrease along the stream, which holds unless the clock of the server is
+        moved back.
+
+        If the client has a ``large_message_threshold``, the sequence number of the first chunk of a large message
+        is returned rather than the sequence number of one of its chunks, as long as no other message was appended in
+        between its chunks.
+
+        :param stream_name: The name of the stream to search.
+        :param timestamp_ms: Time in milliseconds since the epoch, compared to the ``ingest_time`` of the messages.
+        :return: The sequence number of the first message with an ingest time at or after timestamp_ms, or the sequence
+            number which the next appended message will get if there is none.
+        :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
+        :raises: :exc:`asyncio.TimeoutError` if the request times out.
+        :raises: :exc:`ConnectionError` if the client is unable to reconnect to the server.
+        """
+        self.__check_closed()
+        self.__check_fork()
+        return self.__submitter.sync(self.__in_span(self._seek_by_time(stream_name, timestamp_ms)))
 
     def close(self):
         """
@@ -555,7 +1059,17 @@ class StreamManagerClient:
 
         :raises: :exc:`~.exceptions.StreamManagerException` and subtypes based on the precise error.
         """
+        if self.__pid != os.getpid():
+            with self.__fork_lock:
+                if self.__pid != os.getpid():
+                    # The client was inherited and never used in this process, so there is no connection or event
+                    # loop of its own to close
+                    if self.__writer is not None:
+                        self.__release_inherited_socket(self.__writer)
+                        self.__writer = None
+                    self.__closed = True
+                    return
         if not self.__closed:
-            UtilInternal.sync(self._close(), loop=self.__loop)
+            self.__submitter.sync(self._close())
         if not self.__loop.is_closed():
             self.__loop.call_soon_threadsafe(self.__loop.stop)
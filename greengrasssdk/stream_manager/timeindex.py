@@ -0,0 +1,70 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Tuple
+
+"""
+(Internal Only) Sparse index of the ingest times of stream messages, used to narrow time based seeks.
+
+Ingest times are assigned by the server as messages are appended, so they do not decrease along a stream and every
+known (sequence number, ingest time) pair bounds the position of a timestamp in the stream.
+"""
+
+# Entries kept per stream before the index is thinned out
+MAX_TIME_INDEX_ENTRIES = 4096
+
+
+class StreamTimeIndex:
+    """
+    Known ingest times of some messages of a stream, sorted by sequence number.
+    """
+
+    __slots__ = ["sequence_numbers", "ingest_times"]
+
+    def __init__(self):
+        self.sequence_numbers = array("q")
+        self.ingest_times = array("q")
+
+    def __len__(self):
+        return len(self.sequence_numbers)
+
+    def add(self, sequence_number: int, ingest_time: int) -> None:
+        position = bisect_left(self.sequence_numbers, sequence_number)
+        if position < len(self.sequence_numbers) and self.sequence_numbers[position] == sequence_number:
+            return
+        self.sequence_numbers.insert(position, sequence_number)
+        self.ingest_times.insert(position, ingest_time)
+        if len(self.sequence_numbers) > MAX_TIME_INDEX_ENTRIES:
+            # Every other entry still spreads over the whole stream
+            del self.sequence_numbers[1::2]
+            del self.ingest_times[1::2]
+
+    def bounds(self, timestamp_ms: int, low: int, high: int) -> Tuple[int, int]:
+        """
+        Narrow the range [low, high) which holds the first sequence number with an ingest time at or after
+        timestamp_ms, high meaning that no message in the range has one.
+        """
+        position = bisect_left(self.ingest_times, timestamp_ms)
+        if position > 0:
+            low = max(low, self.sequence_numbers[position - 1] + 1)
+        if position < len(self.ingest_times):
+            high = min(high, self.sequence_numbers[position])
+        return low, max(low, high)
+
+    def trim(self, oldest_sequence_number: int, newest_sequence_number: int) -> bool:
+        """
+        Drop the entries of messages which were removed from the stream.
+
+        :return: False if the index does not match the stream anymore, e.g. because the stream was recreated.
+        """
+        if len(self.sequence_numbers) and self.sequence_numbers[-1] > newest_sequence_number:
+            return False
+        position = bisect_left(self.sequence_numbers, oldest_sequence_number)
+        if position > 0:
+            del self.sequence_numbers[:position]
+            del self.ingest_times[:position]
+        return True
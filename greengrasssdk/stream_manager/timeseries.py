@@ -0,0 +1,488 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import struct
+from array import array
+from collections.abc import Mapping
+from reprlib import repr as limitedRepr
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .codecs import Codec
+from .exceptions import ClientException, ValidationException
+
+"""
+Compact encoding of time series, such as sensor readings, into self-describing blocks.
+
+A block holds the readings of one or more channels at the same timestamps:
+
+* a header with a magic marker, the format version, the number of channels, the number of points and the length
+  of the block in bytes,
+* the UTF-8 name of every channel,
+* the length in bytes of every column, the timestamps first,
+* the columns, each a bit stream starting on a byte boundary so that a channel is decoded without the others.
+
+Timestamps are delta-of-delta encoded, so readings taken at a regular interval take 1 bit per point. Values are
+XOR encoded against the previous value of the channel as in Facebook's Gorilla, so a value which did not change
+takes 1 bit and a slowly changing value a few bits of its mantissa. Blocks are delimited by their header, so a file
+of concatenated blocks, e.g. the input of an S3 export task, is decoded with :func:`decode_blocks`.
+"""
+
+_BLOCK_MAGIC = b"GGTS"
+_BLOCK_VERSION = 1
+_BLOCK_HEADER = struct.Struct(">4sBHII")
+_NAME_LENGTH = struct.Struct(">H")
+_COLUMN_LENGTH = struct.Struct(">I")
+
+_MASK_64 = (1 << 64) - 1
+# Timestamps, their deltas and deltas-of-deltas are decoded as signed 64 bit integers
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+# Bit length and control bits of the delta-of-delta buckets, after which the delta-of-delta takes 64 bits
+_DOD_BUCKETS = ((7, 0b10, 2), (9, 0b110, 3), (12, 0b1110, 4))
+_DOD_ESCAPE = 0b1111
+# Number of control bits and bit length of the delta-of-delta by bucket, the last one when no control bit is 0
+_DOD_CONTROLS = ((2, 7), (3, 9), (4, 12), (4, 64))
+
+# Bits read at once when decoding, enough for the longest encoded value and the offset of its first bit in a byte
+_WINDOW_BYTES = 11
+_WINDOW_BITS = _WINDOW_BYTES * 8
+
+
+class _BitWriter:
+    __slots__ = ["__buffer", "__bits", "__count"]
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.__bits = 0
+        self.__count = 0
+
+    def write(self, value: int, count: int):
+        # value must fit in count bits
+        self.__bits = (self.__bits << count) | value
+        self.__count += count
+        if self.__count >= 64:
+            remaining = self.__count & 7
+            self.__buffer += (self.__bits >> remaining).to_bytes(self.__count >> 3, "big")
+            self.__bits &= (1 << remaining) - 1
+            self.__count = remaining
+
+    def getvalue(self) -> bytes:
+        padding = -self.__count & 7
+        return bytes(self.__buffer) + (self.__bits << padding).to_bytes((self.__count + padding) >> 3, "big")
+
+
+def _signed(value: int, count: int) -> int:
+    return value - (1 << count) if value >> (count - 1) else value
+
+
+def _check_timestamps(timestamps: Sequence[int]):
+    try:
+        array("q", timestamps)
+    except OverflowError:
+        raise ValidationException("Timestamps must fit in a signed 64 bit integer")
+    if len(timestamps) < 2 or max(timestamps) - min(timestamps) < 1 << 62:
+        # Deltas and deltas-of-deltas of timestamps this close all fit in 64 bits
+        return
+    previous_delta = 0
+    for previous, timestamp in zip(timestamps, timestamps[1:]):
+        delta = timestamp - previous
+        if not _INT64_MIN <= delta <= _INT64_MAX:
+            raise ValidationException(
+                "Timestamps {} and {} are too far apart to be encoded".format(previous, timestamp)
+            )
+        if not _INT64_MIN <= delta - previous_delta <= _INT64_MAX:
+            raise ValidationException(
+                "Intervals between timestamps around {} vary too much to be encoded".format(previous)
+            )
+        previous_delta = delta
+
+
+def _encode_timestamps(timestamps: Sequence[int]) -> bytes:
+    _check_timestamps(timestamps)
+    writer = _BitWriter()
+    previous = previous_delta = None
+    for timestamp in timestamps:
+        if previous is None:
+            writer.write(timestamp & _MASK_64, 64)
+            previous, previous_delta = timestamp, 0
+            continue
+        delta = timestamp - previous
+        delta_of_delta = delta - previous_delta
+        previous, previous_delta = timestamp, delta
+        if delta_of_delta == 0:
+            writer.write(0, 1)
+            continue
+        for count, control, control_count in _DOD_BUCKETS:
+            if -(1 << (count - 1)) <= delta_of_delta < 1 << (count - 1):
+                writer.write((control << count) | (delta_of_delta & ((1 << count) - 1)), control_count + count)
+                break
+        else:
+            writer.write(_DOD_ESCAPE, 4)
+            writer.write(delta_of_delta & _MASK_64, 64)
+    return writer.getvalue()
+
+
+def _decode_timestamps(data, count: int) -> array:
+    timestamps = array("q")
+    if count == 0:
+        return timestamps
+    length = len(data) * 8
+    # Every point is decoded from a window of _WINDOW_BITS from its first bit, which always holds all of its bits
+    data = bytes(data) + bytes(_WINDOW_BYTES)
+    from_bytes = int.from_bytes
+    timestamp = _signed(from_bytes(data[:8], "big"), 64)
+    delta = 0
+    position = 64
+    timestamps.append(timestamp)
+    for _ in range(count - 1):
+        start = position >> 3
+        window = from_bytes(data[start : start + _WINDOW_BYTES], "big")
+        offset = _WINDOW_BITS - (position & 7)
+        if (window >> (offset - 1)) & 1:
+            # Count the control bits, then read the delta-of-delta which follows them
+            for control_count, count_bits in _DOD_CONTROLS:
+                if not (window >> (offset - control_count)) & 1:
+                    break
+            offset -= control_count + count_bits
+            delta += _signed((window >> offset) & ((1 << count_bits) - 1), count_bits)
+            position += control_count + count_bits
+        else:
+            position += 1
+        timestamp += delta
+        timestamps.append(timestamp)
+    if position > length:
+        raise ClientException("Time series block is corrupted")
+    return timestamps
+
+
+def _encode_values(values: Sequence[float]) -> bytes:
+    bits = array("Q")
+    bits.frombytes(array("d", values).tobytes())
+    writer = _BitWriter()
+    write = writer.write
+    previous = None
+    # No window of meaningful bits yet, the first changed value sets one
+    leading = trailing = 64
+    for value in bits:
+        if previous is None:
+            write(value, 64)
+            previous = value
+            continue
+        xor = value ^ previous
+        previous = value
+        if xor == 0:
+            write(0, 1)
+            continue
+        xor_leading = min(64 - xor.bit_length(), 31)
+        xor_trailing = (xor & -xor).bit_length() - 1
+        if xor_leading >= leading and xor_trailing >= trailing:
+            # The meaningful bits fit in the window of the previous value
+            write(0b10, 2)
+            write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = xor_leading, xor_trailing
+            meaningful = 64 - leading - trailing
+            # A length of 64 is written as 0
+            write((0b11 << 11) | (leading << 6) | (meaningful & 63), 13)
+            write(xor >> trailing, meaningful)
+    return writer.getvalue()
+
+
+def _decode_values(data, count: int) -> array:
+    values = array("d")
+    if count == 0:
+        return values
+    length = len(data) * 8
+    data = bytes(data) + bytes(_WINDOW_BYTES)
+    from_bytes = int.from_bytes
+    value = from_bytes(data[:8], "big")
+    position = 64
+    leading = trailing = 0
+    bits = array("Q", [value])
+    for _ in range(count - 1):
+        start = position >> 3
+        window = from_bytes(data[start : start + _WINDOW_BYTES], "big")
+        offset = _WINDOW_BITS - (position & 7)
+        if (window >> (offset - 1)) & 1:
+            if (window >> (offset - 2)) & 1:
+                leading = (window >> (offset - 7)) & 31
+                meaningful = ((window >> (offset - 13)) & 63) or 64
+                trailing = 64 - leading - meaningful
+                offset -= 13
+            else:
+                meaningful = 64 - leading - trailing
+                offset -= 2
+            offset -= meaningful
+            value ^= ((window >> offset) & ((1 << meaningful) - 1)) << trailing
+            position += _WINDOW_BITS - (position & 7) - offset
+        else:
+            position += 1
+        bits.append(value)
+    if position > length:
+        raise ClientException("Time series block is corrupted")
+    values.frombytes(bits.tobytes())
+    return values
+
+
+class TimeSeriesBlock:
+    """
+    Readings of one or more channels at the same timestamps, decoded from a block. Columns are only decoded when
+    they are first accessed.
+    """
+
+    __slots__ = ["channels", "__point_count", "__columns", "__timestamps", "__values"]
+
+    def __init__(self, channels: Tuple[str, ...], point_count: int, columns: List[memoryview]):
+        """
+        Use :meth:`decode` to get the block held by a payload.
+
+        :param channels: Names of the channels.
+        :param point_count: Number of readings of every channel.
+        :param columns: Encoded timestamps followed by the encoded values of every channel.
+        """
+        self.channels = channels
+        self.__point_count = point_count
+        self.__columns = columns
+        self.__timestamps = None
+        self.__values = {}
+
+    @staticmethod
+    def encode(timestamps: Sequence[int], columns: Mapping) -> bytes:
+        """
+        Encode readings into a block.
+
+        :param timestamps: Timestamp of every reading, e.g. in milliseconds since the epoch.
+        :param columns: Mapping of the name of every channel to its value at every timestamp.
+        :return: The block.
+        """
+        point_count = len(timestamps)
+        names = [name.encode("utf-8") for name in columns]
+        if len(names) > 0xFFFF:
+            raise ValidationException("A time series block holds at most {} channels".format(0xFFFF))
+        encoded = [_encode_timestamps(timestamps)]
+        for name, values in columns.items():
+            if len(values) != point_count:
+                raise ValidationException(
+                    "Channel {} has {} values for {} timestamps".format(name, len(values), point_count)
+                )
+            encoded.append(_encode_values(values))
+
+        parts = [b""]
+        for name in names:
+            parts.append(_NAME_LENGTH.pack(len(name)))
+            parts.append(name)
+        parts.extend(_COLUMN_LENGTH.pack(len(column)) for column in encoded)
+        parts.extend(encoded)
+        length = _BLOCK_HEADER.size + sum(len(part) for part in parts)
+        parts[0] = _BLOCK_HEADER.pack(_BLOCK_MAGIC, _BLOCK_VERSION, len(names), point_count, length)
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(payload) -> "TimeSeriesBlock":
+        """
+        Get the block at the start of a payload. The columns reference the payload, they are not copied.
+
+        :raises: :exc:`~.exceptions.ClientException` if the payload does not start with a block.
+        """
+        return _decode_block(memoryview(payload))[0]
+
+    def __len__(self):
+        return self.__point_count
+
+    @property
+    def timestamps(self) -> array:
+        """
+        ``array('q')`` of the timestamp of every reading.
+        """
+        if self.__timestamps is None:
+            self.__timestamps = _decode_timestamps(self.__columns[0], self.__point_count)
+        return self.__timestamps
+
+    def column(self, channel: str) -> array:
+        """
+        :return: ``array('d')`` of the values of the channel at every timestamp.
+        :raises: :exc:`KeyError` if the block has no such channel.
+        """
+        values = self.__values.get(channel)
+        if values is None:
+            try:
+                index = self.channels.index(channel)
+            except ValueError:
+                raise KeyError(channel)
+            values = self.__values[channel] = _decode_values(self.__columns[index + 1], self.__point_count)
+        return values
+
+    def columns(self) -> Dict[str, array]:
+        """
+        :return: Dictionary of the name of every channel to the ``array('d')`` of its values.
+        """
+        return {channel: self.column(channel) for channel in self.channels}
+
+    def __repr__(self):
+        return "<Class TimeSeriesBlock. channels: {}, size: {}>".format(limitedRepr(self.channels), len(self))
+
+
+def _decode_block(data: memoryview) -> Tuple[TimeSeriesBlock, int]:
+    if len(data) < _BLOCK_HEADER.size:
+        raise ClientException("Payload is not a time series block")
+    magic, version, channel_count, point_count, length = _BLOCK_HEADER.unpack_from(data)
+    if magic != _BLOCK_MAGIC or version != _BLOCK_VERSION or length > len(data):
+        raise ClientException("Payload is not a time series block")
+
+    offset = _BLOCK_HEADER.size
+    channels = []
+    for _ in range(channel_count):
+        (name_length,) = _NAME_LENGTH.unpack_from(data, offset)
+        offset += _NAME_LENGTH.size
+        channels.append(str(data[offset : offset + name_length], "utf-8"))
+        offset += name_length
+    column_lengths = []
+    for _ in range(channel_count + 1):
+        column_lengths.append(_COLUMN_LENGTH.unpack_from(data, offset)[0])
+        offset += _COLUMN_LENGTH.size
+    columns = []
+    for column_length in column_lengths:
+        columns.append(data[offset : offset + column_length])
+        offset += column_length
+    if offset != length:
+        raise ClientException("Time series block is corrupted")
+    return TimeSeriesBlock(tuple(channels), point_count, columns), length
+
+
+def decode_blocks(data) -> Iterator[TimeSeriesBlock]:
+    """
+    Iterate over the blocks of data made of concatenated blocks, such as a file exported to S3.
+    """
+    data = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        block, length = _decode_block(data[offset:])
+        offset += length
+        yield block
+
+
+def concatenate_blocks(blocks: Iterable[TimeSeriesBlock]) -> Tuple[array, Dict[str, array]]:
+    """
+    Join the readings of consecutive blocks, e.g. the blocks returned by one read.
+
+    :return: ``array('q')`` of the timestamps and dictionary of the name of every channel to the ``array('d')`` of
+        its values. Values of a channel which a block does not have are NaN.
+    """
+    timestamps = array("q")
+    columns = {}
+    for block in blocks:
+        for channel in block.channels:
+            if channel not in columns:
+                columns[channel] = array("d", [float("nan")]) * len(timestamps)
+        for channel, values in columns.items():
+            if channel in block.channels:
+                values.extend(block.column(channel))
+            else:
+                values.extend(array("d", [float("nan")]) * len(block))
+        timestamps.extend(block.timestamps)
+    return timestamps, columns
+
+
+class TimeSeriesCodec(Codec):
+    """
+    Codec of streams of time series blocks, for :meth:`~.streammanagerclient.StreamManagerClient.read_objects`,
+    which then returns :class:`TimeSeriesBlock` objects. Objects to encode are blocks or tuples of timestamps and
+    a mapping of channels to values, see :meth:`TimeSeriesBlock.encode`.
+    """
+
+    def encode(self, obj) -> bytes:
+        if isinstance(obj, TimeSeriesBlock):
+            return TimeSeriesBlock.encode(obj.timestamps, obj.columns())
+        timestamps, columns = obj
+        return TimeSeriesBlock.encode(timestamps, columns)
+
+    def decode(self, payload: memoryview) -> TimeSeriesBlock:
+        return TimeSeriesBlock.decode(payload)
+
+
+class TimeSeriesWriter:
+    """
+    Collects readings of a set of channels and appends them to a stream as time series blocks, one message per block.
+
+    :param client: The :class:`~.streammanagerclient.StreamManagerClient` to append with.
+    :param stream_name: The name of the stream to append to.
+    :param channels: Names of the channels.
+    :param max_points: Number of readings after which a block is appended. Default is 600, 10 minutes of readings
+        taken every second.
+    :param max_block_millis: (Optional) Time between the first and last readings of a block after which it is
+        appended, compared to the timestamps of the readings. Default is None, meaning only max_points is used.
+
+    Call :meth:`flush` or use the writer as a context manager to append the last readings.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream_name: str,
+        channels: Sequence[str],
+        max_points: int = 600,
+        max_block_millis: Optional[int] = None,
+    ):
+        if max_points < 1:
+            raise ValidationException("max_points must be at least 1")
+        self.client = client
+        self.stream_name = stream_name
+        self.channels = tuple(channels)
+        if len(set(self.channels)) != len(self.channels):
+            raise ValidationException("Channel names must be unique")
+        self.max_points = max_points
+        self.max_block_millis = max_block_millis
+        self.__lock = Lock()
+        self.__timestamps = array("q")
+        self.__values = [array("d") for _ in self.channels]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.flush()
+
+    def add(self, timestamp_ms: int, values) -> Optional[int]:
+        """
+        Add a reading of every channel.
+
+        :param timestamp_ms: Time of the readings, in milliseconds since the epoch.
+        :param values: Value of every channel, in the order of the channels or as a mapping of channel names to values.
+        :return: Sequence number of the message if a block was appended, otherwise None.
+        """
+        if isinstance(values, Mapping):
+            values = [values[channel] for channel in self.channels]
+        elif len(values) != len(self.channels):
+            raise ValidationException("Expected {} values, got {}".format(len(self.channels), len(values)))
+        with self.__lock:
+            self.__timestamps.append(timestamp_ms)
+            for column, value in zip(self.__values, values):
+                column.append(value)
+            if len(self.__timestamps) >= self.max_points or (
+                self.max_block_millis is not None
+                and self.__timestamps[-1] - self.__timestamps[0] >= self.max_block_millis
+            ):
+                return self.__flush()
+        return None
+
+    def flush(self) -> Optional[int]:
+        """
+        Append the readings which were added since the last block.
+
+        :return: Sequence number of the message if a block was appended, None if there were no readings.
+        """
+        with self.__lock:
+            return self.__flush()
+
+    def __flush(self) -> Optional[int]:
+        if not self.__timestamps:
+            return None
+        block = TimeSeriesBlock.encode(self.__timestamps, dict(zip(self.channels, self.__values)))
+        sequence_number = self.client.append_message(self.stream_name, block)
+        self.__timestamps = array("q")
+        self.__values = [array("d") for _ in self.channels]
+        return sequence_number
@@ -4,8 +4,10 @@ SPDX-License-Identifier: Apache-2.0
 """
 
 import asyncio
+import collections
 import json
 import re
+import threading
 import uuid
 from typing import Sequence
 
@@ -28,6 +30,85 @@ from .exceptions import (
 )
 
 
+class _Waiter:
+    """
+    Hands the outcome of a task on the event loop to the thread waiting for it. Lighter than a
+    concurrent.futures.Future as there is exactly one waiter and no callbacks.
+    """
+
+    __slots__ = ["__lock", "__result", "__exception"]
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__lock.acquire()
+        self.__result = None
+        self.__exception = None
+
+    def set_exception(self, exception):
+        self.__exception = exception
+        self.__lock.release()
+
+    def set_from_task(self, task: asyncio.Future):
+        if task.cancelled():
+            self.__exception = asyncio.CancelledError()
+        else:
+            self.__exception = task.exception()
+            if self.__exception is None:
+                self.__result = task.result()
+        self.__lock.release()
+
+    def result(self):
+        self.__lock.acquire()
+        if self.__exception is not None:
+            raise self.__exception
+        return self.__result
+
+
+class LoopSubmitter:
+    """
+    Runs coroutines submitted from other threads on an event loop and waits for their results.
+
+    Unlike ``asyncio.run_coroutine_threadsafe``, which wakes the loop up once per call, submissions are
+    queued and a single wake up of the loop starts every coroutine queued until it runs. Many producer
+    threads therefore cost one wake up per loop iteration instead of contending on the loop's self-pipe.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.__loop = loop
+        self.__lock = threading.Lock()
+        self.__pending = collections.deque()
+        self.__wakeup_scheduled = False
+
+    def sync(self, coro):
+        if not asyncio.iscoroutine(coro):
+            return coro
+
+        waiter = _Waiter()
+        with self.__lock:
+            self.__pending.append((coro, waiter))
+            schedule = not self.__wakeup_scheduled
+            self.__wakeup_scheduled = True
+        if schedule:
+            try:
+                self.__loop.call_soon_threadsafe(self.__start_pending)
+            except RuntimeError as e:
+                # The loop is closed, fail everything which was waiting for this wake up
+                with self.__lock:
+                    pending, self.__pending = self.__pending, collections.deque()
+                    self.__wakeup_scheduled = False
+                for pending_coro, pending_waiter in pending:
+                    pending_coro.close()
+                    pending_waiter.set_exception(e)
+        return waiter.result()
+
+    def __start_pending(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, collections.deque()
+            self.__wakeup_scheduled = False
+        for coro, waiter in pending:
+            self.__loop.create_task(coro).add_done_callback(waiter.set_from_task)
+
+
 class UtilInternal:
     __ENDIAN = "big"
     _MAX_PACKET_SIZE = 1 << 30
@@ -0,0 +1,68 @@
+#
+# Copyright 2010-2016 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+import os
+
+# The packages of the Greengrass Core, greengrass_common and greengrass_ipc_python_sdk, are only installed on a core.
+# Elsewhere, e.g. when functions are tested with an IPCSimulator, the ARNs are read from the environment like the core
+# does, with the ARNs of the core's system functions as defaults, and there is no IPC client.
+try:
+    from greengrass_common.env_vars import MY_FUNCTION_ARN, ROUTER_FUNCTION_ARN, SHADOW_FUNCTION_ARN
+except ImportError:
+    MY_FUNCTION_ARN = os.environ.get('MY_FUNCTION_ARN')
+    ROUTER_FUNCTION_ARN = os.environ.get('ROUTER_FUNCTION_ARN', 'arn:aws:lambda:::function:GGRouter')
+    SHADOW_FUNCTION_ARN = os.environ.get('SHADOW_FUNCTION_ARN', 'arn:aws:lambda:::function:GGShadowService')
+
+try:
+    from greengrass_common.env_vars import SECRETS_MANAGER_FUNCTION_ARN
+except ImportError:
+    SECRETS_MANAGER_FUNCTION_ARN = os.environ.get(
+        'SECRETS_MANAGER_FUNCTION_ARN', 'arn:aws:lambda:::function:GGSecretManager'
+    )
+
+try:
+    from greengrass_common.function_arn_fields import FunctionArnFields
+except ImportError:
+    class FunctionArnFields(object):
+        """
+        Splits a function ARN, arn:aws:lambda:region:account-id:function:name[:qualifier], into the unqualified ARN
+        and the qualifier.
+        """
+
+        def __init__(self, function_arn):
+            fields = function_arn.split(':')
+            if len(fields) not in (7, 8) or fields[0] != 'arn' or fields[5] != 'function':
+                raise ValueError('Cannot parse given string as a function ARN: {}'.format(function_arn))
+            self.unqualified_arn = ':'.join(fields[:7])
+            self.qualifier = fields[7] if len(fields) == 8 else ''
+
+        @staticmethod
+        def build_function_arn(unqualified_arn, qualifier=None):
+            if qualifier:
+                return '{}:{}'.format(unqualified_arn, qualifier)
+            return unqualified_arn
+
+
+try:
+    from greengrass_ipc_python_sdk.ipc_client import IPCClient, IPCException
+except ImportError:
+    IPCClient = None
+
+    class IPCException(Exception):
+        """
+        Raised by the IPC simulator, and by clients which need IPC, when greengrass_ipc_python_sdk is not installed.
+        """
+        pass
+
+
+def new_ipc_client(endpoint):
+    """
+    Return a client of the core's IPC at endpoint.
+
+    :raises IPCException: if greengrass_ipc_python_sdk is not installed, i.e. when not running on a core.
+    """
+    if IPCClient is None:
+        raise IPCException('greengrass_ipc_python_sdk is not installed, IPC is only available on a Greengrass core '
+                           'or through an IPCSimulator')
+    return IPCClient(endpoint=endpoint)
@@ -0,0 +1,42 @@
+#
+# Copyright 2010-2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+try:
+    text_type = unicode
+except NameError:
+    # Python 3
+    text_type = str
+
+# Number of bytes or characters of a payload which are included in a log message
+PAYLOAD_LOG_LIMIT = 256
+
+
+class LoggedPayload(object):
+    """
+    Formats a payload in a log message only when the message is emitted, and cuts it to limit bytes or characters
+    so that large payloads do not end up in the logs.
+
+    Use it as an argument of %-style log messages, e.g.
+    ``customer_logger.debug('Publishing message with payload "%s"', LoggedPayload(payload))``
+    """
+    __slots__ = ['_payload', '_limit']
+
+    def __init__(self, payload, limit=PAYLOAD_LOG_LIMIT):
+        self._payload = payload
+        self._limit = limit
+
+    def __str__(self):
+        payload = self._payload
+        if isinstance(payload, text_type):
+            text = payload[:self._limit]
+            unit = 'characters'
+        elif isinstance(payload, (bytes, bytearray, memoryview)):
+            text = repr(bytes(payload[:self._limit]))
+            unit = 'bytes'
+        else:
+            # File-like objects are not read just to log them
+            return '<{} object>'.format(type(payload).__name__)
+        if len(payload) > self._limit:
+            text = '{}... ({} of {} {})'.format(text, self._limit, len(payload), unit)
+        return text
@@ -2,9 +2,37 @@
 # Copyright 2010-2016 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 #
 
+import base64
 import json
+import re
+import threading
+import time
+import uuid
 from functools import wraps
-from greengrass_common.env_vars import MY_FUNCTION_ARN
+from greengrasssdk.utils.core import (
+    MY_FUNCTION_ARN, ROUTER_FUNCTION_ARN, SECRETS_MANAGER_FUNCTION_ARN, SHADOW_FUNCTION_ARN, IPCException
+)
+from greengrasssdk.utils.workers import WorkerPool, completed_future
+
+# The simulator installed by IPCSimulator.install, which the clients created meanwhile call instead of IPC
+_active_simulator = None
+
+
+def _mock_invoke_output(invocation_type):
+    if invocation_type == 'RequestResponse':
+        return {
+            'Payload': json.dumps({
+                'TestKey': 'TestValue'
+            }),
+            'FunctionError': ''
+        }
+    elif invocation_type == 'Event':
+        return {
+            'Payload': b'',
+            'FunctionError': ''
+        }
+    else:
+        raise Exception('Unsupported invocation type {}'.format(invocation_type))
 
 
 def mock(func):
@@ -15,21 +43,399 @@ def mock(func):
     """
     @wraps(func)
     def mock_invoke_internal(self, function_arn, payload, client_context, invocation_type="RequestResponse"):
-        if MY_FUNCTION_ARN is None:
-            if invocation_type == 'RequestResponse':
-                return {
-                    'Payload': json.dumps({
-                        'TestKey': 'TestValue'
-                    }),
-                    'FunctionError': ''
-                }
-            elif invocation_type == 'Event':
-                return {
-                    'Payload': b'',
-                    'FunctionError': ''
-                }
-            else:
-                raise Exception('Unsupported invocation type {}'.format(invocation_type))
+        if MY_FUNCTION_ARN is None and _active_simulator is None:
+            return _mock_invoke_output(invocation_type)
         else:
             return func(self, function_arn, payload, client_context, invocation_type)
     return mock_invoke_internal
+
+
+def mock_async(func):
+    """
+    mock_async decorates _invoke_internal_async the same way mock decorates _invoke_internal,
+    the mock returns a completed future of the mock output
+    """
+    @wraps(func)
+    def mock_invoke_internal_async(self, function_arn, payload, client_context, invocation_type="RequestResponse"):
+        if MY_FUNCTION_ARN is None and _active_simulator is None:
+            return completed_future(_mock_invoke_output(invocation_type))
+        else:
+            return func(self, function_arn, payload, client_context, invocation_type)
+    return mock_invoke_internal_async
+
+
+def active_ipc_simulator():
+    """
+    Return the installed IPCSimulator, or None.
+    """
+    return _active_simulator
+
+
+class _WorkResult(object):
+    __slots__ = ['payload', 'func_err']
+
+    def __init__(self, payload, func_err=''):
+        self.payload = payload
+        self.func_err = func_err
+
+
+class _ClientContext(object):
+    def __init__(self, custom):
+        self.custom = custom
+        self.client = None
+        self.env = None
+
+
+class _LambdaContext(object):
+    """
+    The context given to the handlers of simulated functions, with the attributes of the Greengrass Lambda context.
+    """
+
+    def __init__(self, function_arn, invocation_id, client_context):
+        self.function_name = function_arn.split(':')[6] if function_arn.count(':') >= 6 else function_arn
+        self.invoked_function_arn = function_arn
+        self.aws_request_id = invocation_id
+        self.client_context = _ClientContext(client_context.get('custom', {}))
+        self.identity = None
+
+    def get_remaining_time_in_millis(self):
+        return None
+
+
+class _FunctionStatistics(object):
+    __slots__ = ['posted', 'completed', 'failed', 'dropped', 'rejected', 'outstanding', 'total_latency']
+
+    def __init__(self):
+        self.posted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.outstanding = 0
+        self.total_latency = 0.0
+
+    def as_dict(self):
+        return {
+            'Posted': self.posted,
+            'Completed': self.completed,
+            'Failed': self.failed,
+            'Dropped': self.dropped,
+            'Rejected': self.rejected,
+            'Outstanding': self.outstanding,
+            'AverageLatency': self.total_latency / self.completed if self.completed else 0.0,
+        }
+
+
+def _topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level != '+' and level != topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class IPCSimulator(object):
+    """
+    In-process stand-in for the Greengrass Core IPC, to run and load test functions which use the SDK without a core.
+
+    While the simulator is installed, the Lambda clients created by the SDK, including the ones of the iot-data and
+    secretsmanager clients, post their work to it instead of IPC:
+
+    * invocations of functions registered with :meth:`register_function` run their handler on a pool of threads,
+    * publishes are delivered to the handlers subscribed to matching topics with :meth:`subscribe`,
+    * the shadow service keeps shadow documents in memory and publishes the shadow events of their updates,
+    * the secrets manager returns the secrets added with :meth:`add_secret`.
+
+    Every call to a function waits for latency seconds, and a function accepts at most queue_size calls which have
+    not completed yet: further calls are dropped when their queueFullPolicy is ``BestEffort`` and rejected with an
+    :exc:`IPCException` otherwise. :meth:`get_statistics` reports what happened. ::
+
+        with IPCSimulator(latency=0.005) as simulator:
+            simulator.subscribe('telemetry/#', handler)
+            my_function.function_handler(event, context)
+            simulator.drain()
+            print(simulator.get_statistics())
+    """
+
+    def __init__(self, latency=0.0, queue_size=None, max_workers=16):
+        """
+        :param latency: Seconds every call takes before its handler runs, or a function returning them.
+        :type latency: float or callable
+
+        :param queue_size: Maximum number of calls of a function which have not completed, or None for no limit.
+        :type queue_size: int
+
+        :param max_workers: Number of threads running the handlers.
+        :type max_workers: int
+        """
+        self.latency = latency
+        self.queue_size = queue_size
+        self._pool = WorkerPool(max_workers, name='greengrasssdk-ipc-simulator')
+        self._lock = threading.Condition()
+        self._functions = {}
+        self._subscriptions = []
+        self._work = {}
+        self._shadows = {}
+        self._secrets = {}
+        self._statistics = {}
+        self._started_at = time.time()
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def install(self):
+        global _active_simulator
+        _active_simulator = self
+
+    def uninstall(self):
+        global _active_simulator
+        if _active_simulator is self:
+            _active_simulator = None
+
+    def register_function(self, function_arn, handler):
+        """
+        Make invocations of function_arn, qualified or not, call handler(event, context).
+        The event is the payload parsed from JSON, or the payload itself if it is not JSON.
+        """
+        self._functions[function_arn] = handler
+
+    def subscribe(self, topic_filter, handler):
+        """
+        Call handler(event, context) with the messages published to topics which match topic_filter.
+        The topic of a message is ``context.client_context.custom['subject']``.
+        """
+        self._subscriptions.append((topic_filter, handler))
+
+    def add_secret(self, secret_id, secret_string=None, secret_binary=None, version_stages=('AWSCURRENT',)):
+        self._secrets[secret_id] = {
+            'ARN': 'arn:aws:secretsmanager:us-east-1:123456789012:secret:{}'.format(secret_id),
+            'Name': secret_id,
+            'VersionId': str(uuid.uuid4()),
+            'SecretString': secret_string,
+            'SecretBinary': base64.b64encode(secret_binary).decode() if secret_binary is not None else None,
+            'VersionStages': list(version_stages),
+            'CreatedDate': int(time.time() * 1000),
+        }
+
+    def get_shadow(self, thing_name):
+        """
+        Return the shadow document of a thing, or None.
+        """
+        with self._lock:
+            document = self._shadows.get(thing_name)
+            return json.loads(json.dumps(document)) if document is not None else None
+
+    def post_work(self, function_arn, payload, client_context, invocation_type='RequestResponse'):
+        if hasattr(payload, 'read'):
+            payload = payload.read()
+        if not isinstance(payload, bytes):
+            payload = payload.encode()
+        client_context = json.loads(base64.b64decode(client_context).decode()) if client_context else {}
+        handler = self._get_handler(function_arn)
+
+        with self._lock:
+            statistics = self._get_statistics(function_arn)
+            statistics.posted += 1
+            if self.queue_size is not None and statistics.outstanding >= self.queue_size:
+                if client_context.get('custom', {}).get('queueFullPolicy') == 'BestEffort':
+                    statistics.dropped += 1
+                    return str(uuid.uuid4())
+                statistics.rejected += 1
+                raise IPCException('Queue of function {} is full'.format(function_arn))
+            statistics.outstanding += 1
+            invocation_id = str(uuid.uuid4())
+            posted_at = time.time()
+            future = self._pool.submit(self._run, function_arn, handler, payload, client_context, invocation_id,
+                                       posted_at)
+            if invocation_type != 'Event':
+                self._work[invocation_id] = future
+        return invocation_id
+
+    def get_work_result(self, function_arn, invocation_id):
+        with self._lock:
+            future = self._work.pop(invocation_id, None)
+        if future is None:
+            raise IPCException('Unknown invocation {} of function {}'.format(invocation_id, function_arn))
+        return future.result()
+
+    def drain(self, timeout=None):
+        """
+        Wait for all the calls to complete, including the deliveries of the messages they published.
+
+        :returns: (``bool``) -- Whether all the calls completed in time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while any(statistics.outstanding for statistics in self._statistics.values()):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def get_statistics(self):
+        """
+        :returns: (``dict``) --
+            * *Functions* (``dict``) -- The counters of every function ARN: Posted, Completed, Failed, Dropped,
+              Rejected, Outstanding and AverageLatency, in seconds from posting a call to its completion.
+            * *Completed* (``int``) -- Calls completed by all the functions.
+            * *Throughput* (``float``) -- Completed calls per second since the simulator was created or reset.
+        """
+        with self._lock:
+            functions = dict((function_arn, statistics.as_dict())
+                             for function_arn, statistics in self._statistics.items())
+            elapsed = time.time() - self._started_at
+        completed = sum(statistics['Completed'] for statistics in functions.values())
+        return {
+            'Functions': functions,
+            'Completed': completed,
+            'Throughput': completed / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def reset_statistics(self):
+        with self._lock:
+            for function_arn, statistics in list(self._statistics.items()):
+                outstanding = statistics.outstanding
+                self._statistics[function_arn] = _FunctionStatistics()
+                self._statistics[function_arn].outstanding = outstanding
+            self._started_at = time.time()
+
+    def _get_statistics(self, function_arn):
+        statistics = self._statistics.get(function_arn)
+        if statistics is None:
+            statistics = self._statistics[function_arn] = _FunctionStatistics()
+        return statistics
+
+    def _get_handler(self, function_arn):
+        if function_arn == ROUTER_FUNCTION_ARN:
+            return self._route
+        if function_arn == SHADOW_FUNCTION_ARN:
+            return self._shadow_service
+        if function_arn == SECRETS_MANAGER_FUNCTION_ARN:
+            return self._secrets_manager
+        handler = self._functions.get(function_arn)
+        if handler is None and function_arn.count(':') == 7:
+            handler = self._functions.get(function_arn.rsplit(':', 1)[0])
+        if handler is None:
+            raise IPCException('Function {} is not registered with the IPC simulator'.format(function_arn))
+        return self._call_handler(handler)
+
+    def _run(self, function_arn, handler, payload, client_context, invocation_id, posted_at):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        failed = True
+        try:
+            result = handler(function_arn, payload, client_context, invocation_id)
+            failed = bool(result.func_err)
+            return result
+        finally:
+            with self._lock:
+                statistics = self._get_statistics(function_arn)
+                statistics.outstanding -= 1
+                statistics.completed += 1
+                statistics.total_latency += time.time() - posted_at
+                if failed:
+                    statistics.failed += 1
+                self._lock.notify_all()
+
+    @staticmethod
+    def _call_handler(handler):
+        def call(function_arn, payload, client_context, invocation_id):
+            try:
+                event = json.loads(payload.decode('utf-8')) if payload else None
+            except ValueError:
+                event = payload
+            try:
+                result = handler(event, _LambdaContext(function_arn, invocation_id, client_context))
+            except Exception as e:
+                error = {'errorMessage': str(e), 'errorType': type(e).__name__}
+                return _WorkResult(json.dumps(error).encode(), 'Unhandled')
+            if result is None or isinstance(result, bytes):
+                return _WorkResult(result or b'')
+            return _WorkResult(json.dumps(result).encode())
+        return call
+
+    def _publish(self, topic, event):
+        payload = json.dumps(event).encode()
+        client_context = base64.b64encode(json.dumps({'custom': {'subject': topic}}).encode())
+        self.post_work(ROUTER_FUNCTION_ARN, payload, client_context, 'Event')
+
+    def _route(self, function_arn, payload, client_context, invocation_id):
+        topic = client_context.get('custom', {}).get('subject', '')
+        for topic_filter, handler in list(self._subscriptions):
+            if _topic_matches(topic_filter, topic):
+                self._call_handler(handler)(function_arn, payload, client_context, invocation_id)
+        return _WorkResult(b'')
+
+    def _shadow_service(self, function_arn, payload, client_context, invocation_id):
+        # IoTDataPlane imports this module through Lambda, so its shadow helpers can only be imported once it is loaded
+        from greengrasssdk.IoTDataPlane import _merge_patch, _shadow_delta
+
+        topic = client_context.get('custom', {}).get('subject', '')
+        match = re.match(r'^\$aws/things/([^/]+)/shadow/(get|update|delete)$', topic)
+        if match is None:
+            return self._shadow_error(400, 'Invalid shadow topic {}'.format(topic))
+        thing_name, operation = match.groups()
+        events = []
+        with self._lock:
+            document = self._shadows.get(thing_name)
+            if operation == 'get':
+                if document is None:
+                    return self._shadow_error(404, "No shadow exists with name: '{}'".format(thing_name))
+                response = json.loads(json.dumps(document))
+                delta = _shadow_delta(document['state'].get('desired', {}), document['state'].get('reported', {}))
+                if delta:
+                    response['state']['delta'] = delta
+            elif operation == 'delete':
+                if document is None:
+                    return self._shadow_error(404, "No shadow exists with name: '{}'".format(thing_name))
+                del self._shadows[thing_name]
+                response = {'version': document['version'], 'timestamp': int(time.time())}
+                events.append(('delete/accepted', response))
+            else:
+                try:
+                    update = json.loads(payload.decode('utf-8'))
+                except ValueError:
+                    return self._shadow_error(400, 'Payload contains invalid json')
+                if 'state' not in update:
+                    return self._shadow_error(400, 'Missing required node: state')
+                previous = document
+                version = previous['version'] if previous is not None else 0
+                if 'version' in update and update['version'] != version:
+                    return self._shadow_error(409, 'Version conflict')
+                state = _merge_patch(json.loads(json.dumps(previous['state'])) if previous else {}, update['state'])
+                timestamp = int(time.time())
+                document = self._shadows[thing_name] = {'state': state, 'version': version + 1, 'timestamp': timestamp}
+                response = {'state': update['state'], 'version': version + 1, 'timestamp': timestamp}
+                if 'clientToken' in update:
+                    response['clientToken'] = update['clientToken']
+                events.append(('update/accepted', response))
+                events.append(('update/documents', {'previous': previous, 'current': document, 'timestamp': timestamp}))
+                delta = _shadow_delta(state.get('desired', {}), state.get('reported', {}))
+                if delta and 'desired' in update['state']:
+                    events.append(('update/delta', {'state': delta, 'version': version + 1, 'timestamp': timestamp}))
+        for suffix, event in events:
+            self._publish('$aws/things/{}/shadow/{}'.format(thing_name, suffix), event)
+        return _WorkResult(json.dumps(response).encode())
+
+    @staticmethod
+    def _shadow_error(code, message):
+        return _WorkResult(json.dumps({'code': code, 'message': message}).encode())
+
+    def _secrets_manager(self, function_arn, payload, client_context, invocation_id):
+        request = json.loads(payload.decode('utf-8'))
+        secret = self._secrets.get(request.get('SecretId'))
+        version_stage = request.get('VersionStage', 'AWSCURRENT')
+        if secret is None or version_stage not in secret['VersionStages']:
+            response = {'Status': 404, 'Message': 'Secrets Manager can\'t find the specified secret.'}
+        else:
+            response = dict((key, value) for key, value in secret.items() if value is not None)
+        return _WorkResult(json.dumps(response).encode())
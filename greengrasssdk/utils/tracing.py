@@ -0,0 +1,188 @@
+#
+# Copyright 2010-2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+import logging
+import threading
+import time
+from functools import wraps
+
+from greengrasssdk.utils.workers import Future
+
+customer_logger = logging.getLogger(__name__)
+customer_logger.propagate = True
+
+# Span attributes set by the SDK
+ATTRIBUTE_TARGET = 'target'
+ATTRIBUTE_PAYLOAD_SIZE = 'payload_size'
+ATTRIBUTE_MESSAGE_COUNT = 'message_count'
+
+# The tracer given to set_tracer, None when tracing is disabled
+_tracer = None
+_local = threading.local()
+
+
+class Span(object):
+    """
+    A call to an SDK operation.
+
+    The attributes describe the call: the ``target`` function ARN, topic, thing name, secret id or stream name, the
+    ``payload_size`` in bytes and the ``message_count`` of batch operations, when they apply. request_ids holds the
+    ids of the requests made to Greengrass Core, i.e. the invocation ids of IPC work and the request ids of stream
+    manager requests, which also appear in the logs of the core.
+    """
+    __slots__ = ['operation', 'attributes', 'request_ids', 'start_time', 'end_time', 'error', 'context']
+
+    def __init__(self, operation, attributes):
+        self.operation = operation
+        self.attributes = attributes
+        self.request_ids = []
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+        # Free for the tracer to keep its own span in
+        self.context = None
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time if self.end_time is not None else None
+
+    @property
+    def outcome(self):
+        if self.end_time is None:
+            return None
+        return 'error' if self.error is not None else 'ok'
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_request_id(self, request_id):
+        self.request_ids.append(request_id)
+
+    def __repr__(self):
+        return '<Span {} {} {:.6f}s {} {}>'.format(
+            self.operation, self.outcome, self.duration or 0.0, self.attributes, self.request_ids
+        )
+
+
+class Tracer(object):
+    """
+    Receives the spans of the SDK operations once set with :func:`set_tracer`. Override its methods to forward
+    the spans to a tracing system, the base class does nothing.
+    """
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+def set_tracer(tracer):
+    """
+    Trace the SDK operations with tracer, or stop tracing them if tracer is None.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def current_span():
+    """
+    Return the span of the SDK operation running in this thread, or None.
+    """
+    return getattr(_local, 'span', None)
+
+
+def record_request_id(request_id):
+    """
+    Add request_id to the span of the SDK operation running in this thread, if it is traced.
+    """
+    span = getattr(_local, 'span', None)
+    if span is not None:
+        span.add_request_id(request_id)
+
+
+def payload_size(payload):
+    """
+    Return the size of a payload in bytes, or None if it is not known without reading it.
+    """
+    try:
+        return len(payload)
+    except TypeError:
+        return None
+
+
+def item_count(items):
+    """
+    Return the number of items of a batch operation, or None if it is not known without consuming them.
+    """
+    try:
+        return len(items)
+    except TypeError:
+        return None
+
+
+def traced(operation, attributes=None):
+    """
+    Decorate a client method so that every call to it is traced as a span of operation.
+
+    :param attributes: Function called with the arguments of the method, without self, which returns the attributes
+        of the span.
+    :type attributes: callable
+    """
+    def decorator(func):
+        @wraps(func)
+        def traced_method(self, *args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(self, *args, **kwargs)
+
+            span = Span(operation, _get_attributes(operation, attributes, args, kwargs))
+            _notify(tracer.on_start, span)
+            parent = getattr(_local, 'span', None)
+            _local.span = span
+            try:
+                result = func(self, *args, **kwargs)
+            except BaseException as e:
+                _end_span(tracer, span, e)
+                raise
+            finally:
+                _local.span = parent
+
+            if isinstance(result, Future):
+                # The operation continues in the background
+                result.add_done_callback(lambda future: _end_span(tracer, span, future.exception()))
+            else:
+                _end_span(tracer, span, None)
+            return result
+        return traced_method
+    return decorator
+
+
+def _get_attributes(operation, attributes, args, kwargs):
+    # The arguments are not validated yet, the method raises its own error if they are invalid
+    if attributes is None:
+        return {}
+    try:
+        return attributes(*args, **kwargs)
+    except Exception:
+        customer_logger.exception('Failed to get the span attributes of %s', operation)
+        return {}
+
+
+def _end_span(tracer, span, error):
+    span.end_time = time.time()
+    span.error = error
+    _notify(tracer.on_end, span)
+
+
+def _notify(method, span):
+    # A failing tracer must not fail the operation
+    try:
+        method(span)
+    except Exception:
+        customer_logger.exception('Tracer failed to handle span of %s', span.operation)
@@ -0,0 +1,182 @@
+#
+# Copyright 2010-2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+import logging
+import os
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    # Python 2.7
+    import Queue as queue
+
+customer_logger = logging.getLogger(__name__)
+customer_logger.propagate = True
+
+
+class FutureTimeoutError(Exception):
+    pass
+
+
+class Future(object):
+    """
+    Result of an operation which completes in the background.
+
+    This is a small subset of ``concurrent.futures.Future``, which is not available on Python 2.7.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the operation to complete and return its result, or raise its exception.
+
+        :param timeout: Seconds to wait for, or None to wait forever.
+        :type timeout: float
+
+        :raises: :exc:`FutureTimeoutError` if the operation did not complete in time.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            _reraise(self._exc_info)
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Wait for the operation to complete and return its exception, or None if it succeeded.
+
+        :param timeout: Seconds to wait for, or None to wait forever.
+        :type timeout: float
+
+        :raises: :exc:`FutureTimeoutError` if the operation did not complete in time.
+        """
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    def add_done_callback(self, fn):
+        """
+        Call fn with this future once it completes, right away if it already did.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        self._run_callback(fn)
+
+    def set_result(self, result):
+        self._result = result
+        self._complete()
+
+    def set_exception(self, exception):
+        self.set_exc_info((type(exception), exception, None))
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._complete()
+
+    def _wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise FutureTimeoutError('Operation did not complete within {} seconds'.format(timeout))
+
+    def _complete(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            self._run_callback(fn)
+
+    def _run_callback(self, fn):
+        try:
+            fn(self)
+        except Exception:
+            customer_logger.exception('Exception raised by future callback %r', fn)
+
+
+def completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def failed_future(exception):
+    future = Future()
+    future.set_exception(exception)
+    return future
+
+
+def _reraise(exc_info):
+    exc_value, traceback = exc_info[1], exc_info[2]
+    if hasattr(exc_value, 'with_traceback'):
+        raise exc_value.with_traceback(traceback)
+    # Python 2.7 has no way to attach the traceback of the worker thread
+    raise exc_value
+
+
+class WorkerPool(object):
+    """
+    Runs blocking calls on at most max_workers daemon threads, which are started as they are needed and
+    kept for the next calls.
+    """
+
+    def __init__(self, max_workers, name='greengrasssdk-worker'):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self._max_workers = max_workers
+        self._name = name
+        self._work = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle = 0
+        self._pid = os.getpid()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to run on a worker thread.
+
+        :returns: (``Future``) -- the result of the call.
+        """
+        future = Future()
+        with self._lock:
+            if self._pid != os.getpid():
+                # The worker threads were left behind in the parent process
+                self._work = queue.Queue()
+                self._workers = 0
+                self._idle = 0
+                self._pid = os.getpid()
+            start_worker = self._idle <= 0 and self._workers < self._max_workers
+            if start_worker:
+                self._workers += 1
+            else:
+                self._idle -= 1
+            self._work.put((future, fn, args, kwargs))
+        if start_worker:
+            thread = threading.Thread(target=self._run, name='{}-{}'.format(self._name, self._workers))
+            thread.daemon = True
+            thread.start()
+        return future
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._work.get()
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                future.set_exc_info(sys.exc_info())
+            else:
+                future.set_result(result)
+            # Drop the references to the finished call before waiting for the next one
+            del future, fn, args, kwargs, result
+            with self._lock:
+                self._idle += 1
@@ -0,0 +1,109 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import asyncio
+import threading
+import time
+
+import cbor2
+
+from greengrasssdk.stream_manager.data import Operation, ResponseStatusCode, VersionInfo
+
+
+class StreamManagerServer:
+    """
+    In-memory stand-in for the StreamManager server, listening on a local TCP port from a thread of its own.
+    It supports creating streams, appending to them and reading from them.
+
+    :param response_delay: Seconds every response waits for.
+    """
+
+    def __init__(self, response_delay: float = 0.0):
+        self.response_delay = response_delay
+        self.streams = {}
+        self.read_count = 0
+        self.port = None
+        self.__loop = asyncio.new_event_loop()
+        self.__ready = threading.Event()
+        threading.Thread(target=self.__run, daemon=True).start()
+        self.__ready.wait()
+
+    def __run(self):
+        server = self.__loop.run_until_complete(asyncio.start_server(self.__handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.__ready.set()
+        self.__loop.run_forever()
+
+    @staticmethod
+    async def __read_frame(reader):
+        length = int.from_bytes(await reader.readexactly(4), "big", signed=True)
+        operation = (await reader.readexactly(1))[0]
+        return operation, cbor2.loads(await reader.readexactly(length - 1))
+
+    @staticmethod
+    def __write_frame(writer, operation: Operation, response: dict):
+        if writer.is_closing():
+            # The client went away before the response
+            return
+        payload = cbor2.dumps(response)
+        writer.write((len(payload) + 1).to_bytes(4, "big", signed=True) + bytes([operation.value]) + payload)
+
+    async def __handle(self, reader, writer):
+        connect_version = await reader.readexactly(1)
+        _, request = await self.__read_frame(reader)
+        writer.write(connect_version)
+        self.__write_frame(
+            writer,
+            Operation.ConnectResponse,
+            {
+                "requestId": request["requestId"],
+                "status": ResponseStatusCode.Success.value,
+                "protocolVersion": VersionInfo.PROTOCOL_VERSION.value,
+                "serverVersion": VersionInfo.PROTOCOL_VERSION.value,
+                "clientIdentifier": "test",
+            },
+        )
+        try:
+            while True:
+                operation, request = await self.__read_frame(reader)
+                self.__loop.create_task(self.__respond(writer, operation, request))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def __respond(self, writer, operation: int, request: dict):
+        if self.response_delay:
+            await asyncio.sleep(self.response_delay)
+        response = {"requestId": request["requestId"], "status": ResponseStatusCode.Success.value}
+        if operation == Operation.CreateMessageStream.value:
+            self.streams[request["definition"]["name"]] = []
+            self.__write_frame(writer, Operation.CreateMessageStreamResponse, response)
+        elif operation == Operation.AppendMessage.value:
+            stream = self.streams[request["name"]]
+            stream.append((int(time.time() * 1000), bytes(request["payload"])))
+            response["sequenceNumber"] = len(stream) - 1
+            self.__write_frame(writer, Operation.AppendMessageResponse, response)
+        elif operation == Operation.ReadMessages.value:
+            self.read_count += 1
+            stream = self.streams[request["streamName"]]
+            options = request.get("readMessagesOptions") or {}
+            start = options.get("desiredStartSequenceNumber") or 0
+            min_count = options.get("minMessageCount") or 1
+            end = min(len(stream), start + (options.get("maxMessageCount") or min_count))
+            if end - start < min_count:
+                response["status"] = ResponseStatusCode.NotEnoughMessages.value
+                response["errorMessage"] = "Not enough messages"
+            else:
+                response["messages"] = [
+                    {
+                        "streamName": request["streamName"],
+                        "sequenceNumber": sequence_number,
+                        "ingestTime": stream[sequence_number][0],
+                        "payload": stream[sequence_number][1],
+                    }
+                    for sequence_number in range(start, end)
+                ]
+            self.__write_frame(writer, Operation.ReadMessagesResponse, response)
+        else:
+            self.__write_frame(writer, Operation.UnknownOperationError, response)
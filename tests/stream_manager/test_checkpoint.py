@@ -0,0 +1,54 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from greengrasssdk.stream_manager import (
+    MessageStreamDefinition,
+    StrategyOnFull,
+    StreamConsumer,
+    StreamManagerClient,
+)
+from greengrasssdk.stream_manager import checkpoint
+
+from .server import StreamManagerServer
+
+
+class StreamConsumerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StreamManagerServer()
+        self.client = StreamManagerClient(port=self.server.port)
+        self.addCleanup(self.client.close)
+        self.client.create_message_stream(
+            MessageStreamDefinition(name="stream", strategy_on_full=StrategyOnFull.OverwriteOldestData)
+        )
+
+    @mock.patch.object(checkpoint, "EMPTY_READ_BACKOFF", 0.2)
+    def test_follow_waits_after_empty_read_without_read_timeout(self):
+        consumer = StreamConsumer(self.client, "stream", "consumer", None, read_timeout_millis=0)
+        messages = []
+        thread = threading.Thread(target=lambda: messages.append(next(consumer.messages(follow=True))), daemon=True)
+        thread.start()
+        time.sleep(0.5)
+        self.client.append_message("stream", b"data")
+        thread.join(5)
+
+        self.assertEqual([bytes(message.payload) for message in messages], [b"data"])
+        # About one read per backoff rather than as many as the server answers
+        self.assertLessEqual(self.server.read_count, 5)
+
+    def test_no_follow_returns_after_empty_read(self):
+        consumer = StreamConsumer(self.client, "stream", "consumer", None, read_timeout_millis=0)
+        start = time.monotonic()
+        self.assertEqual(list(consumer.messages(follow=False)), [])
+        self.assertLess(time.monotonic() - start, checkpoint.EMPTY_READ_BACKOFF)
+        self.assertEqual(self.server.read_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import unittest
+
+import cbor2
+
+from greengrasssdk.stream_manager.data import Operation, ResponseStatusCode
+from greengrasssdk.stream_manager.responsedecoder import ResponseDecoder
+
+
+def _decode_messages(*messages):
+    payload = cbor2.dumps(
+        {
+            "requestId": "request",
+            "status": ResponseStatusCode.Success.value,
+            "messages": [dict(message, streamName="stream", payload=b"data") for message in messages],
+        }
+    )
+    return ResponseDecoder.decode(Operation.ReadMessagesResponse, payload).messages
+
+
+class ReadMessagesResponseTest(unittest.TestCase):
+    def test_messages(self):
+        batch = _decode_messages({"sequenceNumber": 1, "ingestTime": 1000}, {"sequenceNumber": 2})
+        self.assertEqual(list(batch.sequence_numbers), [1, 2])
+        self.assertEqual([message.ingest_time for message in batch], [1000, None])
+        self.assertEqual([bytes(payload) for payload in batch.payloads()], [b"data", b"data"])
+        self.assertEqual(batch.stream_name, "stream")
+
+    def test_null_sequence_number(self):
+        batch = _decode_messages({"sequenceNumber": None, "ingestTime": 1000}, {"sequenceNumber": 3})
+        self.assertEqual(list(batch.sequence_numbers), [0, 3])
+        self.assertEqual(batch[1].ingest_time, None)
+
+    def test_ingest_time_out_of_int64_range(self):
+        batch = _decode_messages({"sequenceNumber": 1, "ingestTime": 2 ** 64 - 1}, {"sequenceNumber": 2})
+        self.assertEqual(list(batch.sequence_numbers), [1, 2])
+        self.assertEqual(batch[0].ingest_time, 2 ** 64 - 1)
+
+    def test_sequence_number_out_of_int64_range(self):
+        batch = _decode_messages({"sequenceNumber": 2 ** 63, "ingestTime": 1000}, {"sequenceNumber": -(2 ** 64)})
+        self.assertEqual(list(batch.sequence_numbers), [2 ** 63, -(2 ** 64)])
+        self.assertEqual(batch[0].ingest_time, 1000)
+        self.assertEqual(bytes(batch[1].payload), b"data")
+
+
+if __name__ == "__main__":
+    unittest.main()
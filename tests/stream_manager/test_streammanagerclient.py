@@ -0,0 +1,108 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: Apache-2.0
+"""
+
+import os
+import signal
+import threading
+import time
+import unittest
+
+from greengrasssdk.stream_manager import (
+    MessageStreamDefinition,
+    StrategyOnFull,
+    StreamManagerClient,
+    StreamManagerException,
+)
+
+from .server import StreamManagerServer
+
+
+class StreamManagerClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StreamManagerServer()
+        self.client = StreamManagerClient(port=self.server.port)
+        self.addCleanup(self.client.close)
+        self.client.create_message_stream(
+            MessageStreamDefinition(name="stream", strategy_on_full=StrategyOnFull.OverwriteOldestData)
+        )
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_close_in_forked_child_closes_the_inherited_client(self):
+        pid = os.fork()
+        if pid == 0:
+            # A request which hangs kills the child rather than the test run
+            signal.alarm(10)
+            status = 1
+            try:
+                self.client.close()
+                try:
+                    self.client.append_message("stream", b"data")
+                except StreamManagerException as e:
+                    status = 0 if self.client.closed and "closed" in str(e) else 1
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        # The parent's connection is left alone
+        self.assertEqual(self.client.append_message("stream", b"data"), 0)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_for_process_replaces_a_client_closed_in_forked_child(self):
+        pid = os.fork()
+        if pid == 0:
+            # A request which hangs kills the child rather than the test run
+            signal.alarm(10)
+            status = 1
+            try:
+                client = StreamManagerClient.for_process(port=self.server.port)
+                client.close()
+                replacement = StreamManagerClient.for_process(port=self.server.port)
+                if replacement is not client and replacement.append_message("stream", b"data") >= 0:
+                    status = 0
+                replacement.close()
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+
+class CloseTest(unittest.TestCase):
+    def test_close_fails_concurrent_requests(self):
+        server = StreamManagerServer(response_delay=0.05)
+        # Large appends and no write buffer make close wait for the connection to drain while requests are submitted
+        client = StreamManagerClient(
+            port=server.port, request_timeout=30, write_buffer_high_water=1, write_buffer_low_water=0
+        )
+        client.create_message_stream(
+            MessageStreamDefinition(name="stream", strategy_on_full=StrategyOnFull.OverwriteOldestData)
+        )
+        errors = []
+        started = threading.Barrier(9)
+
+        def append():
+            started.wait()
+            try:
+                while True:
+                    client.append_message("stream", bytes(1 << 20))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=append, daemon=True) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        time.sleep(0.2)
+        start = time.monotonic()
+        client.close()
+        for thread in threads:
+            thread.join(10)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(len(errors), len(threads))
+        for error in errors:
+            self.assertIsInstance(error, StreamManagerException)
+
+
+if __name__ == "__main__":
+    unittest.main()
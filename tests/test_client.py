@@ -0,0 +1,67 @@
+#
+# Copyright 2010-2016 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import greengrasssdk
+
+# greengrasssdk.client is the function which creates clients, the module is only found by its name
+client_module = sys.modules['greengrasssdk.client']
+
+
+class SharedClientTest(unittest.TestCase):
+    def setUp(self):
+        self.created = threading.Event()
+        self.proceed = threading.Event()
+        self.addCleanup(self.proceed.set)
+        self.addCleanup(greengrasssdk.close_shared_clients)
+        patcher = mock.patch.object(client_module, '_create_client', side_effect=self.create_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_client(self, client_type, *args, **kwargs):
+        if client_type == 'streammanager':
+            # Stands in for a slow connect to StreamManager
+            self.created.set()
+            self.proceed.wait(10)
+        return mock.Mock(closed=False)
+
+    def start_shared_client(self, client_type, results):
+        thread = threading.Thread(target=lambda: results.append(greengrasssdk.client(client_type, shared=True)))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_slow_creation_does_not_block_other_clients(self):
+        results = []
+        creating = self.start_shared_client('streammanager', results)
+        self.assertTrue(self.created.wait(5))
+
+        looking_up = self.start_shared_client('lambda', results)
+        looking_up.join(5)
+        self.assertFalse(looking_up.is_alive())
+        self.assertEqual(len(results), 1)
+        self.assertTrue(creating.is_alive())
+
+        self.proceed.set()
+        creating.join(5)
+        self.assertEqual(len(results), 2)
+
+    def test_concurrent_creations_share_one_client(self):
+        results = []
+        threads = [self.start_shared_client('streammanager', results) for _ in range(4)]
+        self.assertTrue(self.created.wait(5))
+        self.proceed.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(client_module._create_client.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
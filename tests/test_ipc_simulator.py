@@ -0,0 +1,58 @@
+#
+# Copyright 2010-2016 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter in which the packages of the Greengrass Core can not be imported, even if installed
+WITHOUT_CORE = '''
+import json
+import sys
+
+for name in ('greengrass_common', 'greengrass_ipc_python_sdk'):
+    sys.modules[name] = None
+
+import greengrasssdk
+from greengrasssdk.utils.testing import IPCSimulator
+
+with IPCSimulator() as simulator:
+    received = []
+    simulator.subscribe('telemetry/#', lambda event, context: received.append(event))
+    simulator.register_function('arn:aws:lambda:us-east-1:123456789012:function:echo', lambda event, context: event)
+    simulator.add_secret('db', secret_string='secret')
+
+    greengrasssdk.client('iot-data').publish(topic='telemetry/t1', payload=json.dumps({'i': 1}))
+    greengrasssdk.client('iot-data').update_thing_shadow(thingName='thing', payload=b'{"state": {"desired": {"on": 1}}}')
+    response = greengrasssdk.client('lambda').invoke(
+        FunctionName='arn:aws:lambda:us-east-1:123456789012:function:echo:1', Payload=b'{"a": 1}'
+    )
+    secret = greengrasssdk.client('secretsmanager').get_secret_value(SecretId='db')
+    simulator.drain(5)
+
+print(json.dumps({
+    'received': received,
+    'invoked': json.loads(response['Payload'].read().decode()),
+    'shadow': simulator.get_shadow('thing')['state'],
+    'secret': secret['SecretString'],
+}))
+'''
+
+
+class IPCSimulatorWithoutCoreTest(unittest.TestCase):
+    def test_simulator_runs_without_the_core_packages(self):
+        environment = dict(os.environ, PYTHONPATH=ROOT)
+        environment.pop('MY_FUNCTION_ARN', None)
+        output = subprocess.check_output([sys.executable, '-c', WITHOUT_CORE], env=environment, cwd=ROOT)
+        self.assertEqual(
+            output.decode().strip().splitlines()[-1],
+            '{"received": [{"i": 1}], "invoked": {"a": 1}, "shadow": {"desired": {"on": 1}}, "secret": "secret"}'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()